@@ -3,33 +3,120 @@
 FastAPI server to expose Substack functionality as HTTP API endpoints
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 import uvicorn
-import os
+import time
+import logging
 from dotenv import load_dotenv
 
 # Import our existing functions
-from draft_create import create_markup_draft, create_comprehensive_test_draft, parse_markup_to_json
-from draft_publish import get_unpublished_drafts, publish_draft
+from draft_create import create_draft, update_draft, create_comprehensive_test_draft, BUILTIN_BLOCK_TYPES
+from content_schema import InvalidDocument
+from parse_pool import pool as parse_pool
+from draft_index import DuplicateDraft, POLICIES as DEDUPE_POLICIES
+from post_templates import put_template, get_template, render_drafts
+from block_registry import registry as block_types
+from draft_publish import iter_unpublished_drafts, publish_draft
+from listing import ListingError
+from draft_preview import content_preview
 from change_env import load_env_values, save_env_values
-from multi_account import load_account_env, save_account_env, set_active_account_env, list_all_accounts
+from multi_account import load_account_env, save_account_env, get_account, list_all_accounts
+from log_config import setup_logging, SERVER_FORMAT
+import metrics
+import tracing
+from profiling import ProfilingMiddleware, controller as profile_controller, SAMPLING
 
 load_dotenv()
 
+# Log records are only queued on the event loop - a listener thread does the actual output
+setup_logging(text_format=SERVER_FORMAT, background=True)
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Substack API Client",
     description="API for creating and publishing Substack drafts with rich formatting",
     version="1.0.0"
 )
 
+if metrics.ENABLED:
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        started = time.perf_counter()
+        response = await call_next(request)
+        # Label by route template (/drafts/{draft_id}/publish), not by the concrete path
+        route = request.scope.get("route")
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                        route.path if route else "unmatched",
+                                        request.method, str(response.status_code))
+        return response
+
+# Profiles requests armed via /admin/profile (or sent with X-Profile + X-Profile-Token)
+app.add_middleware(ProfilingMiddleware)
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    if not tracing.enabled():
+        return await call_next(request)
+    with tracing.span(f"{request.method} {request.url.path}", tracing.SERVER,
+                      **{"http.request.method": request.method, "url.path": request.url.path}) as current:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route:
+            current.name = f"{request.method} {route.path}"
+            current.set_attribute("http.route", route.path)
+        current.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            current.set_error(f"HTTP {response.status_code}")
+        return response
+
 # Pydantic models for request/response
 class MarkupDraftRequest(BaseModel):
     user_id: str
     title: str
     markup_content: str
     subtitle: Optional[str] = ""
+    dedupe: Optional[str] = None  # "return", "reject" or "off" (default: DEDUPE_POLICY)
+
+class MarkdownDraftRequest(BaseModel):
+    user_id: str
+    title: str
+    markdown_content: str
+    subtitle: Optional[str] = ""
+    dedupe: Optional[str] = None
+
+class TemplateRequest(BaseModel):
+    title: str  # may contain {{slots}} like the markup
+    markup_content: str
+    subtitle: Optional[str] = ""
+
+class TemplateInfo(BaseModel):
+    template_id: str
+    slots: List[str]
+    blocks: int
+
+class RenderDraftsRequest(BaseModel):
+    user_id: str
+    variants: List[Dict[str, str]]  # slot values, one draft per entry
+
+class DraftUpdateRequest(BaseModel):
+    user_id: str
+    title: Optional[str] = None  # None keeps the current value
+    subtitle: Optional[str] = None
+    markup_content: Optional[str] = None  # new content as markup or Markdown (not both)
+    markdown_content: Optional[str] = None
+    refresh: bool = False  # compare against the draft on Substack instead of the last known state
+
+class DraftUpdateResponse(BaseModel):
+    success: bool
+    draft_id: int
+    changed: bool
+    updated_fields: List[str]
+    summary: Dict[str, Any]
+    message: str
 
 class PublishRequest(BaseModel):
     user_id: str
@@ -44,6 +131,7 @@ class DraftResponse(BaseModel):
     subtitle: Optional[str] = None
     url: Optional[str] = None
     message: str
+    duplicate: bool = False  # an existing draft with the same title and content was returned
 
 class PublishResponse(BaseModel):
     success: bool
@@ -77,6 +165,12 @@ class AccountInfo(BaseModel):
     publication_url: str
     env_file: str
 
+class ProfileRequest(BaseModel):
+    requests: int = 1  # Number of upcoming requests to profile
+    user_id: Optional[str] = None  # Only profile requests of this account
+    mode: str = SAMPLING  # "sampling" (folded stacks for flamegraphs) or "cprofile" (.prof)
+    interval_ms: float = 5.0  # Sampling interval
+
 @app.get("/")
 async def root():
     """API root endpoint with basic info"""
@@ -86,10 +180,17 @@ async def root():
         "endpoints": {
             "GET /accounts": "List all available accounts",
             "POST /drafts/create-markup": "Create draft from markup syntax (requires user_id)",
+            "POST /drafts/create-markdown": "Create draft from Markdown (requires user_id)",
             "POST /drafts/create-test": "Create comprehensive test draft (requires user_id)",
+            "PUT /templates/{template_id}": "Compile a markup template with {{slot}} placeholders",
+            "POST /templates/{template_id}/render-drafts": "Create one draft per set of slot values (requires user_id)",
             "GET /drafts": "List unpublished drafts (requires user_id parameter)",
+            "PUT /drafts/{draft_id}": "Update a draft, sent only if title/subtitle/content changed (requires user_id)",
             "POST /drafts/{draft_id}/publish": "Publish a draft (requires user_id in body)",
             "PUT /environment": "Update environment credentials",
+            "GET /metrics": "Prometheus metrics (request, phase and upstream timings)",
+            "POST /admin/profile": "Profile the next N requests (optionally of one user_id)",
+            "GET /admin/profile": "Profiling status and written profiles",
             "POST /webhook/update-environment": "Update any environment variables (requires user_id)",
             "GET /docs": "Interactive API documentation"
         }
@@ -104,35 +205,110 @@ async def list_accounts_api():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list accounts: {str(e)}")
 
+def _dedupe_policy(value):
+    if value is not None and value not in DEDUPE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"dedupe must be one of: {', '.join(DEDUPE_POLICIES)}")
+    return value
+
+def _created_message(draft, blocks, user_id):
+    if draft.get('duplicate'):
+        return f"Draft {draft['id']} with the same title and content already exists for user {user_id}"
+    return f"Draft created successfully with {blocks} content blocks for user {user_id}"
+
 @app.post("/drafts/create-markup", response_model=DraftResponse)
 async def create_markup_draft_api(request: MarkupDraftRequest):
     """Create a draft using markup syntax for specific account"""
     try:
-        # Load account environment
+        # Load account (session is cached per account)
         try:
-            set_active_account_env(request.user_id)
+            with metrics.timed("/drafts/create-markup", "account_lookup", request.user_id):
+                account = get_account(request.user_id)
         except ValueError as e:
             raise HTTPException(status_code=404, detail=str(e))
         
-        # Parse markup to validate it
+        # Parse and validate the markup (large documents in a worker process, off the event loop)
+        phase = "parse_process" if parse_pool.offloaded(request.markup_content) else "parse"
         try:
-            content_json = parse_markup_to_json(request.markup_content)
-            print(f"Parsed {len(content_json['content'])} content blocks for user {request.user_id}")
-        except Exception as e:
+            with metrics.timed("/drafts/create-markup", phase, request.user_id):
+                document, blocks, errors = await parse_pool.compile(request.markup_content, 'markup')
+            logger.debug("Parsed %d content blocks for user %s", blocks, request.user_id)
+        except ValueError as e:
+            # Only parser errors are the client's fault; pool failures (BrokenProcessPool, ...) are a 500
             raise HTTPException(status_code=400, detail=f"Invalid markup syntax: {str(e)}")
         
-        # Create draft
-        draft = create_markup_draft(request.title, request.markup_content, request.subtitle)
+        # Reject documents Substack would refuse before any request is made
+        if errors:
+            raise HTTPException(status_code=400, detail=f"Invalid document: {str(InvalidDocument(errors))}")
+        
+        # Create draft from the already parsed (and validated) document
+        try:
+            # Upstream requests and payload encoding run in the threadpool, not on the event loop
+            with metrics.timed("/drafts/create-markup", "create_draft", request.user_id):
+                draft = await run_in_threadpool(create_draft, request.title, request.subtitle, content_json=document,
+                                                account=account, validate=False,
+                                                dedupe=_dedupe_policy(request.dedupe))
+        except DuplicateDraft as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        
+        if draft:
+            pub_url = account.pub_url
+            return DraftResponse(
+                success=True,
+                draft_id=draft['id'],
+                title=draft.get('draft_title'),
+                subtitle=draft.get('draft_subtitle'),
+                url=f"{pub_url}/publish/post/{draft['id']}?back=%2Fpublish%2Fposts%2Fdrafts",
+                message=_created_message(draft, blocks, request.user_id),
+                duplicate=draft.get('duplicate', False)
+            )
+        else:
+            raise HTTPException(status_code=500, detail="Draft creation failed")
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+@app.post("/drafts/create-markdown", response_model=DraftResponse)
+async def create_markdown_draft_api(request: MarkdownDraftRequest):
+    """Create a draft from Markdown for specific account"""
+    try:
+        try:
+            with metrics.timed("/drafts/create-markdown", "account_lookup", request.user_id):
+                account = get_account(request.user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        
+        # Markdown compiles to the same document model as the markup syntax
+        phase = "parse_process" if parse_pool.offloaded(request.markdown_content) else "parse"
+        try:
+            with metrics.timed("/drafts/create-markdown", phase, request.user_id):
+                document, blocks, errors = await parse_pool.compile(request.markdown_content, 'markdown')
+            logger.debug("Parsed %d content blocks for user %s", blocks, request.user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid Markdown: {str(e)}")
+        
+        if errors:
+            raise HTTPException(status_code=400, detail=f"Invalid document: {str(InvalidDocument(errors))}")
+        
+        try:
+            with metrics.timed("/drafts/create-markdown", "create_draft", request.user_id):
+                draft = await run_in_threadpool(create_draft, request.title, request.subtitle, content_json=document,
+                                                account=account, validate=False,
+                                                dedupe=_dedupe_policy(request.dedupe))
+        except DuplicateDraft as e:
+            raise HTTPException(status_code=409, detail=str(e))
         
         if draft:
-            pub_url = os.getenv("PUBLICATION_URL")
+            pub_url = account.pub_url
             return DraftResponse(
                 success=True,
                 draft_id=draft['id'],
                 title=draft.get('draft_title'),
                 subtitle=draft.get('draft_subtitle'),
                 url=f"{pub_url}/publish/post/{draft['id']}?back=%2Fpublish%2Fposts%2Fdrafts",
-                message=f"Draft created successfully with {len(content_json['content'])} content blocks for user {request.user_id}"
+                message=_created_message(draft, blocks, request.user_id),
+                duplicate=draft.get('duplicate', False)
             )
         else:
             raise HTTPException(status_code=500, detail="Draft creation failed")
@@ -142,20 +318,69 @@ async def create_markup_draft_api(request: MarkupDraftRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
+@app.put("/templates/{template_id}", response_model=TemplateInfo)
+async def put_template_api(template_id: str, request: TemplateRequest):
+    """Compile markup with {{slot}} placeholders once; drafts are then rendered by filling the slots"""
+    try:
+        template = put_template(template_id, request.markup_content, request.title, request.subtitle)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template: {str(e)}")
+    return TemplateInfo(template_id=template_id, slots=sorted(template.slots), blocks=template.blocks)
+
+@app.post("/templates/{template_id}/render-drafts", response_model=List[DraftResponse])
+def render_template_drafts_api(template_id: str, request: RenderDraftsRequest):
+    """
+    Create a draft for every set of slot values, all from the compiled template
+    A plain def: FastAPI runs it in its threadpool, so the sequential creates don't block the event loop
+    """
+    template = get_template(template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail=f"Template '{template_id}' not found")
+    try:
+        try:
+            with metrics.timed("/templates/render-drafts", "account_lookup", request.user_id):
+                account = get_account(request.user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        
+        try:
+            with metrics.timed("/templates/render-drafts", "create_drafts", request.user_id):
+                drafts = render_drafts(template, request.variants, account=account)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        pub_url = account.pub_url
+        return [
+            DraftResponse(
+                success=True,
+                draft_id=draft['id'],
+                title=draft.get('draft_title'),
+                subtitle=draft.get('draft_subtitle'),
+                url=f"{pub_url}/publish/post/{draft['id']}?back=%2Fpublish%2Fposts%2Fdrafts",
+                message=f"Draft {index + 1} of {len(drafts)} created from template '{template_id}'",
+                duplicate=draft.get('duplicate', False)
+            ) if draft else DraftResponse(success=False, message=f"Draft {index + 1} of {len(drafts)} failed")
+            for index, draft in enumerate(drafts)
+        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
 @app.post("/drafts/create-test", response_model=DraftResponse)
 async def create_test_draft_api(user_id: str):
     """Create a comprehensive test draft with all content types for specific account"""
     try:
-        # Load account environment
+        # Load account (session is cached per account)
         try:
-            set_active_account_env(user_id)
+            account = get_account(user_id)
         except ValueError as e:
             raise HTTPException(status_code=404, detail=str(e))
         
-        draft = create_comprehensive_test_draft()
+        draft = create_comprehensive_test_draft(account=account)
         
         if draft:
-            pub_url = os.getenv("PUBLICATION_URL")
+            pub_url = account.pub_url
             return DraftResponse(
                 success=True,
                 draft_id=draft['id'],
@@ -176,50 +401,82 @@ async def create_test_draft_api(user_id: str):
 async def list_drafts_api(user_id: str):
     """List all unpublished drafts for specific account"""
     try:
-        # Load account environment
+        # Load account (session is cached per account)
         try:
-            set_active_account_env(user_id)
+            with metrics.timed("/drafts", "account_lookup", user_id):
+                account = get_account(user_id)
         except ValueError as e:
             raise HTTPException(status_code=404, detail=str(e))
         
-        drafts = get_unpublished_drafts()
-        
-        if drafts is None:
-            raise HTTPException(status_code=500, detail="Failed to fetch drafts")
+        # Drafts are parsed one at a time - each draft_body is dropped once its preview is taken
+        drafts = iter_unpublished_drafts(
+            fields=('id', 'draft_title', 'draft_subtitle', 'draft_body', 'draft_updated_at'),
+            account=account
+        )
         
         draft_list = []
         for draft in drafts:
-            # Get content preview
-            content_preview = "No content"
-            if 'draft_body' in draft and draft['draft_body']:
-                try:
-                    import json
-                    body = json.loads(draft['draft_body'])
-                    content_blocks = body.get('content', [])
-                    if content_blocks:
-                        first_text = ""
-                        for block in content_blocks:
-                            if block.get('type') == 'paragraph' and block.get('content'):
-                                for item in block['content']:
-                                    if item.get('type') == 'text' and item.get('text'):
-                                        first_text = item['text'][:100]
-                                        break
-                                if first_text:
-                                    break
-                        content_preview = first_text or f"{len(content_blocks)} content blocks"
-                except:
-                    content_preview = "Content available"
+            # Preview is scanned from the raw draft_body (memoized per draft revision)
+            preview = content_preview(draft)
             
             draft_list.append(DraftInfo(
                 id=draft['id'],
                 title=draft.get('draft_title', 'Untitled'),
                 subtitle=draft.get('draft_subtitle'),
-                content_preview=content_preview,
+                content_preview=preview,
                 updated_at=draft.get('draft_updated_at')
             ))
         
         return draft_list
         
+    except ListingError:
+        raise HTTPException(status_code=500, detail="Failed to fetch drafts")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+@app.put("/drafts/{draft_id}", response_model=DraftUpdateResponse)
+async def update_draft_api(draft_id: int, request: DraftUpdateRequest):
+    """Update a draft; unchanged content is detected by hash and not sent to Substack"""
+    if request.markup_content is not None and request.markdown_content is not None:
+        raise HTTPException(status_code=400, detail="Send markup_content or markdown_content, not both")
+    try:
+        try:
+            with metrics.timed("/drafts/{draft_id}", "account_lookup", request.user_id):
+                account = get_account(request.user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        
+        document = None
+        text, syntax = (request.markdown_content, 'markdown') if request.markdown_content is not None \
+            else (request.markup_content, 'markup')
+        if text is not None:
+            phase = "parse_process" if parse_pool.offloaded(text) else "parse"
+            try:
+                with metrics.timed("/drafts/{draft_id}", phase, request.user_id):
+                    document, blocks, errors = await parse_pool.compile(text, syntax)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid {syntax}: {str(e)}")
+            if errors:
+                raise HTTPException(status_code=400, detail=f"Invalid document: {str(InvalidDocument(errors))}")
+        
+        with metrics.timed("/drafts/{draft_id}", "update_draft", request.user_id):
+            result = await run_in_threadpool(update_draft, draft_id, request.title, request.subtitle,
+                                             content_json=document, account=account, validate=False,
+                                             refresh=request.refresh)
+        
+        if not result.get('success'):
+            status = result.get('error_code', 500)
+            raise HTTPException(status_code=status if status in (400, 404) else 500, detail=result['message'])
+        return DraftUpdateResponse(
+            success=True,
+            draft_id=draft_id,
+            changed=result['changed'],
+            updated_fields=result['updated_fields'],
+            summary=result['summary'],
+            message=result['message']
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -229,16 +486,18 @@ async def list_drafts_api(user_id: str):
 async def publish_draft_api(draft_id: int, request: PublishRequest):
     """Publish a specific draft for specific account"""
     try:
-        # Load account environment
+        # Load account (session is cached per account)
         try:
-            set_active_account_env(request.user_id)
+            with metrics.timed("/drafts/{draft_id}/publish", "account_lookup", request.user_id):
+                account = get_account(request.user_id)
         except ValueError as e:
             raise HTTPException(status_code=404, detail=str(e))
         
         result = publish_draft(
             draft_id=draft_id,
             send_email=request.send_email,
-            audience=request.audience
+            audience=request.audience,
+            account=account
         )
         
         if result and result.get('success'):
@@ -293,6 +552,33 @@ async def update_environment_api(request: EnvironmentUpdate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update environment: {str(e)}")
 
+@app.get("/metrics")
+async def metrics_api():
+    """Prometheus metrics: request, phase and upstream timing histograms, connection and retry counters"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.post("/admin/profile")
+async def arm_profiling_api(request: ProfileRequest):
+    """
+    Profile the next N requests (or the next N of one user_id) and write the profiles to PROFILE_DIR.
+    Should be protected by Cloudflare Access rules like the webhook endpoint.
+    """
+    try:
+        return profile_controller.arm(request.requests, request.user_id, request.mode,
+                                      request.interval_ms / 1000)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/admin/profile")
+async def profiling_status_api():
+    """Profiling status and the most recent profiles"""
+    return profile_controller.status()
+
+@app.delete("/admin/profile")
+async def disarm_profiling_api():
+    """Stop profiling upcoming requests"""
+    return profile_controller.disarm()
+
 @app.get("/markup-syntax")
 async def get_markup_syntax():
     """Get markup syntax guide"""
@@ -324,6 +610,10 @@ async def get_markup_syntax():
             "`code`": "Inline code",
             "[text](url)": "Link"
         },
+        "custom_types": {
+            f"{keyword.capitalize()}::": handler.description
+            for keyword, handler in sorted(block_types.handlers.items()) if keyword not in BUILTIN_BLOCK_TYPES
+        },
         "example": "Title:: My Post | Text:: Welcome with **bold** text and a [link](https://example.com) | Quote:: This is important | Subscribe:: Join Now"
     }
 
@@ -388,8 +678,8 @@ async def update_environment_webhook(request: CookieUpdate):
         raise HTTPException(status_code=500, detail=f"Failed to update environment for user {request.user_id}: {str(e)}")
 
 if __name__ == "__main__":
-    print("Starting Substack API Server...")
-    print("API documentation available at: http://localhost:8000/docs")
-    print("API root: http://localhost:8000")
+    logger.info("Starting Substack API Server...")
+    logger.info("API documentation available at: http://localhost:8000/docs")
+    logger.info("API root: http://localhost:8000")
     
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
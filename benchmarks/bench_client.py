@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Client library benchmark: draft_create/draft_publish called directly (no API server)
+Points an Account at a local fake Substack (fake_substack.py) and times create_markup_draft,
+get_unpublished_drafts and publish_draft, plus the local serialization of a create
+(parse -> draft_body -> POST body bytes) without any network. Reports latency
+percentiles per operation as JSON
+
+    python benchmarks/bench_client.py --iterations 50 --output client.json
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import bench_utils
+from bench_utils import summarize, result_header, write_result
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from draft_create import parse_markup, create_draft
+from draft_payload import encode_draft_payload
+from draft_publish import get_unpublished_drafts, publish_draft
+from fake_substack import start_fake_substack
+from substack_session import Account, build_session
+
+OPERATIONS = ('serialize', 'create', 'list', 'publish')
+DEFAULT_ITERATIONS = 50
+WARMUP = 3
+
+MARKUP_FILE = os.path.join(bench_utils.REPO_ROOT, "sampleinput", "2.txt")
+
+
+def serialize(markup, reference_draft):
+    """Everything a create does locally before the POST; returns the encoded body size"""
+    draft_body = parse_markup(markup).dumps()
+    return len(encode_draft_payload(reference_draft, "Benchmark draft", "", draft_body))
+
+
+def fake_account(fake_server, user_id="client"):
+    env_vars = {
+        'USER_ID': user_id,
+        'PUBLICATION_URL': fake_server.publication_url(user_id),
+        'SID': 'bench_sid',
+        'SUBSTACK_SID': 'bench_substack_sid',
+        'SUBSTACK_LLI': 'bench_lli'
+    }
+    return Account(user_id, env_vars['PUBLICATION_URL'], build_session(env_vars))
+
+
+def time_operation(func, iterations):
+    """Latencies of iterations sequential calls; a falsy result counts as an error"""
+    latencies = []
+    errors = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        ok = func()
+        elapsed = time.perf_counter() - started
+        if ok:
+            latencies.append(elapsed)
+        else:
+            errors += 1
+    return latencies, errors
+
+
+def run_benchmark(iterations=DEFAULT_ITERATIONS, latency="none", seed=1):
+    """Start the fake upstream, time every operation and return the result dict"""
+    with open(MARKUP_FILE, encoding='utf-8') as f:
+        markup = " ".join(f.read().split())
+
+    fake_server = start_fake_substack(latency=latency, seed=seed)
+    try:
+        account = fake_account(fake_server)
+        publication = fake_server.fake.publication(account.user_id)
+        reference_draft = next(iter(publication.items.values()))
+
+        def create():
+            # create_markup_draft with dedupe off: every iteration sends the same draft and must reach the fake
+            return create_draft("Benchmark draft", content_json=parse_markup(markup), account=account,
+                                dedupe="off") is not None
+
+        def publish():
+            with fake_server.fake.lock:
+                draft = publication.new_draft({'draft_title': 'Benchmark publish'})
+            return publish_draft(draft['id'], send_email=False, account=account)['success']
+
+        calls = {
+            'serialize': lambda: serialize(markup, reference_draft),
+            'create': create,
+            'list': lambda: get_unpublished_drafts(account=account) is not None,
+            'publish': publish
+        }
+
+        result = result_header('client', {'iterations': iterations, 'upstream_latency': latency, 'seed': seed,
+                                          'markup_chars': len(markup)})
+        result['operations'] = {}
+        for op in OPERATIONS:
+            time_operation(calls[op], WARMUP)
+            upstream_before = fake_server.fake.stats['requests']
+            latencies, errors = time_operation(calls[op], iterations)
+            result['operations'][op] = {
+                'count': iterations,
+                'errors': errors,
+                'upstream_calls': round((fake_server.fake.stats['requests'] - upstream_before) / iterations, 3),
+                **summarize(latencies)
+            }
+            print(f"  {op:<10} p50 {result['operations'][op]['p50_ms']} ms  "
+                  f"p99 {result['operations'][op]['p99_ms']} ms  errors {errors}", file=sys.stderr)
+        return result
+    finally:
+        fake_server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the client library against a local fake Substack")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Timed calls per operation")
+    parser.add_argument("--latency", default="none", help="Upstream latency distribution (see fake_substack.py)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON result to this file instead of stdout")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.iterations, args.latency, args.seed)
+    write_result(result, args.output)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Benchmark history and regression gate
+Runs the parser, memory, client and server suites, stores every run in a local history
+(SQLite, or JSON lines if the path ends in .jsonl) together with a machine fingerprint and
+the git revision, and compares each gated metric against a rolling baseline: the last
+--window passing runs of the same suite on the same machine. A metric regresses when it
+is worse than the baseline mean by more than max(--sigma standard deviations,
+--min-change of the mean). Prints a pass/fail report and exits 1 on any regression
+
+    python benchmarks/bench_gate.py                          # all suites, quick configs
+    python benchmarks/bench_gate.py --suites parser,client   # subset
+    python benchmarks/bench_gate.py --accept                 # store as baseline even if slower
+    python benchmarks/bench_gate.py --report                 # compare only, store nothing
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+import bench_utils
+
+DEFAULT_HISTORY = os.path.join(bench_utils.REPO_ROOT, "benchmarks", "history.sqlite")
+SUITES = ('parser', 'memory', 'client', 'server')
+DEFAULT_WINDOW = 5       # Passing runs the baseline is built from
+MIN_SAMPLES = 3          # Fewer baseline runs -> the metric is reported but not gated
+DEFAULT_SIGMA = 3.0
+DEFAULT_MIN_CHANGE = 0.10
+
+# Smaller than the suites' own defaults so a gate run takes about a minute
+GATE_CONFIGS = {
+    'parser': {'sizes': (50, 200, 800), 'repeat': 5},
+    'memory': {'sizes': (250, 1000)},
+    'client': {'iterations': 30},
+    'server': {'concurrency_levels': [1, 8], 'requests_per_level': 100, 'accounts': 2,
+               'mix': {'create': 3, 'list': 5, 'publish': 2}, 'latency': 'fixed:5'}
+}
+
+# Parser curves that are gated; the unbalanced inputs are pathological on purpose
+GATED_CURVES = ('blocks', 'blocks_plain', 'blocks_dense_marks', 'text_block_length', 'cta_blocks_encoded',
+                'markdown_blocks')
+
+
+def run_suite(suite):
+    """Run one suite with its gate config; returns the suite's result dict"""
+    config = GATE_CONFIGS[suite]
+    if suite == 'parser':
+        import bench_parser
+        return bench_parser.run_benchmark(config['sizes'], config['repeat'])
+    if suite == 'memory':
+        import bench_memory
+        return bench_memory.run_benchmark(config['sizes'])
+    if suite == 'client':
+        import bench_client
+        return bench_client.run_benchmark(config['iterations'])
+    import bench_server
+    return bench_server.run_benchmark(**config)
+
+
+def extract_metrics(result):
+    """Gated metrics of a suite result: {name: (value, higher_is_better)}"""
+    metrics = {}
+    suite = result['suite']
+    if suite == 'parser':
+        for name in GATED_CURVES:
+            for point in result['curves'].get(name, {}).get('points', []):
+                metrics[f"{name}@{point['size']}.seconds"] = (point['seconds'], False)
+                metrics[f"{name}@{point['size']}.peak_kib"] = (point['peak_kib'], False)
+    elif suite == 'memory':
+        from bench_memory import iter_peaks
+        for label, peak in iter_peaks(result):
+            metrics[f"{label}.peak_kib"] = (peak, False)
+    elif suite == 'client':
+        for op, stats in result['operations'].items():
+            metrics[f"{op}.p50_ms"] = (stats['p50_ms'], False)
+            metrics[f"{op}.p95_ms"] = (stats['p95_ms'], False)
+            metrics[f"{op}.errors"] = (stats['errors'], False)
+    elif suite == 'server':
+        for level in result['levels']:
+            prefix = f"c{level['concurrency']}"
+            metrics[f"{prefix}.throughput_rps"] = (level['throughput_rps'], True)
+            metrics[f"{prefix}.p50_ms"] = (level['latency']['p50_ms'], False)
+            metrics[f"{prefix}.p99_ms"] = (level['latency']['p99_ms'], False)
+            metrics[f"{prefix}.errors"] = (level['errors'], False)
+    return {name: value for name, value in metrics.items() if value[0] is not None}
+
+
+def machine_fingerprint():
+    """What makes timings comparable: CPU, core count, OS, Python; 'id' is a short hash of it"""
+    cpu = platform.processor()
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), cpu)
+    except OSError:
+        pass
+    info = {
+        'cpu': cpu or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'python': f"{platform.python_implementation()} {platform.python_version()}"
+    }
+    info['id'] = hashlib.sha1(json.dumps(info, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return info
+
+
+def git_revision():
+    """(commit, dirty) of the repository, or (None, None) outside a git checkout"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=bench_utils.REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                cwd=bench_utils.REPO_ROOT, capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class History:
+    """Stored benchmark runs; SQLite by default, one JSON object per line for *.jsonl paths"""
+
+    def __init__(self, path=DEFAULT_HISTORY):
+        self.path = path
+        self.jsonl = path.endswith('.jsonl')
+        if not self.jsonl:
+            with sqlite3.connect(self.path) as db:
+                db.execute("""CREATE TABLE IF NOT EXISTS runs (
+                                  id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                  suite TEXT NOT NULL,
+                                  created_at TEXT NOT NULL,
+                                  git_commit TEXT,
+                                  git_dirty INTEGER,
+                                  fingerprint TEXT NOT NULL,
+                                  machine TEXT NOT NULL,
+                                  passed INTEGER NOT NULL,
+                                  metrics TEXT NOT NULL,
+                                  result TEXT NOT NULL)""")
+                db.execute("CREATE INDEX IF NOT EXISTS runs_suite ON runs (suite, fingerprint, passed, id)")
+
+    def add(self, run):
+        if self.jsonl:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(run, separators=(',', ':')) + '\n')
+            return
+        with sqlite3.connect(self.path) as db:
+            db.execute("INSERT INTO runs (suite, created_at, git_commit, git_dirty, fingerprint, machine, passed, "
+                       "metrics, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (run['suite'], run['created_at'], run['git_commit'], run['git_dirty'],
+                        run['machine']['id'], json.dumps(run['machine']), int(run['passed']),
+                        json.dumps(run['metrics']), json.dumps(run['result'])))
+
+    def baseline_runs(self, suite, fingerprint, window=DEFAULT_WINDOW):
+        """The last `window` passing runs of suite on this machine, oldest first"""
+        if self.jsonl:
+            if not os.path.exists(self.path):
+                return []
+            with open(self.path, encoding='utf-8') as f:
+                runs = [run for run in map(json.loads, filter(str.strip, f))
+                        if run['suite'] == suite and run['machine']['id'] == fingerprint and run['passed']]
+            return runs[-window:] if window else []
+
+        with sqlite3.connect(self.path) as db:
+            rows = db.execute("SELECT created_at, git_commit, metrics FROM runs "
+                              "WHERE suite = ? AND fingerprint = ? AND passed = 1 ORDER BY id DESC LIMIT ?",
+                              (suite, fingerprint, window)).fetchall()
+        return [{'created_at': created_at, 'git_commit': commit, 'metrics': json.loads(metrics)}
+                for created_at, commit, metrics in reversed(rows)]
+
+
+def compare(metrics, baseline_runs, sigma=DEFAULT_SIGMA, min_change=DEFAULT_MIN_CHANGE):
+    """One verdict per metric: ok, regressed, improved, or new (too little history to gate)"""
+    verdicts = []
+    for name, (value, higher_is_better) in sorted(metrics.items()):
+        samples = [run['metrics'][name][0] for run in baseline_runs if name in run['metrics']]
+        verdict = {'metric': name, 'value': value, 'samples': len(samples), 'higher_is_better': higher_is_better}
+        if len(samples) < MIN_SAMPLES:
+            verdicts.append(dict(verdict, status='new'))
+            continue
+
+        mean = statistics.fmean(samples)
+        stdev = statistics.stdev(samples)
+        # Noise allowance: sigma standard deviations, but never less than min_change of the mean
+        allowance = max(sigma * stdev, min_change * abs(mean))
+        change = value - mean if not higher_is_better else mean - value  # > 0 means worse
+        if change > allowance:
+            status = 'regressed'
+        elif -change > allowance:
+            status = 'improved'
+        else:
+            status = 'ok'
+        verdicts.append(dict(verdict, status=status, mean=round(mean, 6), stdev=round(stdev, 6),
+                             threshold=round(mean - allowance if higher_is_better else mean + allowance, 6),
+                             change_pct=round((value - mean) / mean * 100, 1) if mean else None))
+    return verdicts
+
+
+def print_report(suite, verdicts, verbose=False):
+    regressed = [v for v in verdicts if v['status'] == 'regressed']
+    counts = {status: sum(1 for v in verdicts if v['status'] == status)
+              for status in ('ok', 'improved', 'regressed', 'new')}
+    print(f"\n[{'FAIL' if regressed else 'PASS'}] {suite}: " +
+          ", ".join(f"{count} {status}" for status, count in counts.items() if count))
+    for v in verdicts:
+        if not verbose and v['status'] in ('ok', 'new'):
+            continue
+        if v['status'] == 'new':
+            print(f"  {'new':<9} {v['metric']:<44} {v['value']} ({v['samples']} baseline runs)")
+        else:
+            print(f"  {v['status']:<9} {v['metric']:<44} {v['value']} vs mean {v['mean']} "
+                  f"(limit {v['threshold']}, {v['change_pct']:+}%)")
+
+
+def run_gate(suites, history, window=DEFAULT_WINDOW, sigma=DEFAULT_SIGMA, min_change=DEFAULT_MIN_CHANGE,
+             store=True, accept=False, verbose=False):
+    """Run, compare, store and report every suite; returns True when nothing regressed"""
+    machine = machine_fingerprint()
+    commit, dirty = git_revision()
+    print(f"machine {machine['id']} ({machine['cpu']}, {machine['cpu_count']} cpus, {machine['python']})  "
+          f"revision {commit[:12] if commit else 'unknown'}{' (dirty)' if dirty else ''}")
+
+    passed_all = True
+    for suite in suites:
+        print(f"\nRunning {suite} suite...", file=sys.stderr)
+        result = run_suite(suite)
+        metrics = extract_metrics(result)
+        verdicts = compare(metrics, history.baseline_runs(suite, machine['id'], window), sigma, min_change)
+        passed = not any(v['status'] == 'regressed' for v in verdicts)
+        passed_all = passed_all and passed
+        print_report(suite, verdicts, verbose)
+
+        if store:
+            history.add({
+                'suite': suite,
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'git_commit': commit,
+                'git_dirty': dirty,
+                'machine': machine,
+                # Failing runs are kept for the record but stay out of the baseline unless accepted
+                'passed': passed or accept,
+                'metrics': metrics,
+                'result': result
+            })
+
+    print(f"\n{'PASS' if passed_all else 'FAIL'}: {len(suites)} suite(s) against the last {window} passing runs")
+    return passed_all
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmark suites and gate on regressions")
+    parser.add_argument("--suites", default=",".join(SUITES), help="Comma separated: " + ", ".join(SUITES))
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="SQLite file, or a .jsonl path for JSON lines")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="Passing runs in the rolling baseline")
+    parser.add_argument("--sigma", type=float, default=DEFAULT_SIGMA, help="Allowed standard deviations")
+    parser.add_argument("--min-change", type=float, default=DEFAULT_MIN_CHANGE,
+                        help="Minimum relative change treated as a regression")
+    parser.add_argument("--accept", action="store_true", help="Add this run to the baseline even if it regressed")
+    parser.add_argument("--report", action="store_true", help="Compare only, do not store the run")
+    parser.add_argument("--verbose", action="store_true", help="List every metric, not only changes")
+    args = parser.parse_args()
+
+    suites = [s.strip() for s in args.suites.split(',') if s.strip()]
+    unknown = [s for s in suites if s not in SUITES]
+    if unknown:
+        parser.error(f"Unknown suite(s): {', '.join(unknown)}")
+
+    ok = run_gate(suites, History(args.history), args.window, args.sigma, args.min_change,
+                  store=not args.report, accept=args.accept, verbose=args.verbose)
+    sys.exit(0 if ok else 1)
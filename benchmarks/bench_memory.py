@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+tracemalloc harness for large-document draft creation and listing
+Runs the create_draft payload pipeline phase by phase on synthetic documents:
+parse (parse_markup) -> encode (Doc.dumps) -> payload (encode_draft_payload, the POST
+body bytes), keeping each phase's output alive like the real flow does. Listing compares decoding a large drafts
+listing at once with the streamed, projected path of GET /drafts.
+Reports peak and retained memory plus the top allocating source lines per phase
+
+    python benchmarks/bench_memory.py --output memory.json
+    python benchmarks/bench_memory.py --baseline memory.json   # exit 1 if a phase peak grew
+"""
+
+import argparse
+import gc
+import json
+import random
+import sys
+import tracemalloc
+
+import bench_utils  # noqa: F401 - puts the repository root on sys.path
+from bench_utils import result_header, write_result
+from bench_parser import MarkupGenerator
+
+from draft_create import parse_markup
+from draft_payload import encode_draft_payload
+from draft_preview import content_preview, clear_cache
+from fake_substack import Publication, DEFAULT_CONFIG
+from listing import iter_json_array, CHUNK_SIZE
+
+DEFAULT_SIZES = (500, 2000, 8000)
+QUICK_SIZES = (250, 1000)
+LISTING_DRAFTS = 200
+LISTING_BODY_BLOCKS = 200
+HOTSPOTS = 5
+DEFAULT_TOLERANCE = 0.10  # Allowed relative growth of a phase peak against the baseline
+
+# Project code is what we want to see in the hotspot lists
+_IGNORED_FILES = ('tracemalloc', 'bench_memory.py', '<frozen')
+
+
+def _publication(drafts, body_blocks, seed):
+    config = dict(DEFAULT_CONFIG, posts=0, drafts=drafts, body_blocks=body_blocks)
+    return Publication("bench", 1, config, random.Random(seed))
+
+
+def _hotspots(before, after):
+    stats = [stat for stat in after.compare_to(before, 'lineno')
+             if stat.size_diff >= 512
+             and not any(name in stat.traceback[0].filename for name in _IGNORED_FILES)]
+    return [{
+        'where': f"{stat.traceback[0].filename.rsplit('/', 1)[-1]}:{stat.traceback[0].lineno}",
+        'kib': round(stat.size_diff / 1024, 1),
+        'blocks': stat.count_diff
+    } for stat in stats[:HOTSPOTS]]
+
+
+def run_phase(func, *args):
+    """Run one phase under tracemalloc; returns (result, {peak_kib, retained_kib, hotspots})"""
+    gc.collect()
+    before_snapshot = tracemalloc.take_snapshot()
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+
+    result = func(*args)
+
+    current, peak = tracemalloc.get_traced_memory()
+    after_snapshot = tracemalloc.take_snapshot()
+    return result, {
+        'peak_kib': round((peak - before) / 1024, 1),
+        'retained_kib': round((current - before) / 1024, 1),
+        'hotspots': _hotspots(before_snapshot, after_snapshot)
+    }
+
+
+def create_phases(markup, reference_draft):
+    phases = {}
+    document, phases['parse'] = run_phase(parse_markup, markup)
+    draft_body, phases['encode'] = run_phase(document.dumps)
+    body, phases['payload'] = run_phase(encode_draft_payload, reference_draft, "Memory benchmark", "", draft_body)
+    return phases, len(draft_body), len(body)
+
+
+def listing_full(text):
+    """Old path: decode the whole listing, then build the previews"""
+    drafts = json.loads(text)
+    return [{'id': d['id'], 'title': d.get('draft_title'), 'preview': content_preview(d)}
+            for d in drafts if not d.get('is_published')]
+
+
+def listing_stream(text):
+    """GET /drafts path: stream the listing, keep the fields we need, drop each body after its preview"""
+    chunks = (text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE))
+    fields = ('id', 'draft_title', 'draft_subtitle', 'draft_body', 'draft_updated_at', 'is_published')
+    result = []
+    for draft in iter_json_array(chunks):
+        if draft.get('is_published'):
+            continue
+        draft = {key: draft[key] for key in fields if key in draft}
+        result.append({'id': draft['id'], 'title': draft.get('draft_title'), 'preview': content_preview(draft)})
+    return result
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, listing_drafts=LISTING_DRAFTS, seed=1):
+    """Run the create phases for each size and the listing comparison; returns the result dict"""
+    reference_draft = next(iter(_publication(1, 12, seed).items.values()))
+    listing_text = json.dumps(list(_publication(listing_drafts, LISTING_BODY_BLOCKS, seed).items.values()))
+
+    result = result_header('memory', {'sizes': list(sizes), 'listing_drafts': listing_drafts,
+                                      'listing_body_blocks': LISTING_BODY_BLOCKS, 'seed': seed})
+    result['create'] = []
+
+    tracemalloc.start(1)
+    try:
+        for size in sizes:
+            markup = MarkupGenerator(seed).document(size)
+            phases, body_chars, post_bytes = create_phases(markup, reference_draft)
+            result['create'].append({'blocks': size, 'markup_chars': len(markup), 'draft_body_chars': body_chars,
+                                     'post_body_bytes': post_bytes, 'phases': phases})
+            print(f"  create blocks={size:<6} " + "  ".join(
+                f"{name} {phase['peak_kib']:.0f} KiB" for name, phase in phases.items()), file=sys.stderr)
+            del phases
+            gc.collect()
+
+        result['listing'] = {'listing_chars': len(listing_text), 'phases': {}}
+        for name, func in (('listing_full', listing_full), ('listing_stream', listing_stream)):
+            # Both paths start without memoized previews
+            clear_cache()
+            _, result['listing']['phases'][name] = run_phase(func, listing_text)
+            print(f"  {name:<14} peak {result['listing']['phases'][name]['peak_kib']:.0f} KiB", file=sys.stderr)
+    finally:
+        tracemalloc.stop()
+
+    return result
+
+
+def iter_peaks(result):
+    """(label, peak_kib) for every measured phase of a memory result"""
+    for run in result.get('create', []):
+        for name, phase in run['phases'].items():
+            yield f"create[blocks={run['blocks']}].{name}", phase['peak_kib']
+    for name, phase in result.get('listing', {}).get('phases', {}).items():
+        yield f"listing.{name}", phase['peak_kib']
+
+
+def compare(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Phases whose peak grew more than tolerance over the baseline, as (label, baseline_kib, kib)"""
+    baseline_peaks = dict(iter_peaks(baseline))
+    regressions = []
+    for label, peak in iter_peaks(result):
+        old = baseline_peaks.get(label)
+        if old is not None and peak > old * (1 + tolerance) and peak - old > 1:
+            regressions.append((label, old, peak))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak memory per phase for large draft create/list flows")
+    parser.add_argument("--sizes", help="Comma separated block counts")
+    parser.add_argument("--quick", action="store_true", help="Smaller documents for a fast check")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON result to this file instead of stdout")
+    parser.add_argument("--baseline", help="Earlier result to compare against (exit 1 on regression)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.sizes:
+        sizes = tuple(int(s) for s in args.sizes.split(','))
+    else:
+        sizes = QUICK_SIZES if args.quick else DEFAULT_SIZES
+
+    # Load the baseline first - the output may overwrite the same file
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    result = run_benchmark(sizes, seed=args.seed)
+    write_result(result, args.output)
+
+    if baseline is not None:
+        regressions = compare(result, baseline, args.tolerance)
+        for label, old, new in regressions:
+            print(f"MEMORY REGRESSION {label}: {old:.1f} KiB -> {new:.1f} KiB", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("Memory within baseline", file=sys.stderr)
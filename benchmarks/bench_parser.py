@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark and scaling report for parse_markup / parse_inline
+Generates synthetic markup (every block type of the Title:: ... Break:: dispatch, with
+adjustable inline mark and link density) and pathological inputs (unbalanced *, `, ~~, [),
+measures time and peak memory per size and fits the scaling exponent of each curve.
+Curves growing faster than linear are flagged. The same documents written in Markdown are
+parsed by parse_markdown for comparison with the pipe syntax, and draft bodies are rendered back
+to markup and Markdown (draft_render)
+
+    python benchmarks/bench_parser.py --output parser.json
+    python benchmarks/bench_parser.py --quick
+"""
+
+import argparse
+import gc
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import bench_utils  # noqa: F401 - puts the repository root on sys.path
+from bench_utils import result_header, write_result
+
+from draft_create import parse_markup
+from markdown_parser import parse_markdown
+from draft_render import render
+from block_registry import registry as block_types
+
+SAMPLE_FILE = os.path.join(bench_utils.REPO_ROOT, "sampleinput", "2.txt")
+
+BLOCK_TYPES = ('title', 'subtitle', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'text', 'quote', 'pullquote',
+               'list', 'numberlist', 'code', 'rule', 'button', 'subscribe', 'share', 'comment',
+               'subscribewidget', 'sharewidget', 'latex', 'footnote', 'break')
+# Call-to-action blocks rendered from pre-encoded fragments
+CTA_TYPES = ('subscribe', 'share', 'comment', 'subscribewidget', 'sharewidget')
+# Block types with a Markdown equivalent that compiles to the same nodes
+MARKDOWN_TYPES = ('title', 'subtitle', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'text', 'quote', 'list',
+                  'numberlist', 'rule', 'latex') + ('text',) * 6
+
+# Exponent of time ~ size^k above which a curve is reported as superlinear
+SUPERLINEAR_EXPONENT = 1.3
+
+DEFAULT_SIZES = (25, 50, 100, 200, 400, 800, 1600)
+QUICK_SIZES = (25, 50, 100, 200, 400)
+DEFAULT_REPEAT = 5
+MAX_SECONDS = 2.0  # Stop growing a curve once one parse takes longer than this
+
+
+def load_vocabulary():
+    """Plain words from the sample markup (markers and block prefixes stripped)"""
+    with open(SAMPLE_FILE, encoding='utf-8') as f:
+        text = f.read()
+    words = []
+    for word in text.split():
+        word = word.strip('*|•[]()`~:.,')
+        if word.isalpha() and not word.endswith('::'):
+            words.append(word.lower())
+    return words or ['gold', 'market', 'value']
+
+
+class MarkupGenerator:
+    """Synthetic markup documents with a controllable share of formatted words and links"""
+
+    def __init__(self, seed=1, mark_density=0.1, link_density=0.05, words_per_block=30):
+        self.rng = random.Random(seed)
+        self.vocabulary = load_vocabulary()
+        self.mark_density = mark_density
+        self.link_density = link_density
+        self.words_per_block = words_per_block
+
+    def words(self, count):
+        return " ".join(self.rng.choice(self.vocabulary) for _ in range(count))
+
+    def inline_text(self, count=None):
+        """Text with **bold**, *italic*, ~~strike~~, `code` and [links](url) at the configured density"""
+        parts = []
+        for _ in range(count or self.words_per_block):
+            word = self.rng.choice(self.vocabulary)
+            roll = self.rng.random()
+            if roll < self.link_density:
+                word = f"[{word} {self.rng.choice(self.vocabulary)}](https://example.com/{word})"
+            elif roll < self.link_density + self.mark_density:
+                word = self.rng.choice(("**{}**", "*{}*", "~~{}~~", "`{}`")).format(word)
+            parts.append(word)
+        return " ".join(parts)
+
+    def block(self, block_type):
+        short = self.words(6).capitalize()
+        if block_type == 'text':
+            return f"Text:: {self.inline_text()}"
+        if block_type == 'list':
+            return "List:: " + " ".join(f"• {self.inline_text(6)}" for _ in range(4))
+        if block_type == 'numberlist':
+            return "NumberList:: " + " ".join(f"1. {self.inline_text(6)}" for _ in range(4))
+        if block_type == 'code':
+            # The code body follows the next | and is parsed as its own block (as in the real parser)
+            return f"Code:: python | print('{short}')"
+        if block_type == 'rule':
+            return "Rule:: ---"
+        if block_type == 'button':
+            return f"Button:: {short} -> https://example.com/{self.rng.choice(self.vocabulary)}"
+        if block_type in ('subscribewidget', 'sharewidget'):
+            name = 'SubscribeWidget' if block_type == 'subscribewidget' else 'ShareWidget'
+            return f"{name}:: {short} >> {self.words(15)}"
+        if block_type == 'latex':
+            return "LaTeX:: E = mc^2 + \\sum_{i=1}^{n} x_i"
+        if block_type == 'footnote':
+            return f"Footnote:: [{self.rng.randint(1, 9)}] {self.words(12)}"
+        if block_type == 'break':
+            return "Break:: -"
+        if block_type in ('quote', 'pullquote'):
+            name = 'Quote' if block_type == 'quote' else 'PullQuote'
+            return f"{name}:: {self.words(20)}"
+        name = block_type.capitalize() if block_type in ('title', 'subtitle') else block_type.upper()
+        name = {'subscribe': 'Subscribe', 'share': 'Share', 'comment': 'Comment'}.get(block_type, name)
+        return f"{name}:: {short}"
+
+    def markdown_block(self, block_type):
+        """block(block_type) written in Markdown - same random draws, so the same text"""
+        short = self.words(6).capitalize()
+        if block_type == 'text':
+            return self.inline_text()
+        if block_type == 'list':
+            return "\n".join(f"- {self.inline_text(6)}" for _ in range(4))
+        if block_type == 'numberlist':
+            return "\n".join(f"1. {self.inline_text(6)}" for _ in range(4))
+        if block_type == 'rule':
+            return "---"
+        if block_type == 'latex':
+            return "$$ E = mc^2 + \\sum_{i=1}^{n} x_i $$"
+        if block_type == 'quote':
+            return f"> {self.words(20)}"
+        level = {'title': 1, 'subtitle': 2}.get(block_type) or int(block_type[1])
+        return f"{'#' * level} {short}"
+
+    def markdown_document(self, blocks, types=MARKDOWN_TYPES):
+        """Markdown with the blocks document(blocks, types) has"""
+        return "\n\n".join(self.markdown_block(types[i % len(types)]) for i in range(blocks))
+
+    def document(self, blocks, types=None):
+        """Markup with `blocks` blocks cycling through types (default: every type, text weighted up like real posts)"""
+        types = types or BLOCK_TYPES + ('text',) * 6
+        return " | ".join(self.block(types[i % len(types)]) for i in range(blocks))
+
+
+def unbalanced_markup(marker, size):
+    """One Text:: block of `size` words where every word opens `marker` and none is closed"""
+    return "Text:: " + " ".join(f"{marker}word" for _ in range(size))
+
+
+def measure(func, arg, repeat=DEFAULT_REPEAT):
+    """Best-of-repeat wall time and peak traced memory (separate run) of func(arg)"""
+    best = math.inf
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    func(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def scaling_exponent(points):
+    """Least-squares slope of log(seconds) over log(size)"""
+    xs = [math.log(p['size']) for p in points if p['seconds'] > 0]
+    ys = [math.log(p['seconds']) for p in points if p['seconds'] > 0]
+    if len(xs) < 2:
+        return None
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def parse_and_encode(markup):
+    return parse_markup(markup).dumps()
+
+
+def render_markup(draft_body):
+    return render(draft_body, 'markup')
+
+
+def render_markdown(draft_body):
+    return render(draft_body, 'markdown')
+
+
+def run_curve(name, unit, make_input, sizes, repeat=DEFAULT_REPEAT, max_seconds=MAX_SECONDS, func=parse_markup):
+    """Measure func (parse_markup by default) over sizes and fit the scaling exponent"""
+    points = []
+    for size in sizes:
+        markup = make_input(size)
+        seconds, peak = measure(func, markup, repeat)
+        points.append({
+            'size': size,
+            'chars': len(markup),
+            'seconds': round(seconds, 6),
+            'us_per_unit': round(seconds / size * 1e6, 3),
+            'peak_kib': round(peak / 1024, 1)
+        })
+        print(f"  {name:<22} {unit}={size:<6} {seconds * 1000:>10.3f} ms  {peak / 1024:>10.1f} KiB",
+              file=sys.stderr)
+        if seconds > max_seconds:
+            break
+
+    exponent = scaling_exponent(points)
+    return {
+        'unit': unit,
+        'points': points,
+        'exponent': round(exponent, 3) if exponent is not None else None,
+        'superlinear': exponent is not None and exponent > SUPERLINEAR_EXPONENT
+    }
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, seed=1, max_seconds=MAX_SECONDS):
+    """Run every scaling curve and return the result dict"""
+    def doc(mark_density, link_density, words_per_block=30, types=None):
+        def make(blocks):
+            return MarkupGenerator(seed, mark_density, link_density, words_per_block).document(blocks, types)
+        return make
+
+    def markdown_doc(mark_density, link_density):
+        def make(blocks):
+            return MarkupGenerator(seed, mark_density, link_density).markdown_document(blocks)
+        return make
+
+    def draft_body(blocks):
+        return parse_markup(doc(0.1, 0.05)(blocks)).dumps()
+
+    def long_text(words):
+        return "Text:: " + MarkupGenerator(seed, 0.1, 0.05).inline_text(words)
+
+    word_sizes = [size * 10 for size in sizes]
+    # name -> (unit, input generator, sizes[, function measured instead of parse_markup])
+    curves = {
+        'blocks': ('blocks', doc(0.1, 0.05), sizes),
+        'blocks_plain': ('blocks', doc(0.0, 0.0), sizes),
+        'blocks_dense_marks': ('blocks', doc(0.5, 0.2), sizes),
+        'text_block_length': ('words', long_text, word_sizes),
+        'unbalanced_star': ('words', lambda n: unbalanced_markup('*', n), word_sizes),
+        'unbalanced_backtick': ('words', lambda n: unbalanced_markup('`', n), word_sizes),
+        'unbalanced_tilde': ('words', lambda n: unbalanced_markup('~~', n), word_sizes),
+        'unbalanced_bracket': ('words', lambda n: unbalanced_markup('[', n), word_sizes),
+        'cta_blocks_encoded': ('blocks', doc(0.0, 0.0, types=CTA_TYPES), sizes, parse_and_encode),
+        # The same documents in both syntaxes
+        'markup_equivalent': ('blocks', doc(0.1, 0.05, types=MARKDOWN_TYPES), sizes),
+        'markdown_blocks': ('blocks', markdown_doc(0.1, 0.05), sizes, parse_markdown),
+        # draft_body JSON back to text
+        'render_markup': ('blocks', draft_body, sizes, render_markup),
+        'render_markdown': ('blocks', draft_body, sizes, render_markdown),
+    }
+
+    result = result_header('parser', {
+        'sizes': list(sizes),
+        'repeat': repeat,
+        'seed': seed,
+        'superlinear_exponent': SUPERLINEAR_EXPONENT
+    })
+    result['curves'] = {}
+    block_types.reset_stats()
+    for name, (unit, make_input, curve_sizes, *func) in curves.items():
+        result['curves'][name] = run_curve(name, unit, make_input, curve_sizes, repeat, max_seconds, *func)
+
+    # Without marks (whose handling differs between the two inline parsers) both compile to the same body
+    size = max(sizes)
+    result['markdown_matches_markup'] = (parse_markdown(markdown_doc(0.0, 0.0)(size)).dumps()
+                                         == parse_markup(doc(0.0, 0.0, types=MARKDOWN_TYPES)(size)).dumps())
+
+    # Calls and estimated time per block handler over all curves
+    result['block_handlers'] = block_types.stats()
+    result['superlinear'] = sorted(name for name, curve in result['curves'].items() if curve['superlinear'])
+    return result
+
+
+def display_result(result):
+    """Print one line per curve with its exponent"""
+    print(f"\n{'curve':<22} {'exponent':>9}  verdict", file=sys.stderr)
+    for name, curve in result['curves'].items():
+        verdict = "SUPERLINEAR" if curve['superlinear'] else "ok"
+        print(f"{name:<22} {curve['exponent']!s:>9}  {verdict}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmark for the markup parser")
+    parser.add_argument("--sizes", help="Comma separated block counts (word counts are 10x)")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes for a fast check")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON result to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.sizes:
+        sizes = tuple(int(s) for s in args.sizes.split(','))
+    else:
+        sizes = QUICK_SIZES if args.quick else DEFAULT_SIZES
+
+    result = run_benchmark(sizes, args.repeat, args.seed)
+    display_result(result)
+    write_result(result, args.output)
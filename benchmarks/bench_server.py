@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput and latency benchmark for api_server
+Starts api_server.app and a fake Substack (fake_substack.py) on local ports, registers
+several accounts against the fake and drives a weighted create/list/publish mix at
+increasing concurrency. Reports throughput, p50/p95/p99 per operation and upstream
+calls per operation as JSON
+
+    python benchmarks/bench_server.py --concurrency 1,4,16 --requests 200 --output server.json
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bench_utils  # noqa: F401 - puts the repository root on sys.path
+from bench_utils import summarize, result_header, write_result
+
+# api_server configures logging on import - keep per-request INFO lines out of the measurement
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import requests
+import multi_account
+from fake_substack import start_fake_substack, serve_in_thread
+
+OPERATIONS = ('create', 'list', 'publish')
+DEFAULT_MIX = "create=3,list=5,publish=2"
+DEFAULT_CONCURRENCY = "1,2,4,8,16"
+CALIBRATION_RUNS = 5
+
+MARKUP_FILE = os.path.join(bench_utils.REPO_ROOT, "sampleinput", "2.txt")
+
+
+def parse_mix(spec):
+    """'create=3,list=5,publish=2' -> {'create': 3.0, 'list': 5.0, 'publish': 2.0}"""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_plan(mix, count, user_ids, seed):
+    """Deterministic list of (operation, user_id) - operations drawn by weight, accounts round robin"""
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    return [(op, user_ids[i % len(user_ids)]) for i, op in enumerate(rng.choices(names, weights, k=count))]
+
+
+def register_accounts(fake_server, count, env_dir):
+    """Create count account env files pointing at separate fake publications"""
+    multi_account.ENV_DIR = env_dir
+    user_ids = []
+    for i in range(count):
+        user_id = f"bench{i + 1}"
+        multi_account.save_account_env(user_id, {
+            'PUBLICATION_URL': fake_server.publication_url(user_id),
+            'SID': f'bench_sid_{i + 1}',
+            'SUBSTACK_SID': f'bench_substack_sid_{i + 1}',
+            'SUBSTACK_LLI': f'bench_lli_{i + 1}'
+        })
+        user_ids.append(user_id)
+    return user_ids
+
+
+def seed_publish_drafts(fake, plan):
+    """Create one unpublished draft on the fake for every publish in the plan (outside the measurement)"""
+    pools = {}
+    for op, user_id in plan:
+        if op == 'publish':
+            pools.setdefault(user_id, [])
+
+    publications = {user_id: fake.publication(user_id) for user_id in pools}
+    with fake.lock:
+        for op, user_id in plan:
+            if op == 'publish':
+                draft = publications[user_id].new_draft({'draft_title': 'Benchmark publish'})
+                pools[user_id].append(draft['id'])
+    return pools
+
+
+class Client:
+    """Sends the benchmark operations to the API server, one requests.Session per thread"""
+
+    def __init__(self, base_url, markup):
+        self.base_url = base_url
+        self.markup = markup
+        self.local = threading.local()
+        self.pool_lock = threading.Lock()
+        self.publish_pools = {}
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def next_draft(self, user_id):
+        with self.pool_lock:
+            pool = self.publish_pools.get(user_id)
+            return pool.pop() if pool else None
+
+    def run(self, op, user_id):
+        """Run one operation; returns (op, seconds, ok)"""
+        session = self.session()
+        started = time.perf_counter()
+
+        if op == 'create':
+            # Every create sends the same draft; dedupe off so each one reaches the fake Substack
+            response = session.post(f"{self.base_url}/drafts/create-markup", json={
+                'user_id': user_id, 'title': 'Benchmark draft', 'markup_content': self.markup, 'dedupe': 'off'
+            })
+        elif op == 'list':
+            response = session.get(f"{self.base_url}/drafts", params={'user_id': user_id})
+        else:
+            draft_id = self.next_draft(user_id)
+            if draft_id is None:
+                return op, 0.0, False
+            response = session.post(f"{self.base_url}/drafts/{draft_id}/publish", json={
+                'user_id': user_id, 'draft_id': draft_id, 'send_email': False
+            })
+
+        return op, time.perf_counter() - started, response.status_code == 200
+
+
+def run_level(client, fake, plan, concurrency):
+    """Run the plan with `concurrency` parallel clients against a freshly reset fake"""
+    fake.reset()
+    client.publish_pools = seed_publish_drafts(fake, plan)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda item: client.run(*item), plan))
+    elapsed = time.perf_counter() - started
+
+    upstream = fake.stats['requests']
+    operations = {}
+    for op in OPERATIONS:
+        op_results = [r for r in results if r[0] == op]
+        if not op_results:
+            continue
+        operations[op] = {
+            'count': len(op_results),
+            'errors': sum(1 for r in op_results if not r[2]),
+            'throughput_rps': round(len(op_results) / elapsed, 3),
+            **summarize([r[1] for r in op_results if r[2]])
+        }
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'errors': sum(1 for r in results if not r[2]),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 3),
+        'upstream_requests': upstream,
+        'upstream_calls_per_request': round(upstream / len(results), 3),
+        'latency': summarize([r[1] for r in results if r[2]]),
+        'operations': operations
+    }
+
+
+def calibrate(client, fake, user_id, runs=CALIBRATION_RUNS):
+    """Upstream calls made by one API operation, in total and per upstream endpoint"""
+    calls = {}
+    for op in OPERATIONS:
+        plan = [(op, user_id)] * runs
+        fake.reset()
+        client.publish_pools = seed_publish_drafts(fake, plan)
+        for item in plan:
+            client.run(*item)
+        calls[op] = {
+            'total': round(fake.stats['requests'] / runs, 3),
+            'by_endpoint': {
+                endpoint: round(stats['count'] / runs, 3)
+                for endpoint, stats in sorted(fake.stats['operations'].items())
+            }
+        }
+    return calls
+
+
+def run_benchmark(concurrency_levels, requests_per_level, accounts, mix, latency, seed=1):
+    """Start the fake upstream and the API server, run every concurrency level and return the result"""
+    import api_server
+
+    with open(MARKUP_FILE, encoding='utf-8') as f:
+        markup = " ".join(f.read().split())
+
+    env_dir = tempfile.mkdtemp(prefix="bench_accounts_")
+    old_env_dir = multi_account.ENV_DIR
+    fake_server = start_fake_substack(latency=latency, seed=seed)
+    api, api_thread, api_url = serve_in_thread(api_server.app)
+
+    try:
+        user_ids = register_accounts(fake_server, accounts, env_dir)
+        client = Client(api_url, markup)
+
+        # Warm up imports, account sessions and connections
+        for user_id in user_ids:
+            client.run('list', user_id)
+
+        result = result_header('server', {
+            'concurrency': concurrency_levels,
+            'requests_per_level': requests_per_level,
+            'accounts': accounts,
+            'mix': mix,
+            'upstream_latency': latency,
+            'seed': seed
+        })
+        result['upstream_calls_per_operation'] = calibrate(client, fake_server.fake, user_ids[0])
+
+        plan = build_plan(mix, requests_per_level, user_ids, seed)
+        result['levels'] = []
+        for concurrency in concurrency_levels:
+            level = run_level(client, fake_server.fake, plan, concurrency)
+            print(f"concurrency {concurrency:>3}: {level['throughput_rps']:>8.1f} req/s  "
+                  f"p50 {level['latency']['p50_ms']} ms  p99 {level['latency']['p99_ms']} ms  "
+                  f"errors {level['errors']}", file=sys.stderr)
+            result['levels'].append(level)
+
+        return result
+    finally:
+        api.should_exit = True
+        api_thread.join()
+        fake_server.stop()
+        multi_account.ENV_DIR = old_env_dir
+        shutil.rmtree(env_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark api_server against a local fake Substack")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="Comma separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="API requests per concurrency level")
+    parser.add_argument("--accounts", type=int, default=3, help="Number of accounts (fake publications)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights, e.g. create=3,list=5,publish=2")
+    parser.add_argument("--latency", default="fixed:20", help="Upstream latency distribution (see fake_substack.py)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON result to this file instead of stdout")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    result = run_benchmark(levels, args.requests, args.accounts, parse_mix(args.mix), args.latency, args.seed)
+    write_result(result, args.output)
@@ -0,0 +1,54 @@
+# bench_utils.py - Helpers shared by the benchmark scripts
+import json
+import math
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+
+# Benchmarks import the project modules from the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile (p in 0..100) of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies):
+    """p50/p95/p99/mean/max in milliseconds for a list of latencies in seconds"""
+    values = sorted(latencies)
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    return {
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3)
+    }
+
+
+def result_header(suite, config):
+    """Common top-level fields of a benchmark result"""
+    return {
+        'suite': suite,
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'config': config
+    }
+
+
+def write_result(result, output=None):
+    """Write a benchmark result as JSON to output (a file path) or stdout"""
+    text = json.dumps(result, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
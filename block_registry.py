@@ -0,0 +1,138 @@
+# block_registry.py - Markup block keywords (Title::, Text::, ...) mapped to their handlers
+import re
+import threading
+
+import metrics
+
+_KEYWORD = re.compile(r'^[a-z0-9_-]+$')
+
+# Handler time is measured on every TIMING_SAMPLE-th call and extrapolated (calls are exact)
+TIMING_SAMPLE = 16
+
+
+class ParseState:
+    """Per-document state shared by the block handlers of one parse_markup() call"""
+    __slots__ = ('equation_number', 'data')
+
+    def __init__(self):
+        self.equation_number = 1
+        self.data = {}  # free for custom handlers, e.g. data['polls'] = 3
+
+
+class BlockHandler:
+    """
+    One block keyword: func(content, state) returns a content_nodes.Node, or None to drop the block
+    (ValueError for content it rejects)
+    calls counts how often it ran, seconds estimates how long (sampled, only while timing is on)
+    """
+    __slots__ = ('keyword', 'func', 'description', 'calls', 'seconds')
+
+    def __init__(self, keyword, func, description=""):
+        self.keyword = keyword
+        self.func = func
+        self.description = description
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, content, state):
+        return self.func(content, state)
+
+
+def normalize_keyword(keyword):
+    """'SubscribeWidget::' -> 'subscribewidget' (the form parse_markup looks up)"""
+    keyword = keyword.strip()
+    if keyword.endswith('::'):
+        keyword = keyword[:-2]
+    keyword = keyword.strip().lower()
+    if not _KEYWORD.match(keyword):
+        raise ValueError(f"Invalid block keyword: {keyword!r} (letters, digits, '_' and '-' only)")
+    return keyword
+
+
+class BlockRegistry:
+    """
+    Keyword -> BlockHandler; lookups are one dict access. Registration copies the dict, so
+    parsers running in other threads keep using a consistent snapshot without locking
+    """
+
+    def __init__(self, timing=metrics.ENABLED):
+        self.handlers = {}
+        self.timing = timing
+        self.lock = threading.Lock()
+
+    def register(self, keyword, func=None, description="", replace=False):
+        """
+        Register func for keyword (also usable as a decorator)
+            @registry.register("poll", description="Poll:: question >> option >> option")
+            def poll_block(content, state): ...
+        Registering an existing keyword raises ValueError unless replace=True
+        """
+        if func is None:
+            def decorator(f):
+                self.register(keyword, f, description, replace)
+                return f
+            return decorator
+
+        keyword = normalize_keyword(keyword)
+        handler = BlockHandler(keyword, func, description or (func.__doc__ or "").strip())
+        with self.lock:
+            if keyword in self.handlers and not replace:
+                raise ValueError(f"Block type '{keyword}' is already registered")
+            handlers = dict(self.handlers)
+            handlers[keyword] = handler
+            self.handlers = handlers
+        return handler
+
+    def unregister(self, keyword):
+        keyword = normalize_keyword(keyword)
+        with self.lock:
+            handlers = dict(self.handlers)
+            handler = handlers.pop(keyword, None)
+            self.handlers = handlers
+        return handler
+
+    def get(self, keyword):
+        return self.handlers.get(keyword)
+
+    def __contains__(self, keyword):
+        return keyword in self.handlers
+
+    def keywords(self):
+        return sorted(self.handlers)
+
+    def stats(self):
+        """Calls and time per block type, busiest first"""
+        rows = {
+            keyword: {
+                'calls': handler.calls,
+                'seconds': round(handler.seconds, 6),
+                'mean_us': round(handler.seconds / handler.calls * 1e6, 3) if handler.calls and self.timing else None
+            }
+            for keyword, handler in self.handlers.items() if handler.calls
+        }
+        return dict(sorted(rows.items(), key=lambda item: -item[1]['seconds']))
+
+    def reset_stats(self):
+        for handler in self.handlers.values():
+            handler.calls = 0
+            handler.seconds = 0.0
+
+    def render(self):
+        """Prometheus lines for GET /metrics"""
+        lines = ["# HELP substack_markup_blocks_total Markup blocks compiled, by block type",
+                 "# TYPE substack_markup_blocks_total counter"]
+        handlers = sorted(self.handlers.items())
+        lines.extend(f'substack_markup_blocks_total{{block="{keyword}"}} {handler.calls}'
+                     for keyword, handler in handlers if handler.calls)
+        lines.extend(["# HELP substack_markup_block_seconds_total Time spent compiling markup blocks, by block type",
+                      "# TYPE substack_markup_block_seconds_total counter"])
+        lines.extend(f'substack_markup_block_seconds_total{{block="{keyword}"}} {handler.seconds}'
+                     for keyword, handler in handlers if handler.calls)
+        return lines
+
+
+# The registry parse_markup() uses; draft_create registers the built-in block types on import
+registry = BlockRegistry()
+register_block = registry.register
+metrics.register(registry)
+
@@ -0,0 +1,234 @@
+# cassette.py - Record/replay of upstream HTTP exchanges for deterministic offline runs
+import atexit
+import base64
+import gzip
+import hashlib
+import io
+import json
+import sys
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+
+# Modes: record every exchange, replay without delay, or replay with the recorded latency
+RECORD = "record"
+REPLAY = "replay"
+REPLAY_TIMED = "replay-timed"
+MODES = (RECORD, REPLAY, REPLAY_TIMED)
+
+# Response headers worth keeping - bodies are stored decoded, so no encoding/length headers
+KEPT_HEADERS = ('content-type', 'retry-after', 'location')
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """Raised in replay mode when a request has no recorded exchange"""
+
+
+def _canonical_url(url):
+    """URL with sorted query parameters, so parameter order does not break matching"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return parts._replace(query=query, fragment='').geturl()
+
+
+def _body_digest(body):
+    if not body:
+        return None
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha1(body).hexdigest()[:16]
+
+
+class Cassette:
+    """
+    Recorded exchanges of one cassette file (JSON lines, gzip compressed if the path ends in .gz)
+    Replay matches on method, URL and request body (method and URL only if that body was never
+    recorded); repeated requests are answered in recorded order, each exchange at most once, and
+    the last answer is repeated once they run out
+    """
+
+    def __init__(self, path, mode=REPLAY):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.exchanges = []
+        self._exact = {}  # (method, url, body digest) -> deque of exchange indexes
+        self._loose = {}  # (method, url) -> deque of exchange indexes
+        self._used = []   # per exchange: already served (through either index)
+        self._last = {}   # index key -> last exchange taken from its deque, repeated when it runs out
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        if mode != RECORD:
+            self.load()
+
+    def _open(self, write=False):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, 'wt' if write else 'rt', encoding='utf-8')
+        return open(self.path, 'w' if write else 'r', encoding='utf-8')
+
+    def load(self):
+        with self._open() as f:
+            for line in f:
+                if line.strip():
+                    self._index(json.loads(line))
+
+    def save(self):
+        """Write the cassette (record mode only; called automatically at exit)"""
+        with self.lock:
+            if self.mode != RECORD or not self.dirty:
+                return
+            with self._open(write=True) as f:
+                for exchange in self.exchanges:
+                    f.write(json.dumps(exchange, separators=(',', ':')) + '\n')
+            self.dirty = False
+
+    def _index(self, exchange):
+        index = len(self.exchanges)
+        self.exchanges.append(exchange)
+        self._used.append(False)
+        exact = (exchange['method'], exchange['url'], exchange['body_sha1'])
+        loose = (exchange['method'], exchange['url'])
+        self._exact.setdefault(exact, deque()).append(index)
+        self._loose.setdefault(loose, deque()).append(index)
+
+    def _take(self, queues, key):
+        # First exchange under key not served yet; exchanges served through the other index are skipped
+        queue = queues[key]
+        while queue:
+            index = queue.popleft()
+            self._last[key] = index
+            if not self._used[index]:
+                self._used[index] = True
+                return index
+        return self._last[key]
+
+    def record(self, request, response, elapsed):
+        content = response.content
+        try:
+            body, encoding = content.decode('utf-8'), 'text'
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(content).decode('ascii'), 'base64'
+
+        exchange = {
+            'method': request.method,
+            'url': _canonical_url(request.url),
+            'body_sha1': _body_digest(request.body),
+            'status': response.status_code,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+            'body': body,
+            'encoding': encoding,
+            'elapsed': round(elapsed, 6)
+        }
+        with self.lock:
+            self._index(exchange)
+            self.dirty = True
+
+    def lookup(self, request):
+        """Next recorded exchange for this request, or None"""
+        url = _canonical_url(request.url)
+        exact = (request.method, url, _body_digest(request.body))
+        loose = (request.method, url)
+        with self.lock:
+            if exact in self._exact:
+                index = self._take(self._exact, exact)
+            elif loose in self._loose:
+                index = self._take(self._loose, loose)
+            else:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self.exchanges[index]
+
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter that records through to the network or answers from a Cassette"""
+
+    def __init__(self, cassette, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        if self.cassette.mode == RECORD:
+            started = time.perf_counter()
+            response = super().send(request, **kwargs)
+            # Reading the whole body here makes the recorded latency include the transfer
+            response.content
+            self.cassette.record(request, response, time.perf_counter() - started)
+            return response
+
+        exchange = self.cassette.lookup(request)
+        if exchange is None:
+            raise CassetteMiss(f"No recorded exchange for {request.method} {request.url}", request=request)
+        if self.cassette.mode == REPLAY_TIMED:
+            time.sleep(exchange['elapsed'])
+
+        if exchange['encoding'] == 'base64':
+            content = base64.b64decode(exchange['body'])
+        else:
+            content = exchange['body'].encode('utf-8')
+
+        raw = HTTPResponse(body=io.BytesIO(content), headers=exchange['headers'], status=exchange['status'],
+                           preload_content=False, decode_content=False)
+        return self.build_response(request, raw)
+
+
+def get_cassette(path, mode=REPLAY):
+    """Shared Cassette for path, so every session of the process records into the same file"""
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None or cassette.mode != mode:
+            cassette = Cassette(path, mode)
+            _cassettes[path] = cassette
+        return cassette
+
+
+def use_cassette(session, path, mode=REPLAY):
+    """Route all http(s) traffic of session through the cassette at path; returns the Cassette"""
+    cassette = get_cassette(path, mode)
+    adapter = CassetteAdapter(cassette)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return cassette
+
+
+def save_all():
+    """Write every cassette recorded in this process"""
+    with _cassettes_lock:
+        cassettes = list(_cassettes.values())
+    for cassette in cassettes:
+        cassette.save()
+
+
+atexit.register(save_all)
+
+
+def summarize(path):
+    """Exchange count and recorded time per endpoint of a cassette file"""
+    cassette = Cassette(path, REPLAY)
+    endpoints = {}
+    for exchange in cassette.exchanges:
+        key = f"{exchange['method']} {urlsplit(exchange['url']).path}"
+        entry = endpoints.setdefault(key, {'count': 0, 'seconds': 0.0, 'statuses': {}})
+        entry['count'] += 1
+        entry['seconds'] = round(entry['seconds'] + exchange['elapsed'], 6)
+        status = str(exchange['status'])
+        entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+    return {'path': path, 'exchanges': len(cassette.exchanges), 'endpoints': endpoints}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python cassette.py <cassette file>")
+        sys.exit(1)
+    print(json.dumps(summarize(sys.argv[1]), indent=2))
@@ -0,0 +1,390 @@
+# content_nodes.py - Compact node model for Substack (ProseMirror) documents
+import json
+import re
+from json.encoder import encode_basestring_ascii as _encode_str  # the escaping json.dumps uses
+
+# Every node keeps only its variable fields in __slots__; type names, constant attrs and the
+# JSON around them live on the class. write() appends the exact text json.dumps(node.to_json())
+# would produce (default separators), so draft bodies are byte-for-byte unchanged.
+
+
+def _encode(value):
+    """JSON for an attribute value (str, int or None)"""
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return _encode_str(value)
+    return json.dumps(value)
+
+
+def _write_nodes(parts, nodes):
+    parts.append('[')
+    for i, node in enumerate(nodes):
+        if i:
+            parts.append(', ')
+        node.write(parts)
+    parts.append(']')
+
+
+class Node:
+    """Base class: to_json() builds the dict form, write()/dumps() the JSON text"""
+    __slots__ = ()
+
+    def to_json(self):
+        raise NotImplementedError
+
+    def write(self, parts):
+        raise NotImplementedError
+
+    def dumps(self):
+        """Same string as json.dumps(self.to_json()), without building the dicts"""
+        parts = []
+        self.write(parts)
+        return ''.join(parts)
+
+
+# Marks
+
+class Mark(Node):
+    """Mark without attributes (strong, em, strikethrough, code) - use the shared MARKS instances"""
+    __slots__ = ('type', '_json')
+
+    def __init__(self, mark_type):
+        self.type = mark_type
+        self._json = '{"type": ' + _encode_str(mark_type) + '}'
+
+    def to_json(self):
+        return {"type": self.type}
+
+    def write(self, parts):
+        parts.append(self._json)
+
+
+MARKS = {name: Mark(name) for name in ('strong', 'em', 'strikethrough', 'code')}
+
+
+class Link(Node):
+    """Link mark; target/rel/class are the same for every link"""
+    __slots__ = ('href',)
+    type = 'link'
+
+    def __init__(self, href):
+        self.href = href
+
+    def to_json(self):
+        return {
+            "type": "link",
+            "attrs": {
+                "href": self.href,
+                "target": "_blank",
+                "rel": "noopener noreferrer nofollow",
+                "class": None
+            }
+        }
+
+    def write(self, parts):
+        parts.append('{"type": "link", "attrs": {"href": ')
+        parts.append(_encode_str(self.href))
+        parts.append(', "target": "_blank", "rel": "noopener noreferrer nofollow", "class": null}}')
+
+
+# Inline content
+
+class Text(Node):
+    __slots__ = ('text', 'marks')
+
+    def __init__(self, text, marks=()):
+        self.text = text
+        self.marks = marks
+
+    def to_json(self):
+        node = {"type": "text", "text": self.text}
+        if self.marks:
+            node["marks"] = [mark.to_json() for mark in self.marks]
+        return node
+
+    def write(self, parts):
+        parts.append('{"type": "text", "text": ')
+        parts.append(_encode_str(self.text))
+        if self.marks:
+            parts.append(', "marks": ')
+            _write_nodes(parts, self.marks)
+        parts.append('}')
+
+
+class FootnoteAnchor(Node):
+    """Inline reference to the footnote with this number"""
+    __slots__ = ('number',)
+
+    def __init__(self, number):
+        self.number = number
+
+    def to_json(self):
+        return {"type": "footnoteAnchor", "attrs": {"number": self.number}}
+
+    def write(self, parts):
+        parts.append('{"type": "footnoteAnchor", "attrs": {"number": ')
+        parts.append(_encode(self.number))
+        parts.append('}}')
+
+
+# Blocks with children and constant (or no) attrs
+
+class Block(Node):
+    """
+    Node with child nodes; subclasses set TYPE and optionally ATTRS (constant attrs)
+    content None leaves out the "content" key, like the {"type": "paragraph"} of Break::
+    """
+    __slots__ = ('content',)
+    TYPE = None
+    ATTRS = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        head = '{"type": ' + _encode_str(cls.TYPE)
+        if cls.ATTRS is not None:
+            head += ', "attrs": ' + json.dumps(cls.ATTRS)
+        cls._EMPTY = head + '}'
+        cls._PREFIX = head + ', "content": '
+
+    def __init__(self, content=None):
+        self.content = content
+
+    def to_json(self):
+        node = {"type": self.TYPE}
+        if self.ATTRS is not None:
+            node["attrs"] = dict(self.ATTRS)
+        if self.content is not None:
+            node["content"] = [child.to_json() for child in self.content]
+        return node
+
+    def write(self, parts):
+        if self.content is None:
+            parts.append(self._EMPTY)
+            return
+        parts.append(self._PREFIX)
+        _write_nodes(parts, self.content)
+        parts.append('}')
+
+
+class Doc(Block):
+    __slots__ = ()
+    TYPE = 'doc'
+
+
+class Paragraph(Block):
+    __slots__ = ()
+    TYPE = 'paragraph'
+
+
+class Blockquote(Block):
+    __slots__ = ()
+    TYPE = 'blockquote'
+
+
+class Pullquote(Block):
+    __slots__ = ()
+    TYPE = 'pullquote'
+    ATTRS = {"align": None, "color": None}
+
+
+class BulletList(Block):
+    __slots__ = ()
+    TYPE = 'bullet_list'
+
+
+class OrderedList(Block):
+    __slots__ = ()
+    TYPE = 'ordered_list'
+    ATTRS = {"start": 1, "order": 1}
+
+
+class ListItem(Block):
+    __slots__ = ()
+    TYPE = 'list_item'
+
+
+class HorizontalRule(Block):
+    __slots__ = ()
+    TYPE = 'horizontal_rule'
+
+
+# Blocks with per-node attrs
+
+class Heading(Node):
+    __slots__ = ('level', 'content')
+
+    def __init__(self, level, content):
+        self.level = level
+        self.content = content
+
+    def to_json(self):
+        return {"type": "heading", "attrs": {"level": self.level},
+                "content": [child.to_json() for child in self.content]}
+
+    def write(self, parts):
+        parts.append('{"type": "heading", "attrs": {"level": ')
+        parts.append(_encode(self.level))
+        parts.append('}, "content": ')
+        _write_nodes(parts, self.content)
+        parts.append('}')
+
+
+class CodeBlock(Node):
+    __slots__ = ('language', 'content')
+
+    def __init__(self, language, content):
+        self.language = language
+        self.content = content
+
+    def to_json(self):
+        return {"type": "code_block", "attrs": {"language": self.language},
+                "content": [child.to_json() for child in self.content]}
+
+    def write(self, parts):
+        parts.append('{"type": "code_block", "attrs": {"language": ')
+        parts.append(_encode(self.language))
+        parts.append('}, "content": ')
+        _write_nodes(parts, self.content)
+        parts.append('}')
+
+
+class Footnote(Node):
+    __slots__ = ('number', 'content')
+
+    def __init__(self, number, content):
+        self.number = number
+        self.content = content
+
+    def to_json(self):
+        return {"type": "footnote", "attrs": {"number": self.number},
+                "content": [child.to_json() for child in self.content]}
+
+    def write(self, parts):
+        parts.append('{"type": "footnote", "attrs": {"number": ')
+        parts.append(_encode(self.number))
+        parts.append('}, "content": ')
+        _write_nodes(parts, self.content)
+        parts.append('}')
+
+
+class Button(Node):
+    """Button:: block (Subscribe::, Share:: and Comment:: are fragments, see SUBSCRIBE_BUTTON)"""
+    __slots__ = ('url', 'text')
+
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+
+    def to_json(self):
+        return {"type": "button", "attrs": {"url": self.url, "text": self.text, "action": None, "class": None}}
+
+    def write(self, parts):
+        parts.append('{"type": "button", "attrs": {"url": ')
+        parts.append(_encode_str(self.url))
+        parts.append(', "text": ')
+        parts.append(_encode_str(self.text))
+        parts.append(', "action": null, "class": null}}')
+
+
+class LatexBlock(Node):
+    __slots__ = ('expression', 'id')
+
+    def __init__(self, expression, equation_id):
+        self.expression = expression
+        self.id = equation_id
+
+    def to_json(self):
+        return {"type": "latex_block", "attrs": {"persistentExpression": self.expression, "id": self.id}}
+
+    def write(self, parts):
+        parts.append('{"type": "latex_block", "attrs": {"persistentExpression": ')
+        parts.append(_encode_str(self.expression))
+        parts.append(', "id": ')
+        parts.append(_encode_str(self.id))
+        parts.append('}}')
+
+
+# Fixed-shape blocks: pre-encoded JSON with slots for the few values that vary
+
+class FragmentTemplate:
+    """
+    A block structure compiled once into JSON pieces around its slots
+        SUBSCRIBE_BUTTON = FragmentTemplate({"type": "button", "attrs": {"url": "%%checkout_url%%",
+                                             "text": SLOT(0), ...}})
+    Filling it is string splicing (each value escaped like json.dumps would), no dicts are built
+    """
+    __slots__ = ('structure', 'steps', 'tail')
+
+    def __init__(self, structure):
+        self.structure = structure
+        # json.dumps the structure once and cut it at the (escaped) slot markers:
+        # steps = [(piece before the slot, slot index), ...], tail = the piece after the last slot
+        split = _ENCODED_SLOT.split(json.dumps(structure))
+        self.steps = [(piece, int(index)) for piece, index in zip(split[0:-1:2], split[1::2])]
+        self.tail = split[-1]
+
+    def write(self, parts, values):
+        for piece, index in self.steps:
+            parts.append(piece)
+            value = values[index]
+            parts.append(_encode_str(value) if value.__class__ is str else _encode(value))
+        parts.append(self.tail)
+
+    def build(self, values):
+        """The structure as plain dicts with the slots filled in"""
+        return _fill(self.structure, values)
+
+
+# A slot is a private-use character string; json.dumps escapes it to "\ue000slot<n>\ue000"
+_SLOT_MARKER = "\ue000slot{}\ue000"
+_ENCODED_SLOT = re.compile(r'"\\ue000slot(\d+)\\ue000"')
+
+
+def SLOT(index):
+    """Placeholder for the index-th value of a FragmentTemplate"""
+    return _SLOT_MARKER.format(index)
+
+
+def _fill(value, values):
+    if isinstance(value, dict):
+        return {key: _fill(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, values) for item in value]
+    if isinstance(value, str) and value.startswith("\ue000slot"):
+        return values[int(value[5:-1])]
+    return value
+
+
+class Fragment(Node):
+    """A block rendered from a FragmentTemplate"""
+    __slots__ = ('template', 'values')
+
+    def __init__(self, template, values):
+        self.template = template
+        self.values = values
+
+    def to_json(self):
+        return self.template.build(self.values)
+
+    def write(self, parts):
+        self.template.write(parts, self.values)
+
+
+def _button_template(url):
+    return FragmentTemplate({"type": "button", "attrs": {"url": url, "text": SLOT(0), "action": None, "class": None}})
+
+
+SUBSCRIBE_BUTTON = _button_template("%%checkout_url%%")
+SHARE_BUTTON = _button_template("%%share_url%%")
+COMMENT_BUTTON = _button_template("%%half_magic_comments_url%%")
+SUBSCRIBE_WIDGET = FragmentTemplate({
+    "type": "subscribeWidget",
+    "attrs": {"url": "%%checkout_url%%", "text": SLOT(0), "language": "en"},
+    "content": [{"type": "ctaCaption", "content": [{"type": "text", "text": SLOT(1)}]}]
+})
+SHARE_WIDGET = FragmentTemplate({
+    "type": "captionedShareButton",
+    "attrs": {"url": "%%share_url%%", "text": SLOT(0)},
+    "content": [{"type": "ctaCaption", "content": [{"type": "text", "text": SLOT(1)}]}]
+})
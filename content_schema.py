@@ -0,0 +1,227 @@
+# content_schema.py - Checks draft documents against docs/content_types_reference.json before upload
+import json
+import os
+
+from content_nodes import Node
+
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'docs', 'content_types_reference.json')
+
+# Errors collected before validation stops (a broken generator tends to repeat the same mistake)
+MAX_ERRORS = 20
+
+# Nesting the editor accepts but the reference (one sample per node type) does not show:
+# quotes, list items and footnotes hold any block a document can hold, so lists nest
+FLOW_CONTAINERS = ('blockquote', 'list_item', 'footnote')
+
+# Node/mark types whose samples show attrs the editor does not need: only these are required,
+# the others are type-checked when present (a link with just href is filled in by the editor)
+REQUIRED_ATTRS = {'link': ('href',)}
+
+_NUMBER = (int, float)
+_TYPE_NAMES = {bool: 'a boolean', int: 'a number', float: 'a number', str: 'a string', type(None): 'null'}
+
+
+class InvalidDocument(ValueError):
+    """Raised by check_document; errors lists every problem found as 'path: message'"""
+
+    def __init__(self, errors):
+        more = f" (+{len(errors) - 3} more)" if len(errors) > 3 else ""
+        super().__init__("; ".join(errors[:3]) + more)
+        self.errors = errors
+
+
+class NodeRule:
+    """Compiled checks for one node or mark type"""
+    __slots__ = ('type', 'attrs', 'optional', 'children', 'marks')
+
+    def __init__(self, node_type):
+        self.type = node_type
+        self.attrs = {}        # attr -> tuple of accepted Python types, None = any (only null seen)
+        self.optional = set()  # attrs that may be left out
+        self.children = set()  # child node types; empty = leaf node
+        self.marks = set()     # mark types allowed on this node
+
+
+def _value_types(value):
+    if value is None:
+        return (type(None),)
+    if isinstance(value, bool):
+        return (bool,)
+    if isinstance(value, _NUMBER):
+        return _NUMBER
+    return (type(value),)
+
+
+def compile_schema(reference):
+    """
+    reference: the parsed content_types_reference.json
+    Returns {node type: NodeRule} built from every node that appears in the samples
+    """
+    rules = {}
+    # image/png and image/jpg list image2 attrs, not a node
+    samples = [entry['structure'] for name, entry in reference['content_types_reference'].items()
+               if entry['structure'].get('type') == name]
+    samples.extend(reference.get('examples', {}).values())
+
+    stack = [node for node in samples if isinstance(node, dict) and 'type' in node]
+    while stack:
+        node = stack.pop()
+        rule = rules.get(node['type'])
+        if rule is None:
+            rule = rules[node['type']] = NodeRule(node['type'])
+        for name, value in (node.get('attrs') or {}).items():
+            rule.attrs[name] = tuple(set(rule.attrs.get(name, ()) + _value_types(value)))
+        for mark in node.get('marks') or []:
+            rule.marks.add(mark['type'])
+            stack.append(mark)
+        for child in node.get('content') or []:
+            rule.children.add(child['type'])
+            stack.append(child)
+
+    # The examples use a bare text node as a placeholder for "any content"; only nodes whose
+    # full sample (structure) holds text may contain it
+    structural = {}
+    stack = [entry['structure'] for entry in reference['content_types_reference'].values()]
+    while stack:
+        node = stack.pop()
+        if 'type' not in node:
+            continue
+        children = node.get('content') or []
+        structural.setdefault(node['type'], set()).update(child['type'] for child in children)
+        stack.extend(children)
+    for node_type, rule in rules.items():
+        for name, types in rule.attrs.items():
+            if types == (type(None),):
+                rule.attrs[name] = None
+        if 'text' in rule.children and 'text' not in structural.get(node_type, ()):
+            rule.children.discard('text')
+        if node_type in REQUIRED_ATTRS:
+            rule.optional = set(rule.attrs) - set(REQUIRED_ATTRS[node_type])
+
+    blocks = rules['doc'].children - {'footnote'}
+    for node_type in FLOW_CONTAINERS:
+        rules[node_type].children |= blocks
+    return rules
+
+
+def load_schema(path=REFERENCE_FILE):
+    with open(path, encoding='utf-8') as f:
+        return compile_schema(json.load(f))
+
+
+_schema = None
+
+
+def get_schema():
+    """The schema compiled from REFERENCE_FILE, loaded on first use"""
+    global _schema
+    if _schema is None:
+        _schema = load_schema()
+    return _schema
+
+
+def _check_attrs(rule, attrs, path, errors):
+    for name, types in rule.attrs.items():
+        if name not in attrs:
+            if name not in rule.optional:
+                errors.append(f"{path}: {rule.type} is missing attr '{name}'")
+            continue
+        value = attrs[name]
+        if types is None:
+            continue
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            errors.append(f"{path}: {rule.type} attr '{name}' must be "
+                          + " or ".join(sorted({_TYPE_NAMES.get(t, t.__name__) for t in types})))
+
+
+def _check_marks(schema, marks, path, errors):
+    if not isinstance(marks, list):
+        errors.append(f"{path}: marks must be a list")
+        return
+    allowed = schema['text'].marks
+    for index, mark in enumerate(marks):
+        mark_type = mark.get('type') if isinstance(mark, dict) else None
+        if mark_type not in allowed:
+            errors.append(f"{path}.marks[{index}]: unknown mark {mark_type!r}")
+        elif schema[mark_type].attrs:
+            _check_attrs(schema[mark_type], mark.get('attrs') or {}, f"{path}.marks[{index}]", errors)
+
+
+def validate_document(doc, schema=None):
+    """
+    Check a draft document (dict, draft_body JSON or content_nodes.Doc) against the reference:
+    known node and mark types, allowed children, required attrs and their types, non-empty
+    text and footnote anchors that have a footnote. Returns a list of errors, empty if valid
+    """
+    schema = schema or get_schema()
+    if isinstance(doc, Node):
+        doc = doc.to_json()
+    elif isinstance(doc, (str, bytes)):
+        doc = json.loads(doc)
+    if not isinstance(doc, dict) or doc.get('type') != 'doc':
+        return ["document: top-level node must be of type 'doc'"]
+
+    errors = []
+    anchors = []
+    footnotes = set()
+    # Containers whose children still need checking; text (most of a document) is checked inline
+    # and paths are only formatted for nodes that fail or have children
+    stack = [(doc, 'doc', schema['doc'])]
+    while stack and len(errors) < MAX_ERRORS:
+        node, path, rule = stack.pop()
+        content = node.get('content')
+        if content is None:
+            continue
+        if not isinstance(content, list):
+            errors.append(f"{path}: content must be a list")
+            continue
+        if content and not rule.children:
+            errors.append(f"{path}: {rule.type} cannot have content")
+            continue
+
+        allowed = rule.children
+        containers = []
+        for index, child in enumerate(content):
+            child_type = child.get('type') if isinstance(child, dict) else None
+            if child_type == 'text' and 'text' in allowed:
+                text = child.get('text')
+                if not text or not isinstance(text, str):
+                    errors.append(f"{path}.content[{index}]: text node needs non-empty text")
+                if 'marks' in child:
+                    _check_marks(schema, child['marks'], f"{path}.content[{index}]", errors)
+                continue
+
+            child_rule = schema.get(child_type)
+            if child_rule is None:
+                errors.append(f"{path}.content[{index}]: unknown node type {child_type!r}")
+                continue
+            if child_type not in allowed:
+                errors.append(f"{path}.content[{index}]: {child_type} is not allowed inside {rule.type}")
+                continue
+            if child_rule.attrs:
+                attrs = child.get('attrs')
+                if not isinstance(attrs, dict):
+                    errors.append(f"{path}.content[{index}]: {child_type} needs attrs")
+                else:
+                    _check_attrs(child_rule, attrs, f"{path}.content[{index}]", errors)
+                    if child_type == 'heading' and attrs.get('level') not in (1, 2, 3, 4, 5, 6):
+                        errors.append(f"{path}.content[{index}]: heading level must be 1-6")
+                    elif child_type == 'footnoteAnchor':
+                        anchors.append((attrs.get('number'), f"{path}.content[{index}]"))
+                    elif child_type == 'footnote':
+                        footnotes.add(attrs.get('number'))
+            if 'content' in child:
+                containers.append((child, f"{path}.content[{index}]", child_rule))
+        stack.extend(reversed(containers))
+
+    for number, path in anchors:
+        if number not in footnotes:
+            errors.append(f"{path}: footnote anchor {number} has no footnote")
+    return errors[:MAX_ERRORS]
+
+
+def check_document(doc, schema=None):
+    """validate_document that raises InvalidDocument instead of returning the errors"""
+    errors = validate_document(doc, schema)
+    if errors:
+        raise InvalidDocument(errors)
@@ -0,0 +1,145 @@
+# doc_diff.py - Content hashes and block-level diffs of draft documents
+import hashlib
+import json
+from difflib import SequenceMatcher
+
+from content_nodes import Node
+
+DIGEST_SIZE = 16
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def _block_type(text):
+    # Nodes write their type first: {"type": "paragraph", ...
+    if text.startswith('{"type": "'):
+        return text[10:text.index('"', 10)]
+    return None
+
+
+class DocHashes:
+    """
+    Two-level Merkle hash of a document: one digest per top-level block and the root digest over
+    them. Equal roots mean equal content; otherwise the block digests locate the changes
+    """
+    __slots__ = ('root', 'blocks', 'types')
+
+    def __init__(self, blocks, types):
+        self.blocks = blocks  # block digests, in order
+        self.types = types    # block node types, for change summaries
+        self.root = _digest(b''.join(blocks)).hex()
+
+    def __eq__(self, other):
+        return isinstance(other, DocHashes) and self.root == other.root
+
+    def __hash__(self):
+        return hash(self.root)
+
+
+def hash_document(doc):
+    """
+    DocHashes of a document (dict, draft_body JSON text/bytes or content_nodes.Doc)
+    Blocks are hashed as json.dumps writes them, which is also what a node tree's dumps() writes,
+    so a draft body read back from Substack hashes the same as the tree it was created from
+    """
+    if isinstance(doc, Node):
+        return _hash_texts([block.dumps() for block in doc.content])
+    if isinstance(doc, (str, bytes)):
+        doc = json.loads(doc) if doc else {}
+    blocks = (doc or {}).get('content') or []
+    return DocHashes([_digest(json.dumps(block).encode()) for block in blocks],
+                     [block.get('type') if isinstance(block, dict) else None for block in blocks])
+
+
+def _hash_texts(texts):
+    return DocHashes([_digest(text.encode()) for text in texts], [_block_type(text) for text in texts])
+
+
+def encode_and_hash(doc):
+    """
+    (draft_body JSON text, DocHashes) of a document; a node tree is serialized once for both
+    (its blocks joined the way Doc.dumps() joins them)
+    """
+    if isinstance(doc, Node):
+        texts = [block.dumps() for block in doc.content]
+        return '{"type": "doc", "content": [' + ', '.join(texts) + ']}', _hash_texts(texts)
+    if isinstance(doc, (str, bytes)):
+        return doc, hash_document(doc)
+    return json.dumps(doc), hash_document(doc)
+
+
+# Empty paragraphs (Break::, blank lines) only add spacing and are left out of content_key
+_EMPTY_PARAGRAPH = _digest(b'{"type": "paragraph"}')
+
+
+def content_key(hashes):
+    """Normalized content hash of DocHashes: the same for documents differing only in empty paragraphs"""
+    return _digest(b''.join(digest for digest in hashes.blocks if digest != _EMPTY_PARAGRAPH)).hex()
+
+
+def diff_hashes(old, new):
+    """
+    Block operations turning old into new (both DocHashes):
+    [(op, old_start, old_end, new_start, new_end), ...] with op 'added', 'removed' or 'modified'
+    The common prefix and suffix are skipped by digest first, so only the changed region is aligned
+    """
+    if old.root == new.root:
+        return []
+    a, b = old.blocks, new.blocks
+    start = 0
+    limit = min(len(a), len(b))
+    while start < limit and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+
+    operations = []
+    matcher = SequenceMatcher(None, a[start:end_a], b[start:end_b], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        i1, i2, j1, j2 = i1 + start, i2 + start, j1 + start, j2 + start
+        if tag == 'insert':
+            operations.append(('added', i1, i2, j1, j2))
+        elif tag == 'delete':
+            operations.append(('removed', i1, i2, j1, j2))
+        elif tag == 'replace':
+            # Pair the replaced blocks one to one; the rest was added or removed
+            paired = min(i2 - i1, j2 - j1)
+            operations.append(('modified', i1, i1 + paired, j1, j1 + paired))
+            if i2 - i1 > paired:
+                operations.append(('removed', i1 + paired, i2, j2, j2))
+            elif j2 - j1 > paired:
+                operations.append(('added', i2, i2, j1 + paired, j2))
+    return operations
+
+
+def change_summary(old, new, operations=None, max_listed=20):
+    """
+    Compact description of a diff:
+    {"changed": bool, "blocks_before": n, "blocks_after": n, "added": n, "removed": n,
+     "modified": n, "unchanged": n, "changes": [{"op": "modified", "index": 3, "type": "paragraph"}, ...]}
+    indexes refer to the new document (to the old one for removed blocks), at most max_listed are listed
+    """
+    if operations is None:
+        operations = diff_hashes(old, new)
+    counts = {'added': 0, 'removed': 0, 'modified': 0}
+    changes = []
+    for op, i1, i2, j1, j2 in operations:
+        indexes, types = (range(i1, i2), old.types) if op == 'removed' else (range(j1, j2), new.types)
+        counts[op] += len(indexes)
+        for index in indexes:
+            if len(changes) < max_listed:
+                changes.append({'op': op, 'index': index, 'type': types[index]})
+    return {
+        'changed': bool(operations),
+        'blocks_before': len(old.blocks),
+        'blocks_after': len(new.blocks),
+        'added': counts['added'],
+        'removed': counts['removed'],
+        'modified': counts['modified'],
+        'unchanged': len(new.blocks) - counts['added'] - counts['modified'],
+        'changes': changes
+    }
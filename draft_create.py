@@ -1,35 +1,51 @@
 # draft_create.py - Create Substack drafts
 import os
 import json
-import requests
 import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import partial
 from dotenv import load_dotenv
+from substack_session import build_session
+from listing import iter_drafts, ListingError
+from draft_payload import (REMOVED_FIELDS, JSON_HEADERS, BACKEND as PAYLOAD_BACKEND, draft_fields,
+                           encode_draft_payload, encode_json)
+from log_config import Lazy, setup_logging
+from metrics import timed
+from tracing import traced
+from block_registry import ParseState, register_block, registry as block_types, TIMING_SAMPLE
+from markdown_parser import parse_markdown
+from content_schema import validate_document
+from doc_diff import hash_document, encode_and_hash, change_summary
+import draft_index
+from content_nodes import (Node, Doc, Paragraph, Heading, Text, Link, MARKS, Blockquote, Pullquote, BulletList,
+                           OrderedList, ListItem, CodeBlock, HorizontalRule, Button, LatexBlock, Footnote,
+                           Fragment, SUBSCRIBE_BUTTON, SHARE_BUTTON, COMMENT_BUTTON, SUBSCRIBE_WIDGET, SHARE_WIDGET)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Setup session
-session = requests.Session()
-session.headers.update({
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-    "Referer": os.getenv("PUBLICATION_URL"),
-    "Content-Type": "application/json"
-})
-
-# Set cookies
-cookie_map = {
-    "sid": os.getenv("SID"),
-    "substack.lli": os.getenv("SUBSTACK_LLI"),
-    "substack.sid": os.getenv("SUBSTACK_SID")
-}
-for k, v in cookie_map.items():
-    if v:
-        session.cookies.set(k, v, domain=".substack.com")
+session = build_session()
 
 pub_url = os.getenv("PUBLICATION_URL")
 
-def parse_markup_to_json(markup_text):
+def _account_session(account=None):
+    """Session and publication URL to use: the given Account or the .env account of this module"""
+    if account is not None:
+        return account.session, account.pub_url
+    return session, pub_url
+
+@traced()
+def parse_markup(markup_text, registry=None):
     """
-    Parse user-friendly markup into Substack JSON content structure
+    Parse user-friendly markup into a content_nodes.Doc (compact node tree)
+    doc.dumps() is the draft_body JSON, doc.to_json() the same structure as plain dicts
+    Block keywords are looked up in block_registry.registry (or the given registry), where
+    custom block types are added with register_block()
     
     Markup Syntax:
     Title:: Main heading | Subtitle:: Optional subtitle | H1:: Heading 1 | H2:: Heading 2 |
@@ -40,6 +56,12 @@ def parse_markup_to_json(markup_text):
     Subscribe:: Button text | Share:: Button text | Comment:: Button text |
     SubscribeWidget:: Button >> Description | LaTeX:: E = mc^2 | Footnote:: [1] text
     """
+    registry = registry or block_types
+    # One snapshot per document: registrations made meanwhile apply from the next parse on
+    handlers = registry.handlers
+    timing = registry.timing
+    perf_counter = time.perf_counter
+    state = ParseState()
     
     # Replace semicolons in content with commas to avoid conflicts
     markup_text = markup_text.replace(';', ',')
@@ -48,15 +70,11 @@ def parse_markup_to_json(markup_text):
     blocks = [block.strip() for block in markup_text.split('|') if block.strip()]
     
     content = []
-    footnote_counter = 1
     
     for block in blocks:
         if '::' not in block:
             # Treat as regular text if no type specified
-            content.append({
-                "type": "paragraph",
-                "content": parse_inline_formatting(block)
-            })
+            content.append(Paragraph(parse_inline(block)))
             continue
             
         block_type, block_content = block.split('::', 1)
@@ -65,294 +83,226 @@ def parse_markup_to_json(markup_text):
         
         if not block_content:
             continue
-            
-        if block_type == 'title':
-            content.append({
-                "type": "heading",
-                "attrs": {"level": 1},
-                "content": [{"type": "text", "text": block_content}]
-            })
-            
-        elif block_type == 'subtitle':
-            content.append({
-                "type": "heading", 
-                "attrs": {"level": 2},
-                "content": [{"type": "text", "text": block_content}]
-            })
-            
-        elif block_type in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-            level = int(block_type[1])
-            content.append({
-                "type": "heading",
-                "attrs": {"level": level},
-                "content": [{"type": "text", "text": block_content}]
-            })
-            
-        elif block_type == 'text':
-            content.append({
-                "type": "paragraph",
-                "content": parse_inline_formatting(block_content)
-            })
-            
-        elif block_type == 'quote':
-            content.append({
-                "type": "blockquote",
-                "content": [{
-                    "type": "paragraph",
-                    "content": [{"type": "text", "text": block_content}]
-                }]
-            })
-            
-        elif block_type == 'pullquote':
-            content.append({
-                "type": "pullquote",
-                "attrs": {"align": None, "color": None},
-                "content": [{
-                    "type": "paragraph",
-                    "content": [{"type": "text", "text": block_content}]
-                }]
-            })
-            
-        elif block_type == 'list':
-            items = [item.strip() for item in block_content.split('•') if item.strip()]
-            list_items = []
-            for item in items:
-                list_items.append({
-                    "type": "list_item",
-                    "content": [{
-                        "type": "paragraph",
-                        "content": parse_inline_formatting(item)
-                    }]
-                })
-            content.append({
-                "type": "bullet_list",
-                "content": list_items
-            })
-            
-        elif block_type == 'numberlist':
-            # Split by numbers (1. 2. 3. etc.)
-            items = re.split(r'\d+\.', block_content)[1:]  # Skip first empty element
-            items = [item.strip() for item in items if item.strip()]
-            list_items = []
-            for item in items:
-                list_items.append({
-                    "type": "list_item",
-                    "content": [{
-                        "type": "paragraph",
-                        "content": parse_inline_formatting(item)
-                    }]
-                })
-            content.append({
-                "type": "ordered_list",
-                "attrs": {"start": 1, "order": 1},
-                "content": list_items
-            })
-            
-        elif block_type == 'code':
-            # Format: language | code content
-            parts = block_content.split('|', 1)
-            if len(parts) == 2:
-                language = parts[0].strip() or None
-                code = parts[1].strip()
-            else:
-                language = None
-                code = block_content
-            
-            content.append({
-                "type": "code_block",
-                "attrs": {"language": language},
-                "content": [{"type": "text", "text": code}]
-            })
-            
-        elif block_type == 'rule':
-            content.append({"type": "horizontal_rule"})
-            
-        elif block_type == 'button':
-            # Format: Button Text -> url
-            if '->' in block_content:
-                text, url = block_content.split('->', 1)
-                text = text.strip()
-                url = url.strip()
-            else:
-                text = block_content
-                url = "#"
-            
-            content.append({
-                "type": "button",
-                "attrs": {
-                    "url": url,
-                    "text": text,
-                    "action": None,
-                    "class": None
-                }
-            })
-            
-        elif block_type == 'subscribe':
-            content.append({
-                "type": "button",
-                "attrs": {
-                    "url": "%%checkout_url%%",
-                    "text": block_content,
-                    "action": None,
-                    "class": None
-                }
-            })
-            
-        elif block_type == 'share':
-            content.append({
-                "type": "button", 
-                "attrs": {
-                    "url": "%%share_url%%",
-                    "text": block_content,
-                    "action": None,
-                    "class": None
-                }
-            })
-            
-        elif block_type == 'comment':
-            content.append({
-                "type": "button",
-                "attrs": {
-                    "url": "%%half_magic_comments_url%%",
-                    "text": block_content,
-                    "action": None,
-                    "class": None
-                }
-            })
-            
-        elif block_type == 'subscribewidget':
-            # Format: Button >> Description
-            if '>>' in block_content:
-                button_text, description = block_content.split('>>', 1)
-                button_text = button_text.strip()
-                description = description.strip()
-            else:
-                button_text = block_content
-                description = "Subscribe for more content!"
-                
-            content.append({
-                "type": "subscribeWidget",
-                "attrs": {
-                    "url": "%%checkout_url%%",
-                    "text": button_text,
-                    "language": "en"
-                },
-                "content": [{
-                    "type": "ctaCaption",
-                    "content": [{"type": "text", "text": description}]
-                }]
-            })
-            
-        elif block_type == 'sharewidget':
-            # Format: Button >> Description
-            if '>>' in block_content:
-                button_text, description = block_content.split('>>', 1)
-                button_text = button_text.strip()
-                description = description.strip()
-            else:
-                button_text = block_content
-                description = "Share this post!"
-                
-            content.append({
-                "type": "captionedShareButton",
-                "attrs": {
-                    "url": "%%share_url%%",
-                    "text": button_text
-                },
-                "content": [{
-                    "type": "ctaCaption",
-                    "content": [{"type": "text", "text": description}]
-                }]
-            })
-            
-        elif block_type == 'latex':
-            content.append({
-                "type": "latex_block",
-                "attrs": {
-                    "persistentExpression": block_content,
-                    "id": f"EQUATION_{footnote_counter}"
-                }
-            })
-            footnote_counter += 1
-            
-        elif block_type == 'footnote':
-            # Format: [1] footnote text
-            match = re.match(r'\[(\d+)\]\s*(.*)', block_content)
-            if match:
-                num = int(match.group(1))
-                text = match.group(2)
-                
-                # Add footnote anchor in text (this should be done manually by user in Text:: blocks)
-                # Add footnote definition at end
-                content.append({
-                    "type": "footnote",
-                    "attrs": {"number": num},
-                    "content": [{
-                        "type": "paragraph", 
-                        "content": [{"type": "text", "text": text}]
-                    }]
-                })
-                
-        elif block_type == 'break':
-            content.append({"type": "paragraph"})
+        
+        # Unknown block types are skipped
+        handler = handlers.get(block_type)
+        if handler is None:
+            continue
+        
+        # Every TIMING_SAMPLE-th call is timed and counted for all of them; plain += on purpose,
+        # the counters may undercount slightly under concurrent parsing
+        calls = handler.calls
+        handler.calls = calls + 1
+        if timing and not calls % TIMING_SAMPLE:
+            started = perf_counter()
+            node = handler.func(block_content, state)
+            handler.seconds += (perf_counter() - started) * TIMING_SAMPLE
+        else:
+            node = handler.func(block_content, state)
+        
+        if node is not None:
+            content.append(node)
     
-    return {"type": "doc", "content": content}
+    return Doc(content)
 
 
-def parse_inline_formatting(text):
-    """Parse inline formatting like **bold**, *italic*, [links](url), etc."""
+# Built-in block types - each handler gets the text after "Keyword::" and the ParseState
+
+def _heading_block(level, content, state):
+    return Heading(level, [Text(content)])
+
+
+# partial of a module-level function rather than a closure, so the handlers can be pickled
+# (parse_pool sends them to spawned workers)
+for _keyword, _level in (('title', 1), ('subtitle', 2), ('h1', 1), ('h2', 2), ('h3', 3), ('h4', 4), ('h5', 5),
+                         ('h6', 6)):
+    register_block(_keyword, partial(_heading_block, _level), f"Heading level {_level}")
+
+
+@register_block('text')
+def _text_block(content, state):
+    """Paragraph with inline formatting"""
+    return Paragraph(parse_inline(content))
+
+
+@register_block('quote')
+def _quote_block(content, state):
+    """Blockquote"""
+    return Blockquote([Paragraph([Text(content)])])
+
+
+@register_block('pullquote')
+def _pullquote_block(content, state):
+    """Emphasized quote"""
+    return Pullquote([Paragraph([Text(content)])])
+
+
+@register_block('list')
+def _list_block(content, state):
+    """Bullet list: • Item 1 • Item 2"""
+    items = [item.strip() for item in content.split('•') if item.strip()]
+    return BulletList([ListItem([Paragraph(parse_inline(item))]) for item in items])
+
+
+@register_block('numberlist')
+def _numberlist_block(content, state):
+    """Numbered list: 1. Item 1 1. Item 2"""
+    # Split by numbers (1. 2. 3. etc.)
+    items = NUMBERED_ITEM.split(content)[1:]  # Skip first empty element
+    items = [item.strip() for item in items if item.strip()]
+    return OrderedList([ListItem([Paragraph(parse_inline(item))]) for item in items])
+
+
+@register_block('code')
+def _code_block(content, state):
+    """Code block: language | code"""
+    # Format: language | code content
+    parts = content.split('|', 1)
+    if len(parts) == 2:
+        language = parts[0].strip() or None
+        code = parts[1].strip()
+    else:
+        language = None
+        code = content
+    return CodeBlock(language, [Text(code)])
+
+
+@register_block('rule')
+def _rule_block(content, state):
+    """Horizontal divider"""
+    return HorizontalRule()
+
+
+@register_block('button')
+def _button_block(content, state):
+    """Custom button: Text -> url"""
+    # Format: Button Text -> url
+    if '->' in content:
+        text, url = content.split('->', 1)
+        text = text.strip()
+        url = url.strip()
+    else:
+        text = content
+        url = "#"
+    return Button(url, text)
+
+
+@register_block('subscribe')
+def _subscribe_block(content, state):
+    """Subscribe button"""
+    return Fragment(SUBSCRIBE_BUTTON, (content,))
+
+
+@register_block('share')
+def _share_block(content, state):
+    """Share button"""
+    return Fragment(SHARE_BUTTON, (content,))
+
+
+@register_block('comment')
+def _comment_block(content, state):
+    """Comment button"""
+    return Fragment(COMMENT_BUTTON, (content,))
+
+
+def _widget_text(content, default_description):
+    # Format: Button >> Description
+    if '>>' in content:
+        button_text, description = content.split('>>', 1)
+        return button_text.strip(), description.strip()
+    return content, default_description
+
+
+@register_block('subscribewidget')
+def _subscribewidget_block(content, state):
+    """Subscribe widget: Button >> Description"""
+    return Fragment(SUBSCRIBE_WIDGET, _widget_text(content, "Subscribe for more content!"))
+
+
+@register_block('sharewidget')
+def _sharewidget_block(content, state):
+    """Share widget: Button >> Description"""
+    return Fragment(SHARE_WIDGET, _widget_text(content, "Share this post!"))
+
+
+@register_block('latex')
+def _latex_block(content, state):
+    """Math equation"""
+    node = LatexBlock(content, f"EQUATION_{state.equation_number}")
+    state.equation_number += 1
+    return node
+
+
+@register_block('footnote')
+def _footnote_block(content, state):
+    """Footnote definition: [1] text"""
+    # Format: [1] footnote text
+    match = FOOTNOTE.match(content)
+    if not match:
+        return None
+    # Add footnote anchor in text (this should be done manually by user in Text:: blocks)
+    # Add footnote definition at end
+    return Footnote(int(match.group(1)), [Paragraph([Text(match.group(2))])])
+
+
+@register_block('break')
+def _break_block(content, state):
+    """Empty paragraph"""
+    return Paragraph()
+
+
+BUILTIN_BLOCK_TYPES = frozenset(block_types.handlers)
+
+
+def parse_markup_to_json(markup_text):
+    """Parse user-friendly markup into Substack JSON content structure (plain dicts, see parse_markup)"""
+    return parse_markup(markup_text).to_json()
+
+
+NUMBERED_ITEM = re.compile(r'\d+\.')
+FOOTNOTE = re.compile(r'\[(\d+)\]\s*(.*)')
+
+# Patterns for the different inline formatting, compiled once
+INLINE_PATTERNS = [
+    (re.compile(r'\*\*(.*?)\*\*'), 'strong'),      # **bold**
+    (re.compile(r'\*(.*?)\*'), 'em'),              # *italic*
+    (re.compile(r'~~(.*?)~~'), 'strikethrough'),   # ~~strikethrough~~
+    (re.compile(r'`(.*?)`'), 'code'),              # `code`
+    (re.compile(r'\[([^\]]+)\]\(([^)]+)\)'), 'link')  # [text](url)
+]
+
+
+def parse_inline(text):
+    """Parse inline formatting like **bold**, *italic*, [links](url), etc. into Text nodes"""
     elements = []
     current_pos = 0
     
-    # Patterns for different formatting
-    patterns = [
-        (r'\*\*(.*?)\*\*', 'strong'),      # **bold**
-        (r'\*(.*?)\*', 'em'),              # *italic*  
-        (r'~~(.*?)~~', 'strikethrough'),   # ~~strikethrough~~
-        (r'`(.*?)`', 'code'),              # `code`
-        (r'\[([^\]]+)\]\(([^)]+)\)', 'link')  # [text](url)
-    ]
-    
     # Find all formatting matches
     matches = []
-    for pattern, format_type in patterns:
-        for match in re.finditer(pattern, text):
+    for pattern, format_type in INLINE_PATTERNS:
+        for match in pattern.finditer(text):
             matches.append((match.start(), match.end(), format_type, match))
     
     # Sort by position
     matches.sort(key=lambda x: x[0])
     
     for start, end, format_type, match in matches:
+        # Skip matches inside an earlier one (the *bold* within **bold**)
+        if start < current_pos:
+            continue
+
         # Add text before this match
         if start > current_pos:
             plain_text = text[current_pos:start]
             if plain_text:
-                elements.append({"type": "text", "text": plain_text})
+                elements.append(Text(plain_text))
         
         # Add formatted text
         if format_type == 'link':
-            link_text = match.group(1)
-            link_url = match.group(2)
-            elements.append({
-                "type": "text",
-                "text": link_text,
-                "marks": [{
-                    "type": "link",
-                    "attrs": {
-                        "href": link_url,
-                        "target": "_blank",
-                        "rel": "noopener noreferrer nofollow",
-                        "class": None
-                    }
-                }]
-            })
+            elements.append(Text(match.group(1), (Link(match.group(2)),)))
         else:
-            formatted_text = match.group(1)
-            elements.append({
-                "type": "text", 
-                "text": formatted_text,
-                "marks": [{"type": format_type}]
-            })
+            # Marks without attributes are shared instances
+            elements.append(Text(match.group(1), (MARKS[format_type],)))
         
         current_pos = end
     
@@ -360,88 +310,136 @@ def parse_inline_formatting(text):
     if current_pos < len(text):
         remaining_text = text[current_pos:]
         if remaining_text:
-            elements.append({"type": "text", "text": remaining_text})
-    
-    # If no formatting found, return simple text
-    if not elements:
-        elements = [{"type": "text", "text": text}]
+            elements.append(Text(remaining_text))
     
     # CRITICAL FIX: Remove empty text elements that break Substack
-    elements = [elem for elem in elements if elem.get('text', '').strip() != '']
+    elements = [elem for elem in elements if elem.text.strip() != '']
     
-    # If all elements were empty, return simple text
+    # If no formatting found or all elements were empty, return simple text
     if not elements:
-        elements = [{"type": "text", "text": text}]
+        elements = [Text(text)]
     
     return elements
 
 
-def create_markup_draft(title, markup_content, subtitle=""):
+def parse_inline_formatting(text):
+    """Parse inline formatting like **bold**, *italic*, [links](url), etc. (plain dicts)"""
+    return [element.to_json() for element in parse_inline(text)]
+
+
+def create_markup_draft(title, markup_content, subtitle="", account=None):
     """Create a draft from user-friendly markup"""
-    content_json = parse_markup_to_json(markup_content)
-    return create_draft(title, subtitle, content_json=content_json)
+    return create_draft(title, subtitle, content_json=parse_markup(markup_content), account=account)
 
 
-def create_draft(title, subtitle="", content_text="", content_json=None):
-    """Create a draft using the working method"""
-    
-    print(f"Creating draft: '{title}'")
-    if subtitle:
-        print(f"With subtitle: '{subtitle}'")
-    if content_json:
-        print(f"With JSON content: {len(content_json.get('content', []))} blocks")
-        print(f"Content preview: {str(content_json)[:200]}...")
-    elif content_text:
-        print(f"With text content: {len(content_text)} characters")
+def create_markdown_draft(title, markdown_content, subtitle="", account=None):
+    """Create a draft from Markdown (a string, open file or iterable of lines, see markdown_parser)"""
+    return create_draft(title, subtitle, content_json=parse_markdown(markdown_content), account=account)
+
+
+def build_draft_data(reference_draft, title, subtitle, draft_body):
+    """POST /api/v1/drafts payload as a dict (create_draft sends encode_draft_payload's bytes instead)"""
+    draft_data = {key: value for key, value in reference_draft.items() if key not in REMOVED_FIELDS}
+    draft_data.update(draft_fields(reference_draft, title, subtitle, draft_body))
+    return draft_data
+
+
+def find_reference_draft(account=None):
+    """
+    The unpublished draft new drafts copy their settings from (as a dict), or None
+    Callers creating many drafts fetch it once and pass it to create_draft(reference_draft=...)
+    """
+    session, pub_url = _account_session(account)
+    user_id = account.user_id if account else None
     
-    # Get existing drafts for reference
-    drafts_response = session.get(f"{pub_url}/api/v1/drafts")
-    if drafts_response.status_code != 200:
-        print("Error: Can't get drafts")
-        return None
-        
-    drafts = drafts_response.json()
-    if len(drafts) == 0:
-        print("Error: No existing drafts found. Create one manually first.")
+    # Get existing drafts for reference - the listing is streamed and we stop at the first match
+    drafts_seen = 0
+    reference_id = None
+    try:
+        # Get reference draft structure - use UNPUBLISHED draft
+        with timed("create_draft", "find_reference", user_id):
+            for draft in iter_drafts(session, pub_url, fields=('id', 'is_published')):
+                drafts_seen += 1
+                if not draft.get('is_published', False):
+                    reference_id = draft["id"]
+                    break
+    except ListingError:
+        logger.error("Can't get drafts")
         return None
     
-    # Get reference draft structure - use UNPUBLISHED draft
-    reference_id = None
-    for draft in drafts:
-        if not draft.get('is_published', False):
-            reference_id = draft["id"]
-            break
+    if drafts_seen == 0:
+        logger.error("No existing drafts found. Create one manually first.")
+        return None
     
     if not reference_id:
-        print("Error: No unpublished draft found for reference")
+        logger.error("No unpublished draft found for reference")
         return None
     
-    ref_response = session.get(f"{pub_url}/api/v1/drafts/{reference_id}")
+    with timed("create_draft", "get_reference", user_id):
+        ref_response = session.get(f"{pub_url}/api/v1/drafts/{reference_id}")
     if ref_response.status_code != 200:
-        print("Error: Can't get reference draft")
+        logger.error("Can't get reference draft")
         return None
     
-    reference_draft = ref_response.json()
-    print(f"Using unpublished draft {reference_id} as reference")
-    
-    # Create new draft data
-    draft_data = reference_draft.copy()
+    logger.debug("Using unpublished draft %s as reference", reference_id)
+    return ref_response.json()
+
+def _mirror_drafts(session, pub_url, user_id):
+    # Drafts created before this process (or in the editor) are indexed from the listing, once per account
+    try:
+        with timed("create_draft", "mirror", user_id):
+            draft_index.index.mirror(iter_drafts(session, pub_url, fields=('id', 'is_published', 'draft_title',
+                                                                          'draft_body'), unpublished_only=True),
+                                     user_id)
+    except ListingError:
+        logger.warning("Can't list drafts of user %s, duplicates of older drafts are not detected", user_id)
+
+@traced()
+def create_draft(title, subtitle="", content_text="", content_json=None, account=None, validate=True,
+                 reference_draft=None, dedupe=None):
+    """
+    Create a draft using the working method
+    content_json: a dict, a content_nodes.Doc or draft_body JSON text (used as is)
+    content_json is checked against the content types reference first (validate=False skips
+    that for documents already checked); an invalid document is never sent
+    reference_draft: from find_reference_draft(), looked up on every call if not given
+    dedupe: what to do if this account already has a draft with the same title and content
+    (draft_index): "return" it (marked 'duplicate': True), "reject" (raises DuplicateDraft) or
+    "off"; default DEDUPE_POLICY. The indexed draft is read back first: if it was deleted, published
+    or edited since, its entry is dropped and the draft is created
+    """
+    session, pub_url = _account_session(account)
+    user_id = account.user_id if account else None
+    policy = dedupe or draft_index.index.policy
     
-    # Remove fields that shouldn't be copied
-    remove_fields = ['id', 'uuid', 'created_at', 'updated_at', 'slug', 'draft_created_at', 'draft_updated_at']
-    for field in remove_fields:
-        draft_data.pop(field, None)
+    if content_json and validate:
+        with timed("create_draft", "validate", user_id):
+            errors = validate_document(content_json)
+        if errors:
+            logger.error("Invalid document, not sent: %s", "; ".join(errors))
+            return None
     
-    # Set our new values
-    draft_data['draft_title'] = title
-    draft_data['draft_subtitle'] = subtitle if subtitle else None
+    logger.info("Creating draft: '%s'", title)
+    if subtitle:
+        logger.debug("With subtitle: '%s'", subtitle)
+    if isinstance(content_json, str):
+        logger.debug("With JSON content: %d characters", len(content_json))
+    elif content_json:
+        blocks = content_json.content if isinstance(content_json, Node) else content_json.get('content', [])
+        logger.debug("With JSON content: %d blocks", len(blocks))
+        # %.200s renders the document only if debug output is actually enabled
+        logger.debug("Content preview: %.200s...", Lazy(lambda: content_json.to_json() if isinstance(content_json, Node) else content_json))
+    elif content_text:
+        logger.debug("With text content: %d characters", len(content_text))
     
     # Handle content
     if content_json:
         # Use provided JSON structure
-        content_str = json.dumps(content_json)
-        print(f"Setting draft_body to JSON with {len(content_str)} characters")
-        draft_data['draft_body'] = content_str
+        with timed("create_draft", "encode", user_id):
+            # A node tree serializes itself without building the intermediate dicts; the hashes are
+            # for the dedupe index and for diffing the first update_draft against
+            content_str, hashes = encode_and_hash(content_json)
+        logger.debug("Setting draft_body to JSON with %d characters", len(content_str))
     elif content_text:
         # Create simple paragraph from text
         content_structure = {
@@ -453,70 +451,184 @@ def create_draft(title, subtitle="", content_text="", content_json=None):
                 }
             ]
         }
-        content_str = json.dumps(content_structure)
-        print(f"Setting draft_body to text paragraph with {len(content_str)} characters")
-        draft_data['draft_body'] = content_str
+        content_str, hashes = encode_and_hash(content_structure)
+        logger.debug("Setting draft_body to text paragraph with %d characters", len(content_str))
     else:
         # Empty content
-        print("Setting draft_body to empty content")
-        draft_data['draft_body'] = '{"type":"doc","content":[]}'
-    
-    # Fix required fields
-    draft_data['should_send_email'] = True
-    draft_data['section_chosen'] = False  
-    draft_data['subscriber_set_id'] = 1
-    
-    # THE KEY FIX: Set byline id = user_id
-    draft_bylines = []
-    for byline in reference_draft.get('postBylines', []):
-        fixed_byline = {
-            'user_id': byline['user_id'],
-            'is_draft': True,
-            'is_guest': byline.get('is_guest', False),
-            'id': byline['user_id']  # MAGIC FIX: id = user_id
-        }
-        draft_bylines.append(fixed_byline)
+        logger.debug("Setting draft_body to empty content")
+        content_str = '{"type":"doc","content":[]}'
+        hashes = hash_document(content_str)
+    
+    # The same title and content created before for this account (one dict lookup)
+    index_key = None
+    if policy != draft_index.OFF:
+        if not draft_index.index.is_mirrored(user_id):
+            _mirror_drafts(session, pub_url, user_id)
+        index_key = draft_index.index.key(user_id, hashes, title)
+        existing_id = draft_index.index.lookup(index_key)
+        if existing_id is not None:
+            with timed("create_draft", "dedupe_check", user_id):
+                response = session.get(f"{pub_url}/api/v1/drafts/{existing_id}")
+            if response.status_code not in (200, 404):
+                logger.error("FAILED to read indexed draft %s: Status %s, response: %s",
+                             existing_id, response.status_code, response.text)
+                return None
+            existing = response.json() if response.status_code == 200 else None
+            if existing is None or not draft_index.index.matches(index_key, existing):
+                logger.info("Indexed draft %s was deleted, published or edited, creating a new one", existing_id)
+                draft_index.index.forget(user_id, existing_id)
+            elif policy == draft_index.REJECT:
+                raise draft_index.DuplicateDraft(existing_id, title)
+            else:
+                logger.info("Draft %s has the same title and content, not creating another", existing_id)
+                _remember_draft((user_id, existing_id), hashes, existing.get('draft_title'),
+                                existing.get('draft_subtitle'))
+                existing['duplicate'] = True
+                return existing
+    
+    if reference_draft is None:
+        reference_draft = find_reference_draft(account)
+        if reference_draft is None:
+            return None
     
-    draft_data['draft_bylines'] = draft_bylines
+    # Request body bytes in one pass: reference fields plus the already encoded draft_body
+    with timed("create_draft", "payload", user_id):
+        body = encode_draft_payload(reference_draft, title, subtitle, content_str)
     
     # Create the draft
-    print(f"Sending POST request to create draft...")
-    print(f"Draft data keys: {list(draft_data.keys())}")
+    logger.debug("Sending POST request to create draft: %d bytes (%s)", len(body), PAYLOAD_BACKEND)
     
-    response = session.post(f"{pub_url}/api/v1/drafts", json=draft_data)
+    with timed("create_draft", "post", user_id):
+        response = session.post(f"{pub_url}/api/v1/drafts", data=body, headers=JSON_HEADERS)
     
     if response.status_code == 200:
         draft = response.json()
-        print(f"SUCCESS! Draft created with ID: {draft['id']}")
-        print(f"Title: {draft.get('draft_title')}")
-        print(f"Subtitle: {draft.get('draft_subtitle')}")
+        logger.info("SUCCESS! Draft created with ID: %s (title: %s, subtitle: %s)",
+                    draft['id'], draft.get('draft_title'), draft.get('draft_subtitle'))
+        if index_key is not None:
+            draft_index.index.add(index_key, draft['id'])
+        _remember_draft((user_id, draft['id']), hashes, draft.get('draft_title', title),
+                        draft.get('draft_subtitle', subtitle or None))
         
-        # Check if content was actually saved
-        if 'draft_body' in draft:
+        # Check if content was actually saved - decoding the body is only worth it when debugging
+        if logger.isEnabledFor(logging.DEBUG) and isinstance(draft.get('draft_body'), str):
             body_content = draft['draft_body']
-            if isinstance(body_content, str):
-                try:
-                    parsed_body = json.loads(body_content)
-                    content_blocks = parsed_body.get('content', [])
-                    print(f"Draft body contains {len(content_blocks)} content blocks")
-                    for i, block in enumerate(content_blocks):
-                        print(f"  Block {i}: {block.get('type', 'unknown')}")
-                except Exception as e:
-                    print(f"Draft body is string with {len(body_content)} characters")
-                    print(f"JSON parse error: {e}")
+            try:
+                content_blocks = json.loads(body_content).get('content', [])
+                logger.debug("Draft body contains %d content blocks: %s", len(content_blocks),
+                             [block.get('type', 'unknown') for block in content_blocks])
+            except Exception as e:
+                logger.debug("Draft body is string with %d characters (JSON parse error: %s)",
+                             len(body_content), e)
         
         return draft
     else:
-        print(f"FAILED: Status {response.status_code}")
-        print(f"Response: {response.text}")
+        logger.error("FAILED: Status %s, response: %s", response.status_code, response.text)
         return None
 
-def create_comprehensive_test_draft(title="Complete Content Test", subtitle="Testing all Substack content types"):
+# Content hashes, title and subtitle of drafts last written by this process, so an update does not
+# have to read the draft back first: (user_id, draft_id) -> (DocHashes, title, subtitle)
+# Edits made elsewhere (e.g. in the Substack editor) are not seen; update_draft(refresh=True) reads them
+KNOWN_DRAFTS_MAX = 1000
+_known_drafts = OrderedDict()
+_known_lock = threading.Lock()
+
+def _remember_draft(key, hashes, title, subtitle):
+    with _known_lock:
+        _known_drafts[key] = (hashes, title, subtitle)
+        _known_drafts.move_to_end(key)
+        while len(_known_drafts) > KNOWN_DRAFTS_MAX:
+            _known_drafts.popitem(last=False)
+
+@traced()
+def update_draft(draft_id, title=None, subtitle=None, content_json=None, account=None, validate=True,
+                 refresh=False):
+    """
+    Update an existing draft, sending only what differs from its current state
+    title/subtitle/content_json: None keeps the current value; content_json as for create_draft
+    Content is compared by hash (doc_diff): nothing is sent when everything is unchanged
+    Returns an API-compatible dict with "changed", "updated_fields" and a block-level "summary"
+    """
+    session, pub_url = _account_session(account)
+    user_id = account.user_id if account else None
+    key = (user_id, draft_id)
+    
+    if content_json is not None and validate:
+        with timed("update_draft", "validate", user_id):
+            errors = validate_document(content_json)
+        if errors:
+            logger.error("Invalid document, not sent: %s", "; ".join(errors))
+            return {"success": False, "message": f"Invalid document: {'; '.join(errors[:3])}", "error_code": 400}
+    
+    with _known_lock:
+        known = None if refresh else _known_drafts.get(key)
+    if known is None:
+        with timed("update_draft", "get_current", user_id):
+            response = session.get(f"{pub_url}/api/v1/drafts/{draft_id}")
+        if response.status_code != 200:
+            logger.error("Can't get draft %s: %s", draft_id, response.text)
+            return {"success": False, "message": f"Failed to get draft {draft_id}: {response.text}",
+                    "error_code": response.status_code}
+        current = response.json()
+        with timed("update_draft", "hash", user_id):
+            known = (hash_document(current.get('draft_body')), current.get('draft_title'), current.get('draft_subtitle'))
+        if not current.get('is_published'):
+            draft_index.index.add(draft_index.index.key(user_id, known[0], known[1]), draft_id)
+    old_hashes, old_title, old_subtitle = known
+    
+    with timed("update_draft", "diff", user_id):
+        new_hashes = hash_document(content_json) if content_json is not None else old_hashes
+        summary = change_summary(old_hashes, new_hashes)
+    
+    fields = {}
+    if title is not None and title != old_title:
+        fields['draft_title'] = title
+    if subtitle is not None and (subtitle or None) != old_subtitle:
+        fields['draft_subtitle'] = subtitle or None
+    if summary['changed']:
+        if isinstance(content_json, str):
+            fields['draft_body'] = content_json
+        elif isinstance(content_json, Node):
+            fields['draft_body'] = content_json.dumps()
+        else:
+            fields['draft_body'] = json.dumps(content_json)
+    
+    if not fields:
+        logger.info("Draft %s unchanged, nothing sent", draft_id)
+        _remember_draft(key, old_hashes, old_title, old_subtitle)
+        return {"success": True, "draft_id": draft_id, "changed": False, "updated_fields": [],
+                "summary": summary, "message": f"Draft {draft_id} unchanged"}
+    
+    with timed("update_draft", "put", user_id):
+        response = session.put(f"{pub_url}/api/v1/drafts/{draft_id}", data=encode_json(fields), headers=JSON_HEADERS)
+    if response.status_code != 200:
+        logger.error("FAILED to update draft %s: %s", draft_id, response.text)
+        return {"success": False, "message": f"Failed to update draft {draft_id}: {response.text}",
+                "error_code": response.status_code}
+    
+    draft = response.json()
+    new_title = fields.get('draft_title', old_title)
+    _remember_draft(key, new_hashes, new_title, fields.get('draft_subtitle', old_subtitle))
+    if 'draft_title' in fields or 'draft_body' in fields:
+        # Re-keyed under the new title/content (the old entry is replaced)
+        draft_index.index.add(draft_index.index.key(user_id, new_hashes, new_title), draft_id)
+    logger.info("Draft %s updated: %s (+%d -%d ~%d blocks)", draft_id, ", ".join(fields),
+                summary['added'], summary['removed'], summary['modified'])
+    return {"success": True, "draft_id": draft_id, "changed": True, "updated_fields": list(fields),
+            "summary": summary, "message": f"Draft {draft_id} updated ({', '.join(fields)})", "draft": draft}
+
+def create_comprehensive_test_draft(title="Complete Content Test", subtitle="Testing all Substack content types",
+                                   account=None):
     """Create a comprehensive test draft with ALL discovered content types"""
     
-    user_id = os.getenv("USER_ID", "your_user_id")  # Get from env
+    user_id = account.user_id if account else os.getenv("USER_ID", "your_user_id")  # Get from env
     
-    comprehensive_content = {
+    return create_draft(title, subtitle, content_json=comprehensive_test_document(user_id), account=account)
+
+
+def comprehensive_test_document(user_id="your_user_id"):
+    """The document of create_comprehensive_test_draft (user_id is the direct message button's userName)"""
+    return {
         "type": "doc",
         "content": [
             # H1-H6 Headings
@@ -781,15 +893,16 @@ def create_comprehensive_test_draft(title="Complete Content Test", subtitle="Tes
             }
         ]
     }
-    
-    return create_draft(title, subtitle, content_json=comprehensive_content)
 
 
-def create_rich_draft(title, subtitle=""):
+def create_rich_draft(title, subtitle="", account=None):
     """Create a draft with basic rich formatting examples"""
-    
-    # Example rich content structure
-    rich_content = {
+    return create_draft(title, subtitle, content_json=rich_document(), account=account)
+
+
+def rich_document():
+    """The document of create_rich_draft: a heading, bold/italic text and a link"""
+    return {
         "type": "doc",
         "content": [
             {
@@ -811,16 +924,18 @@ def create_rich_draft(title, subtitle=""):
                 "type": "paragraph",
                 "content": [
                     {"type": "text", "text": "Check out "},
-                    {"type": "text", "text": "this link", "marks": [{"type": "link", "attrs": {"href": "https://substack.com"}}]},
+                    {"type": "text", "text": "this link", "marks": [{"type": "link", "attrs": {
+                        "href": "https://substack.com", "target": "_blank", "rel": "noopener noreferrer nofollow",
+                        "class": None}}]},
                     {"type": "text", "text": "!"}
                 ]
             }
         ]
     }
-    
-    return create_draft(title, subtitle, content_json=rich_content)
 
 if __name__ == "__main__":
+    setup_logging()
+    
     print("=== SUBSTACK DRAFT CREATION ===")
     print("\nChoose draft type:")
     print("1. Simple text draft (interactive)")
@@ -900,8 +1015,8 @@ if __name__ == "__main__":
             print(f"Final markup content: {markup_content}")
             
             # Parse and show structure before creating
-            content_json = parse_markup_to_json(markup_content)
-            print(f"Parsed {len(content_json['content'])} content blocks")
+            document = parse_markup(markup_content)
+            print(f"Parsed {len(document.content)} content blocks")
             
             draft = create_markup_draft(title, markup_content, subtitle)
             
@@ -0,0 +1,139 @@
+# draft_index.py - Index of drafts by (account, content hash, title) to catch duplicate creates
+import json
+import logging
+import os
+import threading
+
+from doc_diff import hash_document, content_key
+
+logger = logging.getLogger(__name__)
+
+RETURN = "return"  # creating a duplicate returns the existing draft instead
+REJECT = "reject"  # creating a duplicate raises DuplicateDraft
+OFF = "off"        # always create (default; pass dedupe= per call or set DEDUPE_POLICY)
+POLICIES = (RETURN, REJECT, OFF)
+
+DEDUPE_POLICY = os.getenv("DEDUPE_POLICY", OFF).lower()
+# JSON Lines file the index is kept in across restarts (unset = memory only)
+DRAFT_INDEX_FILE = os.getenv("DRAFT_INDEX_FILE")
+
+
+class DuplicateDraft(ValueError):
+    """Raised by create_draft under the reject policy; draft_id is the existing draft"""
+
+    def __init__(self, draft_id, title):
+        super().__init__(f"Draft {draft_id} already has this title and content: '{title}'")
+        self.draft_id = draft_id
+
+
+def normalize_title(title):
+    return " ".join((title or "").split())
+
+
+class DraftIndex:
+    """
+    (user_id, normalized content hash, normalized title) -> draft id, one dict lookup per create
+    Entries are added for drafts created or read back through this process and for the drafts an
+    account already has (mirrored from its listing once, before its first lookup), and dropped
+    when a draft's content changes or it is published. With a file every change is appended to it
+    and replayed on start
+    """
+
+    def __init__(self, policy=DEDUPE_POLICY, file=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown dedupe policy {policy!r} (use one of {', '.join(POLICIES)})")
+        self.policy = policy
+        self.file = file
+        self.keys = {}    # key -> draft id
+        self.drafts = {}  # (user_id, draft id) -> key, to drop stale keys
+        self.mirrored = set()  # user_ids whose existing drafts were indexed
+        self.lock = threading.Lock()
+        if file and os.path.exists(file):
+            self._load()
+
+    @staticmethod
+    def key(user_id, hashes, title):
+        """Index key of a draft; hashes is doc_diff.DocHashes of its content"""
+        return (user_id, content_key(hashes), normalize_title(title))
+
+    def lookup(self, key):
+        return self.keys.get(key)
+
+    def matches(self, key, draft):
+        """Whether a draft read back from Substack is unpublished and still has the title and content of key"""
+        if draft.get('is_published'):
+            return False
+        try:
+            hashes = hash_document(draft.get('draft_body'))
+        except ValueError:
+            return False
+        return self.key(key[0], hashes, draft.get('draft_title')) == key
+
+    def add(self, key, draft_id):
+        with self.lock:
+            self._set(key, draft_id)
+            self._append({'user_id': key[0], 'content': key[1], 'title': key[2], 'draft_id': draft_id})
+
+    def mirror(self, drafts, user_id=None):
+        """
+        Index an account's existing drafts (dicts with id, draft_title and draft_body, e.g. from a
+        listing; published drafts and drafts listed without a body are skipped)
+        """
+        count = 0
+        for draft in drafts:
+            if draft.get('is_published') or not draft.get('draft_body'):
+                continue
+            try:
+                hashes = hash_document(draft['draft_body'])
+            except ValueError:
+                continue
+            key = self.key(user_id, hashes, draft.get('draft_title'))
+            if self.keys.get(key) != draft['id']:
+                self.add(key, draft['id'])
+            count += 1
+        with self.lock:
+            self.mirrored.add(user_id)
+        logger.info("Indexed %d existing drafts for user %s", count, user_id)
+        return count
+
+    def is_mirrored(self, user_id):
+        return user_id in self.mirrored
+
+    def forget(self, user_id, draft_id):
+        """Drop the entry of a draft (its content changed, it was published or deleted)"""
+        with self.lock:
+            if self._drop(user_id, draft_id):
+                self._append({'user_id': user_id, 'forget': draft_id})
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _drop(self, user_id, draft_id):
+        key = self.drafts.pop((user_id, draft_id), None)
+        if key is not None and self.keys.get(key) == draft_id:
+            del self.keys[key]
+            return True
+        return False
+
+    def _set(self, key, draft_id):
+        self._drop(key[0], draft_id)
+        self.keys[key] = draft_id
+        self.drafts[(key[0], draft_id)] = key
+
+    def _append(self, entry):
+        if self.file:
+            with open(self.file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def _load(self):
+        with open(self.file, encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if 'forget' in entry:
+                    self._drop(entry['user_id'], entry['forget'])
+                else:
+                    self._set((entry['user_id'], entry['content'], entry['title']), entry['draft_id'])
+        logger.debug("Loaded %d indexed drafts from %s", len(self.keys), self.file)
+
+
+index = DraftIndex(file=DRAFT_INDEX_FILE)
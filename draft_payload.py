@@ -0,0 +1,82 @@
+# draft_payload.py - One-pass encoding of the draft create request body
+import json
+from json.encoder import encode_basestring_ascii as _encode_str
+
+# orjson is optional (pip install orjson); without it the standard json module is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Reference draft fields that must not be copied into a new draft
+REMOVED_FIELDS = ('id', 'uuid', 'created_at', 'updated_at', 'slug', 'draft_created_at', 'draft_updated_at')
+
+
+def draft_fields(reference_draft, title, subtitle, draft_body):
+    """The fields a new draft sets on top of the reference draft, in the order they are set"""
+    # THE KEY FIX: Set byline id = user_id
+    draft_bylines = []
+    for byline in reference_draft.get('postBylines', []):
+        draft_bylines.append({
+            'user_id': byline['user_id'],
+            'is_draft': True,
+            'is_guest': byline.get('is_guest', False),
+            'id': byline['user_id']  # MAGIC FIX: id = user_id
+        })
+
+    return {
+        'draft_title': title,
+        'draft_subtitle': subtitle if subtitle else None,
+        'draft_body': draft_body,
+        # Fix required fields
+        'should_send_email': True,
+        'section_chosen': False,
+        'subscriber_set_id': 1,
+        'draft_bylines': draft_bylines
+    }
+
+
+def encode_json(value):
+    """Compact JSON bytes of value with the fastest available backend"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # Not serializable by orjson (e.g. integers over 64 bits) - the json module handles it
+            pass
+    return json.dumps(value, separators=(',', ':'), allow_nan=False).encode('ascii')
+
+
+def encode_string(text):
+    """JSON string literal of text as bytes (the escaping pass over a pre-encoded draft_body)"""
+    if orjson is not None:
+        return orjson.dumps(text)
+    return _encode_str(text).encode('ascii')
+
+
+def encode_draft_payload(reference_draft, title, subtitle, draft_body):
+    """
+    POST /api/v1/drafts body as bytes, written in one pass
+    Fields come straight from the reference draft (no copy of it is made) and draft_body, which
+    already is a JSON string, is spliced in with a single escaping pass instead of being encoded
+    again together with the whole payload. Key order matches build_draft_data()
+    """
+    fields = draft_fields(reference_draft, title, subtitle, draft_body)
+    items = [(key, fields.pop(key) if key in fields else value)
+             for key, value in reference_draft.items() if key not in REMOVED_FIELDS]
+    items.extend(fields.items())
+
+    # One join at the end: the large encoded draft_body is copied exactly once more
+    parts = [b'{']
+    for key, value in items:
+        if len(parts) > 1:
+            parts.append(b',')
+        parts.append(encode_string(key))
+        parts.append(b':')
+        parts.append(encode_string(value) if key == 'draft_body' else encode_json(value))
+    parts.append(b'}')
+    return b''.join(parts)
@@ -0,0 +1,148 @@
+# draft_preview.py - Content previews straight from the raw draft_body JSON string
+import json
+import re
+import threading
+from collections import OrderedDict
+
+PREVIEW_LENGTH = 100
+CACHE_SIZE = 4096
+
+# JSON tokens: strings (kept raw, decoded only when needed), punctuation and bare literals
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]:,]|[^\s{}\[\]:,"]+')
+
+# Frame roles while walking doc -> content[] -> block -> content[] -> inline node
+_DOC, _DOC_CONTENT, _BLOCK, _BLOCK_CONTENT, _INLINE, _OTHER = range(6)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def scan_first_text(draft_body, max_chars=PREVIEW_LENGTH):
+    """
+    Find the first text node of the first paragraph block that has one, without decoding the document
+    Scans the raw JSON incrementally and stops at the first match.
+    Returns (text[:max_chars], block_count) - block_count is only complete when no text was found
+    Raises ValueError if draft_body is not a JSON object
+    """
+    if not draft_body.lstrip().startswith('{'):
+        raise ValueError("draft_body is not a JSON object")
+
+    # Each frame: [role, is_object, expecting_key, current_key, node_type, text, candidate]
+    stack = []
+    block_count = 0
+
+    for match in _TOKEN.finditer(draft_body):
+        token = match.group()
+        top = stack[-1] if stack else None
+
+        if token == '{':
+            if top is None:
+                role = _DOC
+            elif top[0] == _DOC_CONTENT:
+                role = _BLOCK
+                block_count += 1
+            elif top[0] == _BLOCK_CONTENT:
+                role = _INLINE
+            else:
+                role = _OTHER
+            stack.append([role, True, True, None, None, None, None])
+
+        elif token == '[':
+            role = _OTHER
+            if top is not None and top[3] == '"content"':
+                if top[0] == _DOC:
+                    role = _DOC_CONTENT
+                elif top[0] == _BLOCK:
+                    role = _BLOCK_CONTENT
+            stack.append([role, False, False, None, None, None, None])
+
+        elif token == '}' or token == ']':
+            if not stack:
+                raise ValueError("Unbalanced draft_body JSON")
+            frame = stack.pop()
+            if not stack:
+                # End of the document
+                break
+
+            if frame[0] == _INLINE and frame[4] == 'text' and frame[5]:
+                # parent is the block's content array, its parent the block itself
+                block = stack[-2]
+                if block[6] is None:
+                    block[6] = frame[5]
+                if block[4] == 'paragraph':
+                    return json.loads(block[6])[:max_chars], block_count
+
+            elif frame[0] == _BLOCK and frame[4] == 'paragraph' and frame[6] is not None:
+                # The block's "type" came after its content
+                return json.loads(frame[6])[:max_chars], block_count
+
+        elif top is None:
+            raise ValueError("Unexpected token in draft_body JSON")
+
+        elif token == ':':
+            top[2] = False
+
+        elif token == ',':
+            if top[1]:
+                top[2] = True
+
+        elif top[1]:
+            if top[2]:
+                top[3] = token
+            elif top[3] == '"type"' and top[0] in (_BLOCK, _INLINE):
+                top[4] = json.loads(token)
+            elif top[3] == '"text"' and top[0] == _INLINE:
+                # Decoded only if this node turns out to be the preview
+                top[5] = token if token != '""' else None
+
+    if stack:
+        raise ValueError("Truncated draft_body JSON")
+    return "", block_count
+
+
+def get_first_text(draft, max_chars=PREVIEW_LENGTH):
+    """
+    Memoized scan_first_text for a draft dict, keyed by (id, draft_updated_at)
+    Returns (text, block_count); raises ValueError for unreadable bodies
+    """
+    draft_body = draft.get('draft_body')
+    if not draft_body:
+        return "", 0
+
+    key = (draft.get('id'), draft.get('draft_updated_at'), max_chars)
+    cacheable = key[0] is not None and key[1] is not None
+
+    if cacheable:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+
+    result = scan_first_text(draft_body, max_chars)
+
+    if cacheable:
+        with _cache_lock:
+            _cache[key] = result
+            if len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    return result
+
+
+def clear_cache():
+    """Forget all memoized previews"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def content_preview(draft, max_chars=PREVIEW_LENGTH):
+    """Get a one-line content preview for draft listings"""
+    if not draft.get('draft_body'):
+        return "No content"
+    try:
+        text, block_count = get_first_text(draft, max_chars)
+    except ValueError:
+        return "Content available"
+    if text:
+        return text
+    return f"{block_count} content blocks" if block_count else "No content"
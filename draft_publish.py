@@ -1,59 +1,67 @@
 # draft_publish.py - Publish Substack drafts
 import os
-import json
-import requests
+import itertools
+import logging
 from dotenv import load_dotenv
+from substack_session import build_session
+import listing
+from listing import ListingError
+from draft_preview import get_first_text
+from log_config import setup_logging
+from tracing import traced
+import draft_index
 
 load_dotenv()
 
-# Setup session
-session = requests.Session()
-session.headers.update({
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-    "Referer": os.getenv("PUBLICATION_URL"),
-    "Content-Type": "application/json"
-})
+logger = logging.getLogger(__name__)
 
-# Set cookies
-cookie_map = {
-    "sid": os.getenv("SID"),
-    "substack.lli": os.getenv("SUBSTACK_LLI"),
-    "substack.sid": os.getenv("SUBSTACK_SID")
-}
-for k, v in cookie_map.items():
-    if v:
-        session.cookies.set(k, v, domain=".substack.com")
+# Setup session
+session = build_session()
 
 pub_url = os.getenv("PUBLICATION_URL")
 
-def get_drafts():
+def _account_session(account=None):
+    """Session and publication URL to use: the given Account or the .env account of this module"""
+    if account is not None:
+        return account.session, account.pub_url
+    return session, pub_url
+
+def iter_drafts(fields=None, unpublished_only=False, account=None):
+    """
+    Iterate over drafts one at a time, parsing the listing incrementally
+    fields limits each draft to those keys (e.g. ('id', 'draft_title')) so draft_body is never kept
+    Raises ListingError if the drafts can't be fetched
+    """
+    session, pub_url = _account_session(account)
+    return listing.iter_drafts(session, pub_url, fields=fields, unpublished_only=unpublished_only)
+
+def get_drafts(account=None):
     """Get all drafts"""
-    response = session.get(f"{pub_url}/api/v1/drafts")
-    if response.status_code == 200:
-        drafts = response.json()
-        print(f"Found {len(drafts)} drafts")
-        return drafts
-    else:
-        print(f"Error getting drafts: {response.text}")
+    try:
+        drafts = list(iter_drafts(account=account))
+    except ListingError as e:
+        logger.error("Error getting drafts: %s", e)
         return []
+    logger.info("Found %d drafts", len(drafts))
+    return drafts
+
+def iter_unpublished_drafts(fields=None, account=None):
+    """Iterate over unpublished drafts only (raises ListingError on failure)"""
+    return iter_drafts(fields=fields, unpublished_only=True, account=account)
 
-def get_unpublished_drafts():
+def get_unpublished_drafts(account=None):
     """Get only unpublished drafts for API"""
-    response = session.get(f"{pub_url}/api/v1/drafts")
-    if response.status_code == 200:
-        drafts = response.json()
-        # Filter only unpublished drafts
-        unpublished = [draft for draft in drafts if not draft.get('is_published', False)]
-        return unpublished
-    else:
+    try:
+        return list(iter_unpublished_drafts(account=account))
+    except ListingError:
         return None
 
-def publish_draft(draft_id, send_email=True, audience="everyone"):
+@traced()
+def publish_draft(draft_id, send_email=True, audience="everyone", account=None):
     """Publish a draft immediately"""
+    session, pub_url = _account_session(account)
     
-    print(f"Publishing draft {draft_id}...")
-    print(f"Send email: {send_email}")
-    print(f"Audience: {audience}")
+    logger.info("Publishing draft %s (send email: %s, audience: %s)", draft_id, send_email, audience)
     
     # Publish the draft
     publish_data = {
@@ -65,13 +73,15 @@ def publish_draft(draft_id, send_email=True, audience="everyone"):
     
     if response.status_code == 200:
         result = response.json()
-        print(f"SUCCESS! Draft {draft_id} published!")
+        logger.info("SUCCESS! Draft %s published!", draft_id)
+        # A published post is no longer a draft to return for duplicate creates
+        draft_index.index.forget(account.user_id if account else None, draft_id)
         
         # Get the published post URL if available
         post_url = None
         if 'slug' in result:
             post_url = f"{pub_url}/p/{result['slug']}"
-            print(f"Post URL: {post_url}")
+            logger.info("Post URL: %s", post_url)
         
         # Return API-compatible format
         return {
@@ -82,109 +92,134 @@ def publish_draft(draft_id, send_email=True, audience="everyone"):
             "raw_result": result
         }
     else:
-        print(f"FAILED to publish: {response.text}")
+        logger.error("FAILED to publish draft %s: %s", draft_id, response.text)
         return {
             "success": False,
             "message": f"Failed to publish draft {draft_id}: {response.text}",
             "error_code": response.status_code
         }
 
-def publish_draft_paid_only(draft_id, send_email=True):
+def publish_draft_paid_only(draft_id, send_email=True, account=None):
     """Publish a draft for paid subscribers only"""
-    return publish_draft(draft_id, send_email=send_email, audience="paid")
+    return publish_draft(draft_id, send_email=send_email, audience="paid", account=account)
+
+def iter_posts(fields=None, page_size=listing.DEFAULT_PAGE_SIZE, prefetch=True, account=None):
+    """
+    Iterate over all published posts page by page (offset/limit)
+    The next page is prefetched while the current one is consumed; breaking out stops paging
+    Raises ListingError if a page can't be fetched
+    """
+    session, pub_url = _account_session(account)
+    return listing.iter_pages(session, f"{pub_url}/api/v1/posts", page_size=page_size,
+                              fields=fields, prefetch=prefetch)
 
-def get_published_posts():
+def get_published_posts(account=None):
     """Get published posts"""
-    response = session.get(f"{pub_url}/api/v1/posts")
-    if response.status_code == 200:
-        posts = response.json()
-        print(f"Found {len(posts)} published posts")
-        return posts
-    else:
-        print(f"Error getting posts: {response.text}")
+    try:
+        posts = list(iter_posts(account=account))
+    except ListingError as e:
+        logger.error("Error getting posts: %s", e)
         return []
+    logger.info("Found %d published posts", len(posts))
+    return posts
 
 def list_drafts():
     """List all drafts with details"""
-    drafts = get_drafts()
-    
     print("\n=== AVAILABLE DRAFTS ===")
+    
+    drafts = []
+    try:
+        for draft in iter_drafts():
+            print(f"Draft ID: {draft['id']}")
+            print(f"Title: {draft.get('draft_title', 'Untitled')}")
+            print(f"Subtitle: {draft.get('draft_subtitle', 'No subtitle')}")
+            print(f"Created: {draft.get('draft_created_at', 'Unknown')}")
+            print(f"Updated: {draft.get('draft_updated_at', 'Unknown')}")
+            
+            # Show if scheduled
+            if draft.get('post_date'):
+                print(f"Scheduled for: {draft['post_date']}")
+            
+            # Show content preview
+            try:
+                preview, _ = get_first_text(draft, 100)
+                if preview:
+                    print(f"Preview: {preview}...")
+            except ValueError:
+                print("Preview: [Content not readable]")
+            draft.pop('draft_body', None)
+            
+            print("-" * 50)
+            
+            # Keep only the listing fields, not the full body
+            drafts.append(draft)
+    except ListingError as e:
+        logger.error("Error getting drafts: %s", e)
+    
     if not drafts:
         print("No drafts found")
-        return []
-    
-    for draft in drafts:
-        print(f"Draft ID: {draft['id']}")
-        print(f"Title: {draft.get('draft_title', 'Untitled')}")
-        print(f"Subtitle: {draft.get('draft_subtitle', 'No subtitle')}")
-        print(f"Created: {draft.get('draft_created_at', 'Unknown')}")
-        print(f"Updated: {draft.get('draft_updated_at', 'Unknown')}")
-        
-        # Show if scheduled
-        if draft.get('post_date'):
-            print(f"Scheduled for: {draft['post_date']}")
-        
-        # Show content preview
-        draft_body = draft.get('draft_body', '{}')
-        try:
-            content = json.loads(draft_body)
-            if content.get('content') and len(content['content']) > 0:
-                first_paragraph = content['content'][0]
-                if first_paragraph.get('content') and len(first_paragraph['content']) > 0:
-                    first_text = first_paragraph['content'][0]
-                    if first_text.get('text'):
-                        preview = first_text['text'][:100]
-                        print(f"Preview: {preview}...")
-        except:
-            print("Preview: [Content not readable]")
-        
-        print("-" * 50)
     
     return drafts
 
-def unpublish_post(post_id):
+def unpublish_post(post_id, account=None):
     """Unpublish a post (make it a draft again)"""
+    session, pub_url = _account_session(account)
     
-    print(f"Unpublishing post {post_id}...")
+    logger.info("Unpublishing post %s...", post_id)
     
     response = session.post(f"{pub_url}/api/v1/posts/{post_id}/unpublish", json={})
     
     if response.status_code == 200:
         result = response.json()
-        print(f"SUCCESS! Post {post_id} unpublished (now a draft)")
+        logger.info("SUCCESS! Post %s unpublished (now a draft)", post_id)
         return result
     else:
-        print(f"FAILED to unpublish: {response.text}")
+        logger.error("FAILED to unpublish post %s: %s", post_id, response.text)
         return None
 
-def list_published_posts():
-    """List published posts"""
-    posts = get_published_posts()
-    
+def list_published_posts(limit=10):
+    """List published posts (only the first `limit` posts are fetched)"""
     print("\n=== PUBLISHED POSTS ===")
+    
+    posts = []
+    try:
+        for post in itertools.islice(iter_posts(page_size=min(limit, listing.DEFAULT_PAGE_SIZE)), limit):
+            print(f"Post ID: {post['id']}")
+            print(f"Title: {post.get('title', 'Untitled')}")
+            print(f"Slug: {post.get('slug', 'no-slug')}")
+            print(f"Published: {post.get('post_date', 'Unknown')}")
+            
+            if post.get('slug'):
+                post_url = f"{pub_url}/p/{post['slug']}"
+                print(f"URL: {post_url}")
+            
+            print("-" * 40)
+            posts.append(post)
+    except ListingError as e:
+        logger.error("Error getting posts: %s", e)
+    
     if not posts:
         print("No published posts found")
-        return []
-    
-    for post in posts[:10]:  # Show first 10
-        print(f"Post ID: {post['id']}")
-        print(f"Title: {post.get('title', 'Untitled')}")
-        print(f"Slug: {post.get('slug', 'no-slug')}")
-        print(f"Published: {post.get('post_date', 'Unknown')}")
-        
-        if post.get('slug'):
-            post_url = f"{pub_url}/p/{post['slug']}"
-            print(f"URL: {post_url}")
-        
-        print("-" * 40)
     
     return posts
 
 if __name__ == "__main__":
+    setup_logging()
+    
     print("=== SUBSTACK DRAFT PUBLISHING ===")
     
-    # Get all drafts
-    drafts = get_drafts()
+    # Get all drafts - streamed, only the listing fields and a preview are kept per draft
+    drafts = []
+    try:
+        for draft in iter_drafts():
+            try:
+                draft['preview'], _ = get_first_text(draft, 80)
+            except ValueError:
+                draft['preview'] = None
+            draft.pop('draft_body', None)
+            drafts.append(draft)
+    except ListingError as e:
+        logger.error("Error getting drafts: %s", e)
     
     if not drafts:
         print("\nNo drafts found!")
@@ -217,18 +252,10 @@ if __name__ == "__main__":
             print(f"   Title: {draft.get('draft_title', 'Untitled')}")
             
             # Show content preview
-            draft_body = draft.get('draft_body', '{}')
-            try:
-                content = json.loads(draft_body)
-                if content.get('content') and len(content['content']) > 0:
-                    first_paragraph = content['content'][0]
-                    if first_paragraph.get('content') and len(first_paragraph['content']) > 0:
-                        first_text = first_paragraph['content'][0]
-                        if first_text.get('text'):
-                            preview = first_text['text'][:80]
-                            print(f"   Preview: {preview}...")
-            except:
+            if draft['preview'] is None:
                 print("   Preview: [Content not readable]")
+            elif draft['preview']:
+                print(f"   Preview: {draft['preview']}...")
             print()
     
     if not unpublished_drafts:
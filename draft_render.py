@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Render draft_body documents (ProseMirror JSON) as markup syntax, Markdown or plain text
+The block tree is walked with an explicit stack (no recursion, any nesting depth) and the output
+is streamed as it is produced. Markup output parses back with parse_markup, Markdown output with
+parse_markdown
+
+    python draft_render.py drafts.jsonl --format markdown --output-dir rendered/
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+from content_nodes import Node
+
+SYNTAXES = ('markup', 'markdown', 'text')
+EXTENSIONS = {'markup': '.txt', 'markdown': '.md', 'text': '.txt'}
+
+# Button URLs of the call-to-action blocks (see content_nodes.SUBSCRIBE_BUTTON etc.)
+CTA_KEYWORDS = {
+    '%%checkout_url%%': 'Subscribe',
+    '%%share_url%%': 'Share',
+    '%%half_magic_comments_url%%': 'Comment',
+}
+WIDGET_KEYWORDS = {'subscribeWidget': 'SubscribeWidget', 'captionedShareButton': 'ShareWidget'}
+
+# Node types rendered as a block of their own in markup (everything else is flattened into them)
+MARKUP_QUOTES = {'blockquote': 'Quote', 'pullquote': 'PullQuote'}
+
+# Nodes whose children are inline (text) nodes
+INLINE_CONTAINERS = frozenset(('paragraph', 'heading', 'caption', 'ctaCaption', 'code_block'))
+
+# Rendered as paragraphs
+INLINE_BLOCKS = frozenset(('paragraph', 'caption', 'ctaCaption', 'text', 'footnoteAnchor'))
+
+MARKDOWN_ESCAPE = re.compile(r'([\\`*_\[\]~<])')
+# Line starts Markdown would read as a block marker: # > + - = $$ and "1." / "1)" and "Keyword::"
+MARKDOWN_LINE_START = re.compile(r'[#>+=-]|\$\$|\d+(?=[.)])|[A-Za-z][\w-]*(?=::)')
+MARK_DELIMITERS = (('em', '*'), ('strong', '**'), ('strikethrough', '~~'))  # innermost first
+# parse_inline() takes a single mark per text, so only the first of these a text has is kept
+MARKUP_MARKS = ('link', 'code', 'strong', 'em', 'strikethrough')
+MARKUP_DELIMITERS = {'code': '`', 'strong': '**', 'em': '*', 'strikethrough': '~~'}
+
+
+def _document(doc):
+    """doc as plain dicts: accepts a dict, a draft_body JSON string/bytes or a content_nodes.Doc"""
+    if isinstance(doc, (str, bytes)):
+        return json.loads(doc)
+    if isinstance(doc, Node):
+        return doc.to_json()
+    return doc
+
+
+def _attrs(node):
+    return node.get('attrs') or {}
+
+
+def _children(node):
+    return node.get('content') or []
+
+
+def plain_text(node, separator=' '):
+    """All text below node, blocks joined by separator (iterative)"""
+    parts = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current is None:
+            parts.append(separator)
+            continue
+        kind = current.get('type')
+        if kind == 'text':
+            parts.append(current.get('text', ''))
+        elif kind == 'footnoteAnchor':
+            parts.append(f"[{_attrs(current).get('number')}]")
+        elif kind in INLINE_CONTAINERS:
+            stack.extend(reversed(_children(current)))
+        else:
+            # Block children, pushed in reverse (with separators between them) for document order
+            for i, child in enumerate(reversed(_children(current))):
+                if i:
+                    stack.append(None)
+                stack.append(child)
+    return ''.join(parts)
+
+
+def _caption(node):
+    """Text of the (cta)caption child of node, if any"""
+    for child in _children(node):
+        if child.get('type') in ('caption', 'ctaCaption'):
+            return plain_text(child)
+    return ''
+
+
+def _image(node):
+    """(src, alt, caption) of a captionedImage or image2 node"""
+    image = node
+    if node.get('type') == 'captionedImage':
+        image = next((child for child in _children(node) if child.get('type') == 'image2'), {})
+    attrs = _attrs(image)
+    return attrs.get('src') or '', attrs.get('alt') or '', _caption(node)
+
+
+def _placeholder(node):
+    """Text standing in for media and widgets that have no text form"""
+    kind = node.get('type')
+    attrs = _attrs(node)
+    if kind == 'audio':
+        return f"[Audio: {attrs['label']}]" if attrs.get('label') else "[Audio]"
+    if kind == 'video':
+        return "[Video]"
+    if kind == 'directMessage':
+        return f"[Direct message: {attrs['userName']}]" if attrs.get('userName') else "[Direct message]"
+    return None
+
+
+def _split_whitespace(text):
+    """(leading whitespace, core, trailing whitespace) - delimiters must touch non-space text"""
+    core = text.strip()
+    if not core:
+        return text, '', ''
+    start = text.index(core)
+    return text[:start], core, text[start + len(core):]
+
+
+# Inline content
+
+def _merged(nodes):
+    """Inline nodes with adjacent texts of the same marks joined (as the editor itself would)"""
+    merged = []
+    for node in nodes:
+        if merged and node.get('type') == 'text' and merged[-1].get('type') == 'text' \
+                and (node.get('marks') or None) == (merged[-1].get('marks') or None):
+            merged[-1] = dict(merged[-1], text=merged[-1].get('text', '') + node.get('text', ''))
+        else:
+            merged.append(node)
+    return merged
+
+
+def _inline_markdown(nodes):
+    parts = []
+    for node in _merged(nodes):
+        kind = node.get('type')
+        if kind == 'footnoteAnchor':
+            parts.append(f"[^{_attrs(node).get('number')}]")
+            continue
+        if kind != 'text':
+            parts.append(MARKDOWN_ESCAPE.sub(r'\\\1', plain_text(node)))
+            continue
+        text = node.get('text', '')
+        marks = {mark.get('type'): mark for mark in node.get('marks') or ()}
+        if not marks:
+            parts.append(MARKDOWN_ESCAPE.sub(r'\\\1', text))
+            continue
+        lead, core, trail = _split_whitespace(text)
+        if not core:
+            parts.append(text)
+            continue
+        if 'code' in marks:
+            # Code is literal: a backtick run longer than any inside it, padded if it touches one
+            fence = '`' * (max((len(run) for run in re.findall('`+', core)), default=0) + 1)
+            padding = ' ' if core[0] == '`' or core[-1] == '`' else ''
+            core = f"{fence}{padding}{core}{padding}{fence}"
+        else:
+            core = MARKDOWN_ESCAPE.sub(r'\\\1', core)
+        for mark_type, delimiter in MARK_DELIMITERS:
+            if mark_type in marks:
+                core = f"{delimiter}{core}{delimiter}"
+        if 'link' in marks:
+            href = _attrs(marks['link']).get('href') or ''
+            href = href.replace(' ', '%20').replace('(', '%28').replace(')', '%29')
+            core = f"[{core}]({href})"
+        parts.append(lead + core + trail)
+    return ''.join(parts)
+
+
+def _inline_markup(nodes):
+    parts = []
+    marked = False
+    for node in _merged(nodes):
+        kind = node.get('type')
+        if kind != 'text':
+            parts.append(plain_text(node))
+            marked = False
+            continue
+        text = node.get('text', '')
+        marks = {mark.get('type'): mark for mark in node.get('marks') or ()}
+        mark_type = next((name for name in MARKUP_MARKS if name in marks), None)
+        lead, core, trail = _split_whitespace(text)
+        if mark_type is not None and core and marked and not lead:
+            # **a***b* would not parse back; parse_inline() drops the whitespace-only text again
+            lead = ' '
+        marked = mark_type is not None and core and not trail
+        if mark_type is None or not core:
+            parts.append(text)
+        elif mark_type == 'link':
+            parts.append(f"{lead}[{core}]({_attrs(marks['link']).get('href') or '#'}){trail}")
+        else:
+            delimiter = MARKUP_DELIMITERS[mark_type]
+            parts.append(f"{lead}{delimiter}{core}{delimiter}{trail}")
+    return ''.join(parts)
+
+
+def _escape_line_start(line):
+    match = MARKDOWN_LINE_START.match(line)
+    if not match:
+        return line
+    end = match.end()
+    if line[0].isdigit() or line[0].isalpha():
+        # 1\. item, Keyword\:: text
+        return line[:end] + '\\' + line[end:]
+    return '\\' + line
+
+
+# Markdown and plain text: one leaf renderer per syntax, the layout is shared
+
+def _markdown_leaf(node):
+    """Lines of a block, None for containers (quotes, lists, footnotes: the layout renders their children)"""
+    kind = node.get('type')
+    attrs = _attrs(node)
+    if kind in INLINE_BLOCKS:
+        # A stray inline node at block level is its own paragraph
+        text = _inline_markdown(_children(node) if kind in INLINE_CONTAINERS else [node])
+        return [_escape_line_start(line.strip()) for line in text.split('\n') if line.strip()]
+    if kind == 'heading':
+        text = _inline_markdown(_children(node)).replace('\n', ' ').strip()
+        return [f"{'#' * (attrs.get('level') or 1)} {text}"] if text else []
+    if kind == 'code_block':
+        code = plain_text(node)
+        fence = '```'
+        while fence in code:
+            fence += '`'
+        return [fence + (attrs.get('language') or '')] + (code.split('\n') if code else []) + [fence]
+    if kind == 'pullquote':
+        # Markdown has no pull quote, the markup block keeps it one
+        return [f"PullQuote:: {plain_text(node)}"]
+    if kind == 'horizontal_rule':
+        return ['---']
+    if kind == 'latex_block':
+        return ['$$'] + (attrs.get('persistentExpression') or '').strip('\n').split('\n') + ['$$']
+    if kind == 'button':
+        keyword = CTA_KEYWORDS.get(attrs.get('url'))
+        if keyword:
+            return [f"{keyword}:: {attrs.get('text') or ''}"]
+        return [f"Button:: {attrs.get('text') or ''} -> {attrs.get('url') or '#'}"]
+    if kind in WIDGET_KEYWORDS:
+        return [f"{WIDGET_KEYWORDS[kind]}:: {attrs.get('text') or ''} >> {_caption(node)}"]
+    if kind == 'captionedImage' or kind == 'image2':
+        src, alt, caption = _image(node)
+        alt = MARKDOWN_ESCAPE.sub(r'\\\1', alt)
+        title = ' "' + caption.replace('"', "'") + '"' if caption else ''
+        return [f"![{alt}]({src}{title})"]
+    placeholder = _placeholder(node)
+    if placeholder is not None:
+        return [MARKDOWN_ESCAPE.sub(r'\\\1', placeholder)]
+    return None
+
+
+def _text_leaf(node):
+    kind = node.get('type')
+    attrs = _attrs(node)
+    if kind in INLINE_BLOCKS or kind == 'heading' or kind == 'code_block':
+        text = plain_text(node)
+        if kind == 'code_block':
+            return text.split('\n') if text else []
+        return [line.strip() for line in text.split('\n') if line.strip()]
+    if kind == 'horizontal_rule':
+        return ['---']
+    if kind == 'latex_block':
+        return (attrs.get('persistentExpression') or '').strip('\n').split('\n')
+    if kind == 'button':
+        return [attrs.get('text') or '']
+    if kind in WIDGET_KEYWORDS:
+        return [line for line in (_caption(node), attrs.get('text')) if line]
+    if kind == 'captionedImage' or kind == 'image2':
+        src, alt, caption = _image(node)
+        return [f"[Image: {caption or alt}]" if caption or alt else "[Image]"]
+    placeholder = _placeholder(node)
+    if placeholder is not None:
+        return [placeholder]
+    return None
+
+
+def _iter_layout(doc, leaf, footnote_marker):
+    """
+    Lines of nested blocks with their prefixes: "> " for quotes, "- " / "1. " for list items
+    (continuation lines indented to match), blank lines between blocks except between list items
+    """
+    # Frame: [children, next index, line prefix, blank lines between children, next item number,
+    #         lines written before the frame started]
+    stack = [[_children(doc), 0, '', True, None, 0]]
+    written = 0
+    blank = None    # Prefix of a blank line still to write before the next line
+    pending = None  # List marker replacing the start of the next line's prefix
+
+    while stack:
+        frame = stack[-1]
+        children, index, prefix = frame[0], frame[1], frame[2]
+        if index >= len(children):
+            stack.pop()
+            blank = None
+            continue
+        frame[1] = index + 1
+        if frame[3] and written > frame[5]:
+            blank = prefix.rstrip()
+        node = children[index]
+        kind = node.get('type')
+
+        lines = leaf(node)
+        if lines is not None:
+            for line in lines:
+                if blank is not None:
+                    yield blank + '\n'
+                    blank = None
+                line_prefix = prefix
+                if pending is not None:
+                    line_prefix = pending + prefix[len(pending):]
+                    pending = None
+                yield line_prefix + line + '\n' if line else line_prefix.rstrip() + '\n'
+                written += 1
+        elif kind in ('blockquote', 'pullquote'):
+            stack.append([_children(node), 0, prefix + '> ', True, None, written])
+        elif kind in ('bullet_list', 'ordered_list'):
+            number = (_attrs(node).get('start') or 1) if kind == 'ordered_list' else None
+            stack.append([_children(node), 0, prefix, False, number, written])
+        elif kind == 'list_item' or kind == 'footnote':
+            if kind == 'footnote':
+                marker = footnote_marker(_attrs(node).get('number'))
+                indent = ' ' * 4
+            elif frame[4] is not None:
+                marker = f"{frame[4]}. "
+                frame[4] += 1
+                indent = ' ' * len(marker)
+            else:
+                marker = '- '
+                indent = '  '
+            # An item starting with another item (- - x) puts both markers on its first line
+            marker = prefix + marker
+            pending = marker if pending is None else pending + marker[len(pending):]
+            stack.append([_children(node), 0, prefix + indent, True, None, written])
+        else:
+            # Unknown container: its children in place
+            stack.append([_children(node), 0, prefix, True, None, written])
+
+
+# Markup: flat blocks, one per top-level node
+
+def _list_items(node):
+    """Inline markup of every item of a list, nested list items flattened in order"""
+    items = []
+    stack = [iter(_children(node))]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+        if item.get('type') != 'list_item':
+            continue
+        texts = []
+        nested = []
+        for child in _children(item):
+            if child.get('type') in ('bullet_list', 'ordered_list'):
+                nested.append(child)
+            elif child.get('type') == 'paragraph':
+                texts.append(_inline_markup(_children(child)))
+            else:
+                texts.append(plain_text(child))
+        items.append(' '.join(text for text in texts if text.strip()))
+        for child in reversed(nested):
+            stack.append(iter(_children(child)))
+    return items
+
+
+def _markup_block(node):
+    """The markup block for a top-level node, None if it has no text form"""
+    kind = node.get('type')
+    attrs = _attrs(node)
+    if kind == 'paragraph':
+        text = _inline_markup(_children(node))
+        return f"Text:: {text}" if text.strip() else "Break:: -"
+    if kind == 'heading':
+        return f"H{attrs.get('level') or 1}:: {plain_text(node)}"
+    if kind in MARKUP_QUOTES:
+        return f"{MARKUP_QUOTES[kind]}:: {plain_text(node)}"
+    if kind == 'bullet_list':
+        return "List:: " + " ".join(f"• {item}" for item in _list_items(node))
+    if kind == 'ordered_list':
+        return "NumberList:: " + " ".join(f"{i}. {item}" for i, item in enumerate(_list_items(node), 1))
+    if kind == 'code_block':
+        # parse_markup has no way to set the language
+        return f"Code:: {plain_text(node)}"
+    if kind == 'horizontal_rule':
+        return "Rule:: ---"
+    if kind == 'latex_block':
+        return f"LaTeX:: {(attrs.get('persistentExpression') or '').strip()}"
+    if kind == 'footnote':
+        return f"Footnote:: [{attrs.get('number')}] {plain_text(node)}"
+    if kind == 'button':
+        keyword = CTA_KEYWORDS.get(attrs.get('url'))
+        if keyword:
+            return f"{keyword}:: {attrs.get('text') or ''}"
+        return f"Button:: {attrs.get('text') or ''} -> {attrs.get('url') or '#'}"
+    if kind in WIDGET_KEYWORDS:
+        return f"{WIDGET_KEYWORDS[kind]}:: {attrs.get('text') or ''} >> {_caption(node)}"
+    if kind == 'captionedImage' or kind == 'image2':
+        src, alt, caption = _image(node)
+        return f"Text:: [{caption or alt or 'Image'}]({src})"
+    placeholder = _placeholder(node)
+    if placeholder is not None:
+        return f"Text:: {placeholder}"
+    text = plain_text(node)
+    return f"Text:: {text}" if text.strip() else None
+
+
+def _iter_markup(doc):
+    first = True
+    for node in _children(doc):
+        block = _markup_block(node)
+        if block is None:
+            continue
+        # | separates blocks - the markup syntax has no escape for it
+        block = block.replace('|', '¦')
+        yield block if first else ' | ' + block
+        first = False
+
+
+def iter_render(doc, syntax='markdown'):
+    """
+    Render doc (dict, draft_body JSON or content_nodes.Doc) as 'markup', 'markdown' or 'text',
+    yielding the output in pieces as the document is walked
+    """
+    doc = _document(doc)
+    if syntax == 'markup':
+        return _iter_markup(doc)
+    if syntax == 'markdown':
+        return _iter_layout(doc, _markdown_leaf, lambda number: f"[^{number}]: ")
+    if syntax == 'text':
+        return _iter_layout(doc, _text_leaf, lambda number: f"[{number}] ")
+    raise ValueError(f"Unknown syntax: {syntax!r} (one of {', '.join(SYNTAXES)})")
+
+
+def render(doc, syntax='markdown'):
+    """The whole rendering as one string (see iter_render)"""
+    return ''.join(iter_render(doc, syntax))
+
+
+def render_archive(lines, output_dir, syntax='markdown', field='draft_body'):
+    """
+    Render every draft/post of a JSON Lines export (one object per line, e.g. getposts.export_archive)
+    into output_dir/<id><extension>; objects without the field are skipped. Returns the count written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        body = item.get(field)
+        if not body:
+            continue
+        path = os.path.join(output_dir, f"{item.get('id', count)}{EXTENSIONS[syntax]}")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(iter_render(body, syntax))
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render draft bodies as markup, Markdown or plain text")
+    parser.add_argument("input", help="JSON Lines file of drafts/posts, or - for stdin")
+    parser.add_argument("--format", choices=SYNTAXES, default="markdown")
+    parser.add_argument("--output-dir", help="Write one file per draft here (default: all to stdout)")
+    parser.add_argument("--field", default="draft_body", help="Field holding the document JSON")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding='utf-8')
+    with source:
+        if args.output_dir:
+            written = render_archive(source, args.output_dir, args.format, args.field)
+            print(f"Rendered {written} documents to {args.output_dir}", file=sys.stderr)
+        else:
+            for line in source:
+                body = json.loads(line).get(args.field) if line.strip() else None
+                if body:
+                    sys.stdout.writelines(iter_render(body, args.format))
+                    sys.stdout.write("\n")
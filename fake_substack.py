@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Substack API used by this project
+Serves the draft/post/publish endpoints with realistic payloads from in-memory state,
+with configurable latency distributions and error/429 injection, so the API server and
+the CLI tools can be load tested and integration tested without touching real Substack
+
+Every publication lives under /pub/{name}, e.g. PUBLICATION_URL=http://127.0.0.1:8001/pub/account2
+(plain /api/v1/... is the publication "default"). Cookies are not checked.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import uvicorn
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import Response
+
+DEFAULT_PUBLICATION = "default"
+ADMIN_PREFIX = "/__fake__"
+DEFAULT_USER_ID = 100001
+
+DEFAULT_CONFIG = {
+    'latency': 'none',        # Distribution for every upstream call, see parse_latency
+    'route_latency': {},      # Per operation overrides, e.g. {"POST /api/v1/drafts": "normal:300:50"}
+    'error_rate': 0.0,        # Probability of a 500 response
+    'rate_limit_rate': 0.0,   # Probability of a 429 response
+    'max_rps': 0,             # Per publication requests per second before 429s (0 = unlimited)
+    'retry_after': 1,         # Retry-After header of 429 responses (seconds)
+    'seed': None,             # Seed for latency/error draws and generated content
+    'drafts': 3,              # Unpublished drafts seeded per publication
+    'posts': 20,              # Published posts seeded per publication
+    'body_blocks': 12,        # Content blocks per seeded post body
+}
+
+# Numeric path segments are collapsed so stats and route_latency use one key per endpoint
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+_PUB_PREFIX = re.compile(r'^/pub/[^/]+')
+
+_WORDS = ("substack draft newsletter reader growth launch weekly notes analysis market story "
+          "data insight update research design product season guide review essay").split()
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution spec (all values in milliseconds) into a sampler returning seconds
+    none | fixed:MS | uniform:LO:HI | normal:MEAN:SD | lognormal:MEDIAN:SIGMA
+    """
+    name, _, args = (spec or 'none').partition(':')
+    values = [float(v) for v in args.split(':')] if args else []
+
+    if name == 'none':
+        return lambda rng: 0.0
+    if name == 'fixed' and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if name == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if name == 'normal' and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if name == 'lognormal' and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1]) / 1000
+
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+def operation_key(method: str, path: str) -> str:
+    """Operation name of a request, e.g. 'GET /api/v1/drafts/{id}' for GET /pub/a/api/v1/drafts/42"""
+    path = _PUB_PREFIX.sub('', path)
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _slugify(title: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', (title or 'untitled').lower()).strip('-') or 'untitled'
+
+
+def _json(data, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(json.dumps(data), status_code=status_code, headers=headers,
+                    media_type="application/json")
+
+
+def _error(status_code: int, message: str) -> Response:
+    return _json({"errors": [{"msg": message}]}, status_code)
+
+
+def sample_body(rng: random.Random, blocks: int) -> str:
+    """Generate a draft_body document string with a realistic mix of block types"""
+    def sentence(words=12):
+        return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+    def text_node():
+        node = {"type": "text", "text": sentence(rng.randint(6, 20))}
+        roll = rng.random()
+        if roll < 0.15:
+            node["marks"] = [{"type": "strong"}]
+        elif roll < 0.25:
+            node["marks"] = [{"type": "link", "attrs": {"href": "https://example.com", "target": "_blank"}}]
+        return node
+
+    content = []
+    for i in range(blocks):
+        roll = rng.random()
+        if i > 0 and roll < 0.1:
+            content.append({"type": "heading", "attrs": {"level": 2}, "content": [text_node()]})
+        elif roll < 0.2:
+            content.append({"type": "blockquote", "content": [{"type": "paragraph", "content": [text_node()]}]})
+        elif roll < 0.27:
+            content.append({"type": "bullet_list", "content": [
+                {"type": "list_item", "content": [{"type": "paragraph", "content": [text_node()]}]}
+                for _ in range(3)
+            ]})
+        elif roll < 0.3:
+            content.append({"type": "horizontal_rule"})
+        else:
+            content.append({"type": "paragraph", "content": [text_node() for _ in range(rng.randint(1, 3))]})
+
+    return json.dumps({"type": "doc", "content": content})
+
+
+class Publication:
+    """In-memory drafts, posts and schedules of one fake publication"""
+
+    def __init__(self, name: str, publication_id: int, config: Dict, rng: random.Random):
+        self.name = name
+        self.publication_id = publication_id
+        self.user_id = DEFAULT_USER_ID + publication_id
+        self.items = {}  # id -> draft/post dict (published posts are drafts with is_published)
+        self.next_id = publication_id * 10_000_000 + 1
+        self.next_schedule_id = 1
+        self.window = (0, 0)  # (second, requests) for max_rps
+        self.seed(config, rng)
+
+    def seed(self, config: Dict, rng: random.Random):
+        """config['posts'] published posts, then config['drafts'] unpublished drafts (at least one - create_draft copies it)"""
+        for i in range(config['posts']):
+            post = self.new_draft({'draft_title': f"Published post {i + 1}",
+                                   'draft_body': sample_body(rng, config['body_blocks'])})
+            self.publish(post['id'], {'should_send_email': False})
+        for i in range(max(1, config['drafts'])):
+            self.new_draft({'draft_title': f"Draft {i + 1}", 'draft_subtitle': "Seeded draft",
+                            'draft_body': sample_body(rng, config['body_blocks'])})
+
+    def new_draft(self, data: Dict) -> Dict:
+        draft_id = self.next_id
+        self.next_id += 1
+        now = _now()
+        byline = {'id': self.user_id, 'user_id': self.user_id, 'is_guest': False,
+                  'publication_id': self.publication_id}
+
+        draft = {
+            'id': draft_id,
+            'uuid': str(uuid.uuid4()),
+            'publication_id': self.publication_id,
+            'type': 'newsletter',
+            'audience': 'everyone',
+            'title': None,
+            'subtitle': None,
+            'slug': None,
+            'post_date': None,
+            'is_published': False,
+            'should_send_email': True,
+            'section_id': None,
+            'section_chosen': False,
+            'subscriber_set_id': None,
+            'write_comment_permissions': 'everyone',
+            'editor_v2': True,
+            'cover_image': None,
+            'description': None,
+            'search_engine_title': None,
+            'search_engine_description': None,
+            'draft_title': '',
+            'draft_subtitle': None,
+            'draft_body': '{"type":"doc","content":[]}',
+            'draft_created_at': now,
+            'draft_updated_at': now,
+            'created_at': now,
+            'updated_at': now,
+            'postBylines': [byline],
+            'draft_bylines': [byline],
+            'postSchedules': [],
+            'postTags': [],
+        }
+        for key, value in data.items():
+            if key not in ('id', 'uuid', 'publication_id', 'is_published', 'postSchedules'):
+                draft[key] = value
+        self.items[draft_id] = draft
+        return draft
+
+    def update(self, draft_id: int, data: Dict) -> Optional[Dict]:
+        draft = self.items.get(draft_id)
+        if draft is None:
+            return None
+        for key, value in data.items():
+            if key not in ('id', 'uuid', 'publication_id', 'is_published', 'postSchedules'):
+                draft[key] = value
+        draft['draft_updated_at'] = draft['updated_at'] = _now()
+        return draft
+
+    def publish(self, draft_id: int, data: Dict) -> Optional[Dict]:
+        draft = self.items.get(draft_id)
+        if draft is None:
+            return None
+        draft['is_published'] = True
+        draft['post_date'] = _now()
+        draft['title'] = draft['draft_title']
+        draft['subtitle'] = draft['draft_subtitle']
+        draft['slug'] = draft['slug'] or _slugify(draft['draft_title'])
+        draft['audience'] = data.get('audience', draft['audience'])
+        draft['should_send_email'] = data.get('should_send_email', True)
+        draft['postSchedules'] = []
+        draft['updated_at'] = _now()
+        return draft
+
+    def schedule(self, draft_id: int, publish_date: str) -> Optional[Dict]:
+        """Add (or move) the draft's schedule, like prepublish?publish_date= does"""
+        draft = self.items.get(draft_id)
+        if draft is None:
+            return None
+        if draft['postSchedules']:
+            draft['postSchedules'][0]['trigger_at'] = publish_date
+        else:
+            draft['postSchedules'].append({
+                'id': self.next_schedule_id,
+                'trigger_at': publish_date,
+                'post_audience': draft['audience'],
+                'email_audience': draft['audience']
+            })
+            self.next_schedule_id += 1
+        return draft
+
+    def listing(self, published: Optional[bool], offset: int, limit: Optional[int]) -> List[Dict]:
+        """Drafts/posts newest first - by post_date for published posts, by last edit otherwise"""
+        sort_key = 'post_date' if published else 'draft_updated_at'
+        items = [item for item in self.items.values()
+                 if published is None or item['is_published'] == published]
+        items.sort(key=lambda item: (item[sort_key] or '', item['id']), reverse=True)
+        return items[offset:offset + limit] if limit is not None else items[offset:]
+
+    def allow_request(self, max_rps: int) -> bool:
+        """Fixed one-second window limit per publication"""
+        second = int(time.monotonic())
+        start, count = self.window
+        if start != second:
+            start, count = second, 0
+        self.window = (start, count + 1)
+        return count < max_rps
+
+
+class FakeSubstack:
+    """State shared by the fake server's routes: config, publications and request stats"""
+
+    def __init__(self, **config):
+        self.lock = threading.Lock()
+        self.config = dict(DEFAULT_CONFIG)
+        self.configure(**config)
+        self.reset()
+
+    def configure(self, **config):
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown config keys: {sorted(unknown)}")
+        # Validate before applying anything
+        samplers = {'latency': parse_latency(config.get('latency', self.config['latency']))}
+        route_latency = config.get('route_latency', self.config['route_latency'])
+        route_samplers = {op: parse_latency(spec) for op, spec in route_latency.items()}
+
+        with self.lock:
+            self.config.update(config)
+            self.latency = samplers['latency']
+            self.route_latency = route_samplers
+            if 'seed' in config:
+                self.rng = random.Random(config['seed'])
+            elif not hasattr(self, 'rng'):
+                self.rng = random.Random(self.config['seed'])
+
+    def reset(self):
+        """Drop all publications and stats - publications are re-seeded on first use"""
+        with self.lock:
+            self.publications = {}
+            self.content_rng = random.Random(self.config['seed'])
+            self.stats = {'started_at': _now(), 'requests': 0, 'operations': {}}
+
+    def publication(self, name: str) -> Publication:
+        with self.lock:
+            pub = self.publications.get(name)
+            if pub is None:
+                pub = Publication(name, len(self.publications) + 1, self.config, self.content_rng)
+                self.publications[name] = pub
+            return pub
+
+    def record(self, operation: str, status_code: int, latency: float):
+        with self.lock:
+            self.stats['requests'] += 1
+            op = self.stats['operations'].setdefault(operation, {'count': 0, 'statuses': {}, 'latency_seconds': 0.0})
+            op['count'] += 1
+            op['statuses'][str(status_code)] = op['statuses'].get(str(status_code), 0) + 1
+            op['latency_seconds'] += latency
+
+    def draw(self, operation: str):
+        """Latency and injected failure (None, 429 or 500) for one request"""
+        with self.lock:
+            sampler = self.route_latency.get(operation, self.latency)
+            delay = sampler(self.rng)
+            roll = self.rng.random()
+            if roll < self.config['rate_limit_rate']:
+                return delay, 429
+            if roll < self.config['rate_limit_rate'] + self.config['error_rate']:
+                return delay, 500
+            return delay, None
+
+
+def _build_router(fake: FakeSubstack) -> APIRouter:
+    router = APIRouter()
+
+    def pub(request: Request) -> Publication:
+        return fake.publication(request.path_params.get('publication', DEFAULT_PUBLICATION))
+
+    def int_param(request: Request, name: str, default=None):
+        value = request.query_params.get(name)
+        return int(value) if value and value.isdigit() else default
+
+    @router.get("/api/v1/drafts")
+    def list_drafts(request: Request):
+        publication = pub(request)
+        with fake.lock:
+            items = publication.listing(None, int_param(request, 'offset', 0), int_param(request, 'limit'))
+            return _json(items)
+
+    @router.post("/api/v1/drafts")
+    async def create_draft(request: Request):
+        data = await request.json()
+        if not isinstance(data.get('draft_body', ''), str):
+            return _error(400, "draft_body must be a string")
+        try:
+            json.loads(data.get('draft_body') or '{}')
+        except ValueError:
+            return _error(400, "draft_body is not valid JSON")
+        if not data.get('draft_bylines'):
+            return _error(400, "draft_bylines is required")
+
+        publication = pub(request)
+        with fake.lock:
+            return _json(publication.new_draft(data))
+
+    @router.get("/api/v1/drafts/{draft_id}")
+    def get_draft(request: Request, draft_id: int):
+        publication = pub(request)
+        with fake.lock:
+            draft = publication.items.get(draft_id)
+            return _json(draft) if draft else _error(404, "Not found")
+
+    @router.put("/api/v1/drafts/{draft_id}")
+    async def update_draft(request: Request, draft_id: int):
+        data = await request.json()
+        publication = pub(request)
+        with fake.lock:
+            draft = publication.update(draft_id, data)
+            return _json(draft) if draft else _error(404, "Not found")
+
+    @router.delete("/api/v1/drafts/{draft_id}")
+    def delete_draft(request: Request, draft_id: int):
+        publication = pub(request)
+        with fake.lock:
+            if publication.items.pop(draft_id, None) is None:
+                return _error(404, "Not found")
+            return _json({})
+
+    @router.post("/api/v1/drafts/{draft_id}/publish")
+    async def publish_draft(request: Request, draft_id: int):
+        data = await request.json()
+        publication = pub(request)
+        with fake.lock:
+            draft = publication.items.get(draft_id)
+            if draft is None:
+                return _error(404, "Not found")
+            if draft['is_published']:
+                return _error(400, "Post is already published")
+            return _json(publication.publish(draft_id, data))
+
+    @router.get("/api/v1/drafts/{draft_id}/prepublish")
+    def prepublish(request: Request, draft_id: int):
+        publication = pub(request)
+        publish_date = request.query_params.get('publish_date')
+        with fake.lock:
+            draft = (publication.schedule(draft_id, publish_date) if publish_date
+                     else publication.items.get(draft_id))
+            if draft is None:
+                return _error(404, "Not found")
+            return _json({'errors': [], 'warnings': [], 'publish_date': publish_date,
+                          'postSchedules': draft['postSchedules']})
+
+    @router.post("/api/v1/drafts/{draft_id}/prepublish")
+    def prepublish_check(request: Request, draft_id: int):
+        publication = pub(request)
+        with fake.lock:
+            if draft_id not in publication.items:
+                return _error(404, "Not found")
+            return _json({'errors': [], 'warnings': []})
+
+    @router.get("/api/v1/posts")
+    def list_posts(request: Request):
+        publication = pub(request)
+        with fake.lock:
+            items = publication.listing(True, int_param(request, 'offset', 0), int_param(request, 'limit'))
+            return _json(items)
+
+    @router.post("/api/v1/posts/{post_id}/unpublish")
+    def unpublish_post(request: Request, post_id: int):
+        publication = pub(request)
+        with fake.lock:
+            post = publication.items.get(post_id)
+            if post is None or not post['is_published']:
+                return _error(404, "Not found")
+            post['is_published'] = False
+            post['post_date'] = None
+            post['updated_at'] = _now()
+            return _json(post)
+
+    @router.get("/api/v1/archive")
+    def archive(request: Request):
+        # Public archive: published posts without the draft fields
+        publication = pub(request)
+        with fake.lock:
+            items = publication.listing(True, int_param(request, 'offset', 0), int_param(request, 'limit', 12))
+            return _json([{key: value for key, value in item.items() if not key.startswith('draft_')}
+                          for item in items])
+
+    @router.get("/api/v1/publication/verify_status")
+    def verify_status(request: Request):
+        return _json({'verified': True, 'status': 'verified'})
+
+    @router.get("/api/v1/publication/post-tag")
+    def post_tags(request: Request):
+        return _json([])
+
+    @router.get("/api/v1/post/{draft_id}/tag")
+    def post_tag(request: Request, draft_id: int):
+        publication = pub(request)
+        with fake.lock:
+            draft = publication.items.get(draft_id)
+            return _json(draft['postTags']) if draft else _error(404, "Not found")
+
+    @router.get("/api/v1/post_management/share_center/{draft_id}")
+    def share_center(request: Request, draft_id: int):
+        publication = pub(request)
+        with fake.lock:
+            draft = publication.items.get(draft_id)
+            if draft is None:
+                return _error(404, "Not found")
+            schedules = draft['postSchedules']
+            return _json({
+                'post': {key: draft[key] for key in ('id', 'slug', 'title', 'draft_title', 'is_published', 'post_date')},
+                'is_scheduled': bool(schedules),
+                'postSchedule': schedules[0] if schedules else None,
+            })
+
+    return router
+
+
+def create_app(fake: Optional[FakeSubstack] = None, **config) -> FastAPI:
+    """Create the fake Substack app (with a new FakeSubstack built from config unless one is given)"""
+    fake = fake or FakeSubstack(**config)
+    app = FastAPI(title="Fake Substack", description="Local stand-in for the Substack API")
+    app.state.fake = fake
+
+    router = _build_router(fake)
+    app.include_router(router)
+    app.include_router(router, prefix="/pub/{publication}")
+
+    @app.middleware("http")
+    async def inject_latency_and_errors(request: Request, call_next):
+        if request.url.path.startswith(ADMIN_PREFIX):
+            return await call_next(request)
+
+        started = time.monotonic()
+        operation = operation_key(request.method, request.url.path)
+        delay, failure = fake.draw(operation)
+        if delay:
+            await asyncio.sleep(delay)
+
+        max_rps = fake.config['max_rps']
+        if failure is None and max_rps:
+            publication = fake.publication(_pub_name(request.url.path))
+            with fake.lock:
+                if not publication.allow_request(max_rps):
+                    failure = 429
+
+        if failure == 429:
+            response = _json({"errors": [{"msg": "Too many requests"}]}, 429,
+                             {'Retry-After': str(fake.config['retry_after'])})
+        elif failure == 500:
+            response = _error(500, "Injected server error")
+        else:
+            response = await call_next(request)
+
+        fake.record(operation, response.status_code, time.monotonic() - started)
+        return response
+
+    @app.get(ADMIN_PREFIX + "/stats")
+    def stats():
+        with fake.lock:
+            return json.loads(json.dumps(fake.stats))
+
+    @app.post(ADMIN_PREFIX + "/reset")
+    def reset():
+        fake.reset()
+        return {'success': True}
+
+    @app.get(ADMIN_PREFIX + "/config")
+    def get_config():
+        return fake.config
+
+    @app.put(ADMIN_PREFIX + "/config")
+    async def put_config(request: Request):
+        try:
+            fake.configure(**await request.json())
+        except ValueError as e:
+            return _error(400, str(e))
+        return fake.config
+
+    return app
+
+
+def _pub_name(path: str) -> str:
+    match = _PUB_PREFIX.match(path)
+    return match.group()[len('/pub/'):] if match else DEFAULT_PUBLICATION
+
+
+def serve_in_thread(app, port: int = 0, host: str = "127.0.0.1"):
+    """
+    Run an ASGI app with uvicorn in a daemon thread (port=0 picks a free port)
+    Returns (server, thread, url); stop with server.should_exit = True and thread.join()
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Server failed to start")
+        time.sleep(0.01)
+
+    bound_port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://{host}:{bound_port}"
+
+
+class FakeSubstackServer:
+    """A fake Substack running in a background thread (see start_fake_substack)"""
+
+    def __init__(self, server: uvicorn.Server, thread: threading.Thread, fake: FakeSubstack, url: str):
+        self.server = server
+        self.thread = thread
+        self.fake = fake
+        self.url = url
+
+    def publication_url(self, name: str = DEFAULT_PUBLICATION) -> str:
+        """PUBLICATION_URL for an account on this server"""
+        return self.url if name == DEFAULT_PUBLICATION else f"{self.url}/pub/{name}"
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def start_fake_substack(port: int = 0, host: str = "127.0.0.1", **config) -> FakeSubstackServer:
+    """Run a fake Substack in a background thread; port=0 picks a free port"""
+    fake = FakeSubstack(**config)
+    server, thread, url = serve_in_thread(create_app(fake), port, host)
+    return FakeSubstackServer(server, thread, fake, url)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Substack API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="none",
+                        help="none | fixed:MS | uniform:LO:HI | normal:MEAN:SD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--route-latency", action="append", default=[], metavar="'METHOD PATH=SPEC'",
+                        help="Per operation latency, e.g. 'POST /api/v1/drafts=normal:300:50'")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of injected 500s")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of injected 429s")
+    parser.add_argument("--max-rps", type=int, default=0, help="429 above this many requests/s per publication")
+    parser.add_argument("--drafts", type=int, default=DEFAULT_CONFIG['drafts'])
+    parser.add_argument("--posts", type=int, default=DEFAULT_CONFIG['posts'])
+    parser.add_argument("--body-blocks", type=int, default=DEFAULT_CONFIG['body_blocks'])
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    route_latency = dict(item.rsplit('=', 1) for item in args.route_latency)
+    app = create_app(latency=args.latency, route_latency=route_latency, error_rate=args.error_rate,
+                     rate_limit_rate=args.rate_limit_rate, max_rps=args.max_rps, drafts=args.drafts,
+                     posts=args.posts, body_blocks=args.body_blocks, seed=args.seed)
+
+    print(f"Fake Substack on http://{args.host}:{args.port}")
+    print(f"PUBLICATION_URL for an account: http://{args.host}:{args.port}/pub/<name>")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -1,37 +1,97 @@
 # getposts.py - Systematische Suche nach ALLEN Posts/Drafts/Schedules
 import os
+import sys
+import json
+import logging
 import requests
 from datetime import datetime
 from dotenv import load_dotenv
+from substack_session import build_session, cookie_map_from_env
+from listing import iter_drafts, iter_pages, iter_json_array, iter_text_chunks, NotAnArrayError, DEFAULT_PAGE_SIZE
+from log_config import setup_logging
 
 load_dotenv()
 
-# Setup session
-session = requests.Session()
-session.headers.update({
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-    "Referer": os.getenv("PUBLICATION_URL"),
-    "Content-Type": "application/json"
-})
+logger = logging.getLogger(__name__)
 
-# Set cookies
-cookie_map = {
-    "sid": os.getenv("SID"),
-    "substack.lli": os.getenv("SUBSTACK_LLI"),
-    "substack.sid": os.getenv("SUBSTACK_SID")
-}
-for k, v in cookie_map.items():
-    if v:
-        session.cookies.set(k, v, domain=".substack.com")
+# Setup session
+session = build_session()
+cookie_map = cookie_map_from_env()
 
 pub_url = os.getenv("PUBLICATION_URL")
 
+def iter_archive(page_size=DEFAULT_PAGE_SIZE, sort="new", fields=None, prefetch=True):
+    """
+    Iteriere über das komplette Archiv (offset/limit Paging)
+    Die nächste Seite wird im Hintergrund geladen während die aktuelle verarbeitet wird
+    """
+    return iter_pages(session, f"{pub_url}/api/v1/archive", page_size=page_size,
+                      params={"sort": sort}, fields=fields, prefetch=prefetch)
+
+def export_archive(output_file, page_size=DEFAULT_PAGE_SIZE):
+    """Exportiere das komplette Archiv als JSON Lines (ein Post pro Zeile)"""
+    count = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for post in iter_archive(page_size=page_size):
+            f.write(json.dumps(post, ensure_ascii=False) + "\n")
+            count += 1
+    logger.info("Exported %d archive posts to %s", count, output_file)
+    return count
+
+def classify_post(item, endpoint, current_time):
+    """Sammle die relevanten Daten eines Posts und bestimme seinen Status"""
+    post_id = item['id']
+    
+    # Sammle alle relevanten Daten
+    post_info = {
+        'id': post_id,
+        'endpoint': endpoint,
+        'title': item.get('title') or item.get('draft_title', 'NO TITLE'),
+        'is_published': item.get('is_published'),
+        'post_date': item.get('post_date'),
+        'draft_updated_at': item.get('draft_updated_at'),
+        'updated_at': item.get('updated_at'),
+        'postSchedules': item.get('postSchedules', []),
+        'status': 'UNKNOWN'
+    }
+    
+    # Bestimme Status basierend auf Daten
+    # FIRST: Check for postSchedules (das ist der echte Schedule!)
+    if post_info['postSchedules']:
+        try:
+            schedule = post_info['postSchedules'][0]  # First schedule
+            trigger_at = schedule.get('trigger_at')
+            if trigger_at:
+                schedule_dt = datetime.fromisoformat(trigger_at.replace('Z', '+00:00'))
+                post_info['schedule_date'] = trigger_at
+                post_info['status'] = 'SCHEDULED'
+        except:
+            post_info['status'] = 'SCHEDULE_ERROR'
+    elif item.get('post_date'):
+        try:
+            post_dt = datetime.fromisoformat(item['post_date'].replace('Z', '+00:00'))
+            if item.get('is_published'):
+                if post_dt > current_time:
+                    post_info['status'] = 'SCHEDULED'
+                else:
+                    post_info['status'] = 'PUBLISHED'
+            else:
+                post_info['status'] = 'SCHEDULED'
+        except:
+            post_info['status'] = 'DATE_ERROR'
+    elif item.get('is_published'):
+        post_info['status'] = 'PUBLISHED'
+    else:
+        post_info['status'] = 'DRAFT'
+    
+    return post_info
+
 def get_all_posts():
     """Systematische Suche nach ALLEN Post-Arten mit verschiedenen Endpoints und Parametern"""
     
     all_found_posts = {}  # Dict um Duplikate zu vermeiden
     
-    print("=== SYSTEMATISCHE POST-SUCHE ===\n")
+    logger.info("=== SYSTEMATISCHE POST-SUCHE ===")
     
     # Alle möglichen Endpoints mit verschiedenen Parametern
     endpoints_to_try = [
@@ -43,6 +103,9 @@ def get_all_posts():
         # Special: Individual drafts (to get postSchedules)
         "INDIVIDUAL_DRAFTS",
         
+        # Special: Complete archive via offset/limit paging
+        "ARCHIVE_PAGED",
+        
         # Mit verschiedenen Parametern
         "/api/v1/posts?published=true",
         "/api/v1/posts?published=false", 
@@ -73,160 +136,89 @@ def get_all_posts():
     
     for endpoint in endpoints_to_try:
         if endpoint == "INDIVIDUAL_DRAFTS":
-            print("--- TESTING INDIVIDUAL_DRAFTS ---")
+            logger.info("--- TESTING INDIVIDUAL_DRAFTS ---")
             # First get all draft IDs, then fetch each individually to get postSchedules
             try:
-                drafts_response = session.get(f"{pub_url}/api/v1/drafts")
-                if drafts_response.status_code == 200:
-                    drafts = drafts_response.json()
-                    print(f"Found {len(drafts)} drafts to check individually")
-                    
-                    for draft in drafts:
-                        if 'id' in draft:
-                            draft_id = draft['id']
-                            individual_url = f"{pub_url}/api/v1/drafts/{draft_id}"
-                            
-                            try:
-                                individual_response = session.get(individual_url)
-                                if individual_response.status_code == 200:
-                                    item = individual_response.json()
-                                    post_id = item['id']
-                                    
-                                    # Sammle alle relevanten Daten
-                                    post_info = {
-                                        'id': post_id,
-                                        'endpoint': f"INDIVIDUAL_DRAFTS/{draft_id}",
-                                        'title': item.get('title') or item.get('draft_title', 'NO TITLE'),
-                                        'is_published': item.get('is_published'),
-                                        'post_date': item.get('post_date'),
-                                        'draft_updated_at': item.get('draft_updated_at'),
-                                        'updated_at': item.get('updated_at'),
-                                        'postSchedules': item.get('postSchedules', []),
-                                        'status': 'UNKNOWN'
-                                    }
-                                    
-                                    # Bestimme Status basierend auf Daten
-                                    # FIRST: Check for postSchedules (das ist der echte Schedule!)
-                                    if post_info['postSchedules']:
-                                        try:
-                                            schedule = post_info['postSchedules'][0]  # First schedule
-                                            trigger_at = schedule.get('trigger_at')
-                                            if trigger_at:
-                                                schedule_dt = datetime.fromisoformat(trigger_at.replace('Z', '+00:00'))
-                                                post_info['schedule_date'] = trigger_at
-                                                post_info['status'] = 'SCHEDULED'
-                                        except:
-                                            post_info['status'] = 'SCHEDULE_ERROR'
-                                    elif item.get('post_date'):
-                                        try:
-                                            post_dt = datetime.fromisoformat(item['post_date'].replace('Z', '+00:00'))
-                                            if item.get('is_published'):
-                                                if post_dt > current_time:
-                                                    post_info['status'] = 'SCHEDULED'
-                                                else:
-                                                    post_info['status'] = 'PUBLISHED'
-                                            else:
-                                                post_info['status'] = 'SCHEDULED'
-                                        except:
-                                            post_info['status'] = 'DATE_ERROR'
-                                    elif item.get('is_published'):
-                                        post_info['status'] = 'PUBLISHED'
-                                    else:
-                                        post_info['status'] = 'DRAFT'
-                                    
-                                    all_found_posts[post_id] = post_info
-                                    print(f"  -> {post_info['status']}: {post_info['title']}")
-                                    
-                            except Exception as e:
-                                print(f"Error fetching individual draft {draft_id}: {e}")
+                # Only the ids are kept from the (streamed) drafts listing
+                drafts = list(iter_drafts(session, pub_url, fields=('id',)))
+                logger.info("Found %d drafts to check individually", len(drafts))
+                
+                for draft in drafts:
+                    if 'id' in draft:
+                        draft_id = draft['id']
+                        individual_url = f"{pub_url}/api/v1/drafts/{draft_id}"
+                        
+                        try:
+                            individual_response = session.get(individual_url)
+                            if individual_response.status_code == 200:
+                                item = individual_response.json()
+                                post_id = item['id']
+                                
+                                post_info = classify_post(item, f"INDIVIDUAL_DRAFTS/{draft_id}", current_time)
+                                all_found_posts[post_id] = post_info
+                                logger.debug("  -> %s: %s", post_info['status'], post_info['title'])
+                                
+                        except Exception as e:
+                            logger.warning("Error fetching individual draft %s: %s", draft_id, e)
             except Exception as e:
-                print(f"Error getting drafts list: {e}")
-            print()
+                logger.warning("Error getting drafts list: %s", e)
+            continue
+        
+        if endpoint == "ARCHIVE_PAGED":
+            logger.info("--- TESTING ARCHIVE_PAGED ---")
+            try:
+                count = 0
+                for item in iter_archive():
+                    count += 1
+                    if isinstance(item, dict) and 'id' in item:
+                        post_info = classify_post(item, endpoint, current_time)
+                        all_found_posts[item['id']] = post_info
+                        logger.debug("  -> %s: %s", post_info['status'], post_info['title'])
+                logger.info("Found %d archive posts", count)
+            except Exception as e:
+                logger.warning("Error paging archive: %s", e)
             continue
         
         url = f"{pub_url}{endpoint}"
-        print(f"--- TESTING {endpoint} ---")
+        logger.info("--- TESTING %s ---", endpoint)
         
         try:
-            response = session.get(url)
-            print(f"Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    
-                    if isinstance(data, list):
-                        print(f"Found {len(data)} items")
-                        for item in data:
+            with session.get(url, stream=True) as response:
+                logger.info("Status: %s", response.status_code)
+                
+                if response.status_code == 200:
+                    try:
+                        # Items are parsed one at a time instead of loading the whole response
+                        count = 0
+                        for item in iter_json_array(iter_text_chunks(response)):
+                            count += 1
                             if isinstance(item, dict) and 'id' in item:
                                 post_id = item['id']
                                 
-                                # Sammle alle relevanten Daten
-                                post_info = {
-                                    'id': post_id,
-                                    'endpoint': endpoint,
-                                    'title': item.get('title') or item.get('draft_title', 'NO TITLE'),
-                                    'is_published': item.get('is_published'),
-                                    'post_date': item.get('post_date'),
-                                    'draft_updated_at': item.get('draft_updated_at'),
-                                    'updated_at': item.get('updated_at'),
-                                    'postSchedules': item.get('postSchedules', []),
-                                    'status': 'UNKNOWN'
-                                }
-                                
-                                # Bestimme Status basierend auf Daten
-                                # FIRST: Check for postSchedules (das ist der echte Schedule!)
-                                if post_info['postSchedules']:
-                                    try:
-                                        schedule = post_info['postSchedules'][0]  # First schedule
-                                        trigger_at = schedule.get('trigger_at')
-                                        if trigger_at:
-                                            schedule_dt = datetime.fromisoformat(trigger_at.replace('Z', '+00:00'))
-                                            post_info['schedule_date'] = trigger_at
-                                            post_info['status'] = 'SCHEDULED'
-                                    except:
-                                        post_info['status'] = 'SCHEDULE_ERROR'
-                                elif item.get('post_date'):
-                                    try:
-                                        post_dt = datetime.fromisoformat(item['post_date'].replace('Z', '+00:00'))
-                                        if item.get('is_published'):
-                                            if post_dt > current_time:
-                                                post_info['status'] = 'SCHEDULED'
-                                            else:
-                                                post_info['status'] = 'PUBLISHED'
-                                        else:
-                                            post_info['status'] = 'SCHEDULED'
-                                    except:
-                                        post_info['status'] = 'DATE_ERROR'
-                                elif item.get('is_published'):
-                                    post_info['status'] = 'PUBLISHED'
-                                else:
-                                    post_info['status'] = 'DRAFT'
-                                
+                                post_info = classify_post(item, endpoint, current_time)
                                 all_found_posts[post_id] = post_info
-                                print(f"  -> {post_info['status']}: {post_info['title']}")
+                                logger.debug("  -> %s: %s", post_info['status'], post_info['title'])
+                        logger.info("Found %d items", count)
                     
-                    elif isinstance(data, dict):
-                        print(f"Dict response with keys: {list(data.keys())}")
-                        if 'id' in data:
-                            print(f"Single post found: {data.get('title', 'NO TITLE')}")
+                    except NotAnArrayError as e:
+                        data = e.value
+                        if isinstance(data, dict):
+                            logger.info("Dict response with keys: %s", list(data.keys()))
+                            if 'id' in data:
+                                logger.info("Single post found: %s", data.get('title', 'NO TITLE'))
                     
-                except Exception as e:
-                    print(f"JSON parse error: {e}")
-                    # Check if response contains useful text
-                    if len(response.text) < 200:
-                        print(f"Response text: {response.text}")
-            else:
-                print(f"HTTP Error: {response.status_code}")
-                if response.status_code == 403:
-                    print("  -> Access denied")
-                elif response.status_code == 404:
-                    print("  -> Endpoint not found")
+                    except Exception as e:
+                        logger.warning("JSON parse error: %s", e)
+                else:
+                    logger.info("HTTP Error: %s", response.status_code)
+                    if response.status_code == 403:
+                        logger.info("  -> Access denied")
+                    elif response.status_code == 404:
+                        logger.info("  -> Endpoint not found")
                     
         except Exception as e:
-            print(f"Request error: {e}")
+            logger.warning("Request error: %s", e)
         
-        print()
     
     return all_found_posts
 
@@ -296,9 +288,7 @@ def display_summary(all_posts):
 def find_missing_posts():
     """Versuche herauszufinden warum Posts fehlen könnten"""
     
-    print("=" * 80)
-    print("DIAGNOSE: WARUM FEHLEN POSTS?")
-    print("=" * 80)
+    logger.info("=== DIAGNOSE: WARUM FEHLEN POSTS? ===")
     
     # Test verschiedene Header-Kombinationen
     test_headers = [
@@ -309,7 +299,7 @@ def find_missing_posts():
     ]
     
     for i, headers in enumerate(test_headers):
-        print(f"\n--- TEST {i+1}: Headers {headers} ---")
+        logger.info("--- TEST %d: Headers %s ---", i + 1, headers)
         
         test_session = requests.Session()
         test_session.headers.update({
@@ -324,22 +314,29 @@ def find_missing_posts():
                 test_session.cookies.set(k, v, domain=".substack.com")
         
         try:
-            response = test_session.get(f"{pub_url}/api/v1/posts")
-            print(f"Posts endpoint: {response.status_code}")
-            if response.status_code == 200:
-                data = response.json()
-                print(f"  Found {len(data)} posts")
+            with test_session.get(f"{pub_url}/api/v1/posts", stream=True) as response:
+                logger.info("Posts endpoint: %s", response.status_code)
+                if response.status_code == 200:
+                    count = sum(1 for _ in iter_json_array(iter_text_chunks(response)))
+                    logger.info("  Found %d posts", count)
                 
-            response = test_session.get(f"{pub_url}/api/v1/drafts") 
-            print(f"Drafts endpoint: {response.status_code}")
-            if response.status_code == 200:
-                data = response.json()
-                print(f"  Found {len(data)} drafts")
+            with test_session.get(f"{pub_url}/api/v1/drafts", stream=True) as response:
+                logger.info("Drafts endpoint: %s", response.status_code)
+                if response.status_code == 200:
+                    count = sum(1 for _ in iter_json_array(iter_text_chunks(response)))
+                    logger.info("  Found %d drafts", count)
                 
         except Exception as e:
-            print(f"Error: {e}")
+            logger.warning("Error: %s", e)
 
 if __name__ == "__main__":
+    setup_logging()
+    
+    # python getposts.py --export-archive archive.jsonl
+    if len(sys.argv) == 3 and sys.argv[1] == "--export-archive":
+        export_archive(sys.argv[2])
+        sys.exit()
+    
     print(f"Current time: {datetime.now()}")
     print(f"Publication: {pub_url}\n")
     
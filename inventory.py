@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Multi-account inventory and sync for Substack publications
+Fans out across every registered account concurrently (each with its own session
+and rate budget) and merges the results into one report
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from multi_account import list_all_accounts, create_account_session
+from getposts import classify_post
+from listing import iter_listing, ListingError
+from log_config import setup_logging
+from metrics import count_retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 2.0  # Requests per second per account
+MAX_RETRIES = 3
+
+# Fields classify_post needs - everything else (draft_body!) is dropped while streaming listings
+LISTING_FIELDS = ('id', 'title', 'draft_title', 'is_published', 'post_date',
+                  'draft_updated_at', 'updated_at', 'postSchedules')
+
+
+class RateBudget:
+    """Pace requests for one account to at most `rate` requests per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _log_progress(user_id: str, message: str):
+    logger.info("[%s] %s", user_id, message)
+
+
+def _backoff_delay(headers, attempt: int) -> float:
+    retry_after = headers.get('Retry-After', '')
+    return float(retry_after) if retry_after.isdigit() else 2 ** attempt
+
+
+def _get_json(session, budget: RateBudget, url: str, stats: Dict[str, int], user_id: Optional[str] = None):
+    """GET url within the account's rate budget, backing off on 429 responses"""
+    for attempt in range(MAX_RETRIES + 1):
+        budget.wait()
+        response = session.get(url)
+        stats['requests'] += 1
+
+        if response.status_code == 429 and attempt < MAX_RETRIES:
+            stats['retries'] += 1
+            count_retry(user_id, "429")
+            time.sleep(_backoff_delay(response.headers, attempt))
+            continue
+
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} failed with status {response.status_code}")
+        return response.json()
+
+
+def _get_listing(session, budget: RateBudget, url: str, stats: Dict[str, int],
+                 user_id: Optional[str] = None) -> List[Dict]:
+    """Stream a listing endpoint within the rate budget, keeping only LISTING_FIELDS of each item"""
+    for attempt in range(MAX_RETRIES + 1):
+        budget.wait()
+        stats['requests'] += 1
+        try:
+            return list(iter_listing(session, url, fields=LISTING_FIELDS))
+        except ListingError as e:
+            if e.status_code == 429 and attempt < MAX_RETRIES:
+                stats['retries'] += 1
+                count_retry(user_id, "429")
+                time.sleep(_backoff_delay(e.headers, attempt))
+                continue
+            raise
+
+
+def inventory_account(account: Dict[str, str], rate: float = DEFAULT_RATE, detail: bool = True,
+                      progress: Callable[[str, str], None] = _log_progress) -> Dict:
+    """
+    Inventory all drafts, schedules and published posts of one account
+    detail=True fetches each unpublished draft individually to pick up postSchedules
+    """
+    user_id = account['user_id']
+    started = time.monotonic()
+    stats = {'requests': 0, 'retries': 0}
+    budget = RateBudget(rate)
+    current_time = datetime.now(timezone.utc)
+
+    session = None
+    pub_url = account.get('publication_url')
+    posts = {}
+
+    try:
+        session, pub_url = create_account_session(user_id)
+        drafts = _get_listing(session, budget, f"{pub_url}/api/v1/drafts", stats, user_id)
+        progress(user_id, f"{len(drafts)} drafts listed")
+
+        for draft in drafts:
+            if 'id' not in draft:
+                continue
+            item = draft
+            if detail and not draft.get('is_published', False):
+                item = _get_json(session, budget, f"{pub_url}/api/v1/drafts/{draft['id']}", stats, user_id)
+            posts[item['id']] = classify_post(item, "/api/v1/drafts", current_time)
+
+        published = _get_listing(session, budget, f"{pub_url}/api/v1/posts", stats, user_id)
+        progress(user_id, f"{len(published)} published posts listed")
+
+        for item in published:
+            if isinstance(item, dict) and 'id' in item and item['id'] not in posts:
+                posts[item['id']] = classify_post(item, "/api/v1/posts", current_time)
+
+        error = None
+    except Exception as e:
+        error = str(e)
+        progress(user_id, f"ERROR: {error}")
+    finally:
+        if session is not None:
+            session.close()
+
+    counts = {}
+    for post in posts.values():
+        counts[post['status']] = counts.get(post['status'], 0) + 1
+
+    elapsed = time.monotonic() - started
+    progress(user_id, f"done in {elapsed:.1f}s ({stats['requests']} requests, {len(posts)} posts)")
+
+    return {
+        'user_id': user_id,
+        'publication_url': pub_url,
+        'posts': list(posts.values()),
+        'counts': counts,
+        'error': error,
+        'requests': stats['requests'],
+        'retries': stats['retries'],
+        'elapsed_seconds': round(elapsed, 3)
+    }
+
+
+def _schedule_time(post: Dict) -> Optional[datetime]:
+    """Get the scheduled publish time of a post, if it has one"""
+    date_str = post.get('schedule_date') or (post['post_date'] if post['status'] == 'SCHEDULED' else None)
+    if not date_str:
+        return None
+    try:
+        return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def merge_reports(results: List[Dict]) -> Dict:
+    """Merge per-account inventories into one report with status counts and upcoming schedules"""
+    current_time = datetime.now(timezone.utc)
+    totals = {}
+    upcoming = []
+
+    for result in results:
+        for status, count in result['counts'].items():
+            totals[status] = totals.get(status, 0) + count
+
+        for post in result['posts']:
+            schedule_dt = _schedule_time(post)
+            if schedule_dt and schedule_dt.tzinfo and schedule_dt > current_time:
+                upcoming.append({
+                    'user_id': result['user_id'],
+                    'id': post['id'],
+                    'title': post['title'],
+                    'scheduled_for': schedule_dt.isoformat()
+                })
+
+    upcoming.sort(key=lambda x: x['scheduled_for'])
+
+    return {
+        'generated_at': current_time.isoformat(),
+        'totals': totals,
+        'upcoming_schedules': upcoming,
+        'accounts': [
+            {k: v for k, v in result.items() if k != 'posts'}
+            for result in sorted(results, key=lambda r: r['user_id'])
+        ],
+        'posts': {result['user_id']: result['posts'] for result in results}
+    }
+
+
+def run_inventory(user_ids: Optional[List[str]] = None, rate: float = DEFAULT_RATE, detail: bool = True,
+                  max_workers: Optional[int] = None,
+                  progress: Callable[[str, str], None] = _log_progress) -> Dict:
+    """
+    Inventory every registered account (or only user_ids) concurrently
+    Total time is roughly that of the slowest account
+    """
+    accounts = list_all_accounts()
+    if user_ids:
+        accounts = [acc for acc in accounts if acc['user_id'] in user_ids]
+
+    if not accounts:
+        return merge_reports([])
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers or len(accounts)) as executor:
+        futures = {
+            executor.submit(inventory_account, acc, rate, detail, progress): acc
+            for acc in accounts
+        }
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # inventory_account records its own errors; this only catches the unexpected
+                acc = futures[future]
+                progress(acc['user_id'], f"ERROR: {e}")
+                results.append({
+                    'user_id': acc['user_id'],
+                    'publication_url': acc['publication_url'],
+                    'posts': [],
+                    'counts': {},
+                    'error': str(e),
+                    'requests': 0,
+                    'retries': 0,
+                    'elapsed_seconds': 0.0
+                })
+
+    return merge_reports(results)
+
+
+def display_report(report: Dict):
+    """Print a short summary of a merged inventory report"""
+    print("=" * 60)
+    print(f"INVENTORY REPORT ({report['generated_at']})")
+    print("=" * 60)
+
+    for acc in report['accounts']:
+        status = f"ERROR: {acc['error']}" if acc['error'] else "ok"
+        print(f"{acc['user_id']:<20} {acc['publication_url']:<40} {acc['elapsed_seconds']:>6.1f}s  {status}")
+        print(f"  {acc['counts']}")
+
+    print(f"\nTotals: {report['totals']}")
+
+    print(f"\nUpcoming schedules ({len(report['upcoming_schedules'])}):")
+    for item in report['upcoming_schedules']:
+        print(f"  {item['scheduled_for']}  [{item['user_id']}] {item['id']}: {item['title']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inventory drafts, schedules and posts of all accounts")
+    parser.add_argument("--accounts", help="Comma separated user_ids (default: all accounts)")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Max requests per second per account")
+    parser.add_argument("--no-detail", action="store_true", help="Skip per-draft requests (no postSchedules)")
+    parser.add_argument("--output", help="Write the merged report as JSON to this file")
+    args = parser.parse_args()
+
+    setup_logging()
+
+    user_ids = args.accounts.split(',') if args.accounts else None
+    report = run_inventory(user_ids, rate=args.rate, detail=not args.no_detail)
+
+    display_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nReport written to {args.output}")
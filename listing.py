@@ -0,0 +1,201 @@
+# listing.py - Incremental parsing of large Substack listing responses
+import codecs
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_PAGE_SIZE = 25
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class ListingError(Exception):
+    """Raised when a listing endpoint does not return 200"""
+
+    def __init__(self, url, status_code, text, headers=None):
+        super().__init__(f"GET {url} failed with status {status_code}: {text[:200]}")
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class NotAnArrayError(ValueError):
+    """Raised by iter_json_array when the document is not a JSON array (value holds the decoded document)"""
+
+    def __init__(self, value):
+        super().__init__("JSON document is not an array")
+        self.value = value
+
+
+def iter_text_chunks(response, chunk_size=CHUNK_SIZE):
+    """Decode a streamed (stream=True) response body into text chunks"""
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_json_array(chunks):
+    """
+    Yield the elements of a top-level JSON array one at a time from an iterable of text chunks
+    Only the element currently being decoded (plus unread buffer) is held in memory
+    """
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def read_more(min_size):
+        # Read until at least min_size new characters arrived (or the stream ends);
+        # growing geometrically keeps re-decoding of huge elements amortized linear
+        nonlocal buffer, pos, eof
+        parts = [buffer[pos:]]
+        added = 0
+        while added < min_size:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                eof = True
+                break
+            parts.append(chunk)
+            added += len(chunk)
+        buffer = ''.join(parts)
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            read_more(1)
+
+    skip_whitespace()
+    if pos >= len(buffer):
+        return
+
+    if buffer[pos] != '[':
+        # Not an array - decode the whole document and hand it to the caller
+        while not eof:
+            read_more(CHUNK_SIZE)
+        raise NotAnArrayError(json.loads(buffer[pos:]))
+    pos += 1
+
+    expect_value = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+
+        char = buffer[pos]
+        if char == ']':
+            return
+        if char == ',' and not expect_value:
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            value, end = _decoder.raw_decode(buffer, pos)
+            if end >= len(buffer) and not eof:
+                # A scalar could continue in the next chunk - make sure it is complete
+                raise json.JSONDecodeError("Element may be truncated", buffer, end)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            read_more(max(CHUNK_SIZE, len(buffer) - pos))
+            continue
+
+        pos = end
+        expect_value = False
+        yield value
+
+
+def iter_listing(session, url, fields=None, params=None):
+    """
+    Stream a listing endpoint and yield its items one at a time
+    fields limits each yielded item to those keys, so large values like draft_body are dropped right away
+    Raises ListingError if the endpoint does not return 200
+    """
+    with session.get(url, params=params, stream=True) as response:
+        if response.status_code != 200:
+            raise ListingError(url, response.status_code, response.text, response.headers)
+
+        for item in iter_json_array(iter_text_chunks(response)):
+            if fields is not None and isinstance(item, dict):
+                item = {key: item[key] for key in fields if key in item}
+            yield item
+
+
+def iter_drafts(session, pub_url, fields=None, unpublished_only=False):
+    """Iterate over all drafts of a publication without loading the whole listing into memory"""
+    for draft in iter_listing(session, f"{pub_url}/api/v1/drafts"):
+        if unpublished_only and draft.get('is_published', False):
+            continue
+        if fields is not None:
+            draft = {key: draft[key] for key in fields if key in draft}
+        yield draft
+
+
+def fetch_page(session, url, offset, limit, params=None, fields=None):
+    """Fetch one offset/limit page of a listing endpoint as a list"""
+    page_params = dict(params or {})
+    page_params['offset'] = offset
+    page_params['limit'] = limit
+    return list(iter_listing(session, url, fields=fields, params=page_params))
+
+
+def iter_pages(session, url, page_size=DEFAULT_PAGE_SIZE, params=None, fields=None, prefetch=True):
+    """
+    Page through an offset/limit listing endpoint and yield its items
+    With prefetch=True the next page is requested in a background thread while the current
+    page is consumed. Stops after an empty page, a page shorter than the largest one the server
+    returned (servers may cap limit below page_size), or as soon as the caller stops iterating
+    """
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    pending = None
+    offset = 0
+    previous_first_id = None
+    largest = 0
+
+    def request(page_offset):
+        if executor:
+            # Run in a copy of the caller's context so the page request's trace span keeps its parent
+            return executor.submit(contextvars.copy_context().run, fetch_page,
+                                   session, url, page_offset, page_size, params, fields)
+        return fetch_page(session, url, page_offset, page_size, params, fields)
+
+    try:
+        pending = request(offset)
+        while True:
+            page = pending.result() if executor else pending
+            pending = None
+
+            # Endpoints that ignore offset would otherwise return the same page forever
+            first_id = page[0].get('id') if page and isinstance(page[0], dict) else None
+            if not page or (first_id is not None and first_id == previous_first_id):
+                return
+            previous_first_id = first_id
+
+            offset += len(page)
+            largest = max(largest, len(page))
+            if len(page) >= largest:
+                pending = request(offset)
+
+            yield from page
+
+            if pending is None:
+                return
+    finally:
+        # Caller broke out early - drop the page being prefetched
+        if executor:
+            if pending is not None:
+                pending.cancel()
+            executor.shutdown(wait=False)
@@ -0,0 +1,91 @@
+# log_config.py - Logging setup shared by the command line tools and the API server
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+# LOG_LEVEL=DEBUG|INFO|WARNING|ERROR, LOG_FORMAT=text|json
+DEFAULT_LEVEL = "INFO"
+CLI_FORMAT = "%(message)s"
+SERVER_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Attributes every LogRecord has - anything else was passed via extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any extra={...} fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class Lazy:
+    """
+    Defer an expensive log argument until the message is actually formatted
+    logger.debug("Blocks: %s", Lazy(lambda: [b['type'] for b in blocks]))
+    """
+    __slots__ = ("func",)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def setup_logging(level=None, fmt=None, text_format=CLI_FORMAT, background=False):
+    """
+    Configure the root logger once for a process (level/format default to LOG_LEVEL/LOG_FORMAT)
+    background=True moves the actual stream I/O to a listener thread, so logging from the
+    API server's event loop only enqueues records
+    """
+    global _listener
+
+    level = (level or os.getenv("LOG_LEVEL") or DEFAULT_LEVEL).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT") or "text").lower()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(text_format))
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    _stop_listener()
+
+    if background:
+        log_queue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        root.addHandler(handler)
+
+    root.setLevel(level)
@@ -0,0 +1,412 @@
+# markdown_parser.py - Markdown front-end: compiles Markdown into the content_nodes document model
+import re
+
+from block_registry import ParseState, registry as block_types
+from content_nodes import (Doc, Paragraph, Heading, Text, Link, MARKS, Blockquote, BulletList, OrderedList,
+                           ListItem, CodeBlock, HorizontalRule, LatexBlock, Footnote, FootnoteAnchor)
+from tracing import traced
+
+# Supported (CommonMark subset plus the usual extensions):
+#   # ATX and Setext headings, paragraphs, > blockquotes, - * + and 1. 1) lists (nested by indentation),
+#   ``` ~~~ fenced and indented code, --- *** ___ rules, $$ math $$, [^1] footnotes,
+#   **strong** __strong__ *em* _em_ ***both*** ~~strike~~ `code` [links](url) <autolinks> \escapes
+# Images ![alt](src) become links, hard line breaks become spaces (there is no line break node) and
+# link reference definitions are not resolved (that needs the whole document before the first block).
+# A line "Keyword:: content" with a registered block type (Subscribe::, Button::, ...) is a block of its
+# own, compiled by that block's handler, so call-to-action blocks work in Markdown too.
+
+ATX_HEADING = re.compile(r' {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+SETEXT_UNDERLINE = re.compile(r' {0,3}(?:=+|-+)[ \t]*$')
+THEMATIC_BREAK = re.compile(r' {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$')
+CODE_FENCE = re.compile(r'( {0,3})(`{3,}|~{3,})[ \t]*(.*?)[ \t]*$')
+BLOCKQUOTE = re.compile(r' {0,3}> ?(.*)$')
+LIST_ITEM = re.compile(r'( {0,3})([-+*]|\d{1,9}[.)])(?:( +)(.*))?$')
+FOOTNOTE_DEFINITION = re.compile(r' {0,3}\[\^([^\]\s]+)\]:[ \t]*(.*)$')
+MATH_BLOCK = re.compile(r' {0,3}\$\$(.*)$')
+DIRECTIVE = re.compile(r'([A-Za-z][A-Za-z0-9_-]*)::[ \t]*(.*)$')
+
+# Characters a block start can begin with (after indentation); other lines go straight to paragraphs
+BLOCK_START_CHARS = frozenset('#=-*_+`~>$[0123456789')
+
+# One pass over a paragraph's text; the alternatives are tried left to right at each position and the
+# group closed last (match.lastgroup) tells which one matched
+INLINE = re.compile(r'''
+    (?=[`\\\[!<*_~])  # cheap test first: every alternative starts with one of these
+    (?:
+    (?P<code_marker>`+)(?P<code>.+?)(?<!`)(?P=code_marker)(?!`)
+  | \\(?P<escaped>[!-/:-@\[-`{-~])
+  | \[\^(?P<footnote>[^\]\s]+)\]
+  | !?\[(?P<link_text>(?:[^\[\]]|\[[^\[\]]*\])*)\]\(\s*<?(?P<href>[^\s<>()]*)>?(?:\s+(?:"[^"]*"|'[^']*'))?\s*\)
+  | <(?P<autolink>[A-Za-z][A-Za-z0-9+.-]{1,31}:[^\s<>]*)>
+  | \*\*\*(?=\S)(?P<strong_em>.+?)(?<=\S)\*\*\*
+  | (?P<strong_marker>\*\*|__)(?=\S)(?P<strong>.+?)(?<=\S)(?P=strong_marker)
+  | ~~(?=\S)(?P<strikethrough>.+?)(?<=\S)~~
+  | \*(?=\S)(?P<em>(?:\*\*.+?\*\*|[^*])+?)(?<=\S)\*
+  | (?<!\w)_(?=\S)(?P<em_underscore>(?:__.+?__|[^_])+?)(?<=\S)_(?!\w)
+    )
+''', re.VERBOSE | re.DOTALL)
+
+# Text without any of these is plain text
+INLINE_SPECIAL = re.compile(r'[`\\\[<*_~]')
+
+MARK_GROUPS = {
+    'strong': (MARKS['strong'],),
+    'em': (MARKS['em'],),
+    'em_underscore': (MARKS['em'],),
+    'strikethrough': (MARKS['strikethrough'],),
+    'strong_em': (MARKS['strong'], MARKS['em']),
+}
+
+
+class _Lines:
+    """Line iterator with one line of look-ahead (line ending removed, tabs expanded)"""
+    __slots__ = ('_lines', '_peeked')
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._peeked = None
+
+    def peek(self):
+        """The next line without consuming it, None at the end"""
+        if self._peeked is None:
+            line = next(self._lines, None)
+            if line is not None:
+                line = line.rstrip('\r\n')
+                if '\t' in line:
+                    line = line.expandtabs(4)
+            self._peeked = line
+        return self._peeked
+
+    def next(self):
+        line = self.peek()
+        self._peeked = None
+        return line
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip(' '))
+
+
+def _footnote_number(label, state):
+    """Footnotes are numbered in order of first appearance, whatever their labels are"""
+    numbers = state.data['footnotes']
+    number = numbers.get(label)
+    if number is None:
+        number = numbers[label] = len(numbers) + 1
+    return number
+
+
+def _append_text(out, text, marks):
+    """Append a Text node, extending the previous one if it has the same marks (escapes split text)"""
+    if out:
+        last = out[-1]
+        if last.__class__ is Text and last.marks is marks:
+            last.text += text
+            return
+    out.append(Text(text, marks))
+
+
+def parse_inline_markdown(text, state, marks=(), out=None):
+    """Inline Markdown into Text / FootnoteAnchor nodes (appended to out); marks apply to all of them"""
+    if out is None:
+        out = []
+    if not INLINE_SPECIAL.search(text):
+        _append_text(out, text, marks)
+        return out
+    position = 0
+    for match in INLINE.finditer(text):
+        start = match.start()
+        if start > position:
+            _append_text(out, text[position:start], marks)
+        kind = match.lastgroup
+        if kind == 'escaped':
+            _append_text(out, match.group('escaped'), marks)
+        elif kind == 'code':
+            code = match.group('code')
+            # `` `x` `` - one space on both sides is padding, not content
+            if len(code) > 2 and code[0] == ' ' and code[-1] == ' ' and code.strip():
+                code = code[1:-1]
+            out.append(Text(code, marks + (MARKS['code'],)))
+        elif kind == 'href':
+            href = match.group('href')
+            parse_inline_markdown(match.group('link_text') or href, state, marks + (Link(href),), out)
+        elif kind == 'autolink':
+            href = match.group('autolink')
+            out.append(Text(href, marks + (Link(href),)))
+        elif kind == 'footnote':
+            out.append(FootnoteAnchor(_footnote_number(match.group('footnote'), state)))
+        else:
+            parse_inline_markdown(match.group(kind), state, marks + MARK_GROUPS[kind], out)
+        position = match.end()
+    if position < len(text):
+        _append_text(out, text[position:], marks)
+    return out
+
+
+def _starts_block(line):
+    """Whether line ends a paragraph (blank lines are checked by the caller)"""
+    stripped = line.lstrip(' ')
+    if stripped[0] not in BLOCK_START_CHARS or len(line) - len(stripped) > 3:
+        return False
+    if ATX_HEADING.match(line) or CODE_FENCE.match(line) or THEMATIC_BREAK.match(line) \
+            or BLOCKQUOTE.match(line) or MATH_BLOCK.match(line) or FOOTNOTE_DEFINITION.match(line):
+        return True
+    # Only lists that can't be mistaken for prose interrupt a paragraph: a bullet or "1." with text
+    match = LIST_ITEM.match(line)
+    return bool(match and match.group(4) and (not match.group(2)[0].isdigit() or match.group(2)[:-1] == '1'))
+
+
+def _registered_block(line):
+    """(handler, content) if line is "Keyword:: content" for a registered block type, else None"""
+    if '::' not in line:
+        return None
+    match = DIRECTIVE.match(line.strip())
+    if match and match.group(2):
+        handler = block_types.handlers.get(match.group(1).lower())
+        if handler is not None:
+            return handler, match.group(2).strip()
+    return None
+
+
+def _paragraph(line, lines, state):
+    """Paragraph (or Setext heading / registered block) starting at line; lines are joined with spaces"""
+    registered = _registered_block(line)
+    if registered:
+        handler, content = registered
+        return handler(content, state)
+
+    parts = [line.strip()]
+    while True:
+        following = lines.peek()
+        if following is None or not following.strip():
+            break
+        if SETEXT_UNDERLINE.match(following):
+            lines.next()
+            content = parse_inline_markdown(' '.join(parts), state)
+            return Heading(1 if '=' in following else 2, content) if content else None
+        if _starts_block(following) or _registered_block(following):
+            break
+        parts.append(lines.next().strip())
+
+    content = parse_inline_markdown(' '.join(parts), state)
+    return Paragraph(content) if content else Paragraph()
+
+
+def _fenced_code(match, lines):
+    indent = len(match.group(1))
+    fence = match.group(2)
+    info = match.group(3)
+    closing = re.compile(r' {0,3}' + re.escape(fence[0]) + '{' + str(len(fence)) + r',}[ \t]*$')
+    code = []
+    while True:
+        line = lines.next()
+        if line is None or closing.match(line):
+            break
+        # Content lines lose the fence's own indentation
+        code.append(line[min(indent, _indent(line)):])
+    code = '\n'.join(code)
+    return CodeBlock(info.split()[0] if info else None, [Text(code)] if code else [])
+
+
+def _indented_code(line, lines):
+    code = [line[4:]]
+    blank = []
+    while True:
+        following = lines.peek()
+        if following is None:
+            break
+        if not following.strip():
+            blank.append('')
+            lines.next()
+            continue
+        if _indent(following) < 4:
+            break
+        code.extend(blank)
+        blank = []
+        code.append(lines.next()[4:])
+    return CodeBlock(None, [Text('\n'.join(code))])
+
+
+def _math(match, lines, state):
+    rest = match.group(1).rstrip()
+    if len(rest) >= 2 and rest.endswith('$$'):
+        # $$ expression $$ on one line
+        expression = rest[:-2]
+    else:
+        parts = [rest]
+        while True:
+            line = lines.next()
+            if line is None:
+                break
+            stripped = line.rstrip()
+            if stripped.endswith('$$'):
+                parts.append(stripped[:-2])
+                break
+            parts.append(line)
+        expression = '\n'.join(parts)
+    expression = expression.strip()
+    if not expression:
+        return None
+    node = LatexBlock(expression, f"EQUATION_{state.equation_number}")
+    state.equation_number += 1
+    return node
+
+
+def _quote_lines(first, lines):
+    """Lines of a blockquote with the > markers removed, lazy continuation lines included"""
+    yield first
+    while True:
+        following = lines.peek()
+        if following is None:
+            return
+        match = BLOCKQUOTE.match(following)
+        if match:
+            lines.next()
+            yield match.group(1)
+        elif following.strip() and not _starts_block(following):
+            yield lines.next()
+        else:
+            return
+
+
+def _item_lines(first, width, lines):
+    """
+    Lines belonging to a list item or footnote definition, outdented by width: lines indented at least
+    width, blank lines followed by such lines and lazy continuation lines of its last paragraph
+    """
+    yield first
+    blank = 0
+    while True:
+        following = lines.peek()
+        if following is None:
+            return
+        if not following.strip():
+            blank += 1
+            lines.next()
+            continue
+        if _indent(following) >= width:
+            for _ in range(blank):
+                yield ''
+            blank = 0
+            yield lines.next()[width:]
+        elif not blank and not _starts_block(following) and not LIST_ITEM.match(following):
+            yield lines.next().strip()
+        else:
+            return
+
+
+def _item_start(match):
+    """(first line content, content column) of a list item match"""
+    marker_end = len(match.group(1)) + len(match.group(2))
+    spaces = match.group(3)
+    if not spaces:
+        return '', marker_end + 1
+    if len(spaces) > 4:
+        # Content indented further is indented code: the marker takes one space
+        return spaces[1:] + match.group(4), marker_end + 1
+    return match.group(4), marker_end + len(spaces)
+
+
+def _list(match, lines, state):
+    marker = match.group(2)
+    ordered = marker[0].isdigit()
+    delimiter = marker[-1]
+    items = []
+    while True:
+        first, width = _item_start(match)
+        children = list(_blocks(_Lines(_item_lines(first, width, lines)), state))
+        items.append(ListItem(children or [Paragraph()]))
+
+        following = lines.peek()
+        if following is None or THEMATIC_BREAK.match(following):
+            break
+        match = LIST_ITEM.match(following)
+        # A different bullet character or delimiter starts a new list
+        if not match or match.group(2)[-1] != delimiter or match.group(2)[0].isdigit() != ordered:
+            break
+        lines.next()
+    return OrderedList(items) if ordered else BulletList(items)
+
+
+def _footnote_definition(match, lines, state):
+    number = _footnote_number(match.group(1), state)
+    children = list(_blocks(_Lines(_item_lines(match.group(2), 4, lines)), state))
+    state.data['footnote_definitions'].append(Footnote(number, children or [Paragraph()]))
+
+
+def _block(line, lines, state):
+    """Node of the block starting at line, which starts with one of BLOCK_START_CHARS"""
+    first = line.lstrip(' ')[0]
+    if first == '#':
+        match = ATX_HEADING.match(line)
+        if match:
+            text = match.group(2)
+            return Heading(len(match.group(1)), parse_inline_markdown(text, state)) if text else None
+    elif first == '`' or first == '~':
+        match = CODE_FENCE.match(line)
+        if match:
+            return _fenced_code(match, lines)
+    elif first == '>':
+        match = BLOCKQUOTE.match(line)
+        children = list(_blocks(_Lines(_quote_lines(match.group(1), lines)), state))
+        return Blockquote(children) if children else None
+    elif first == '$':
+        match = MATH_BLOCK.match(line)
+        if match:
+            return _math(match, lines, state)
+    elif first == '[':
+        match = FOOTNOTE_DEFINITION.match(line)
+        if match:
+            return _footnote_definition(match, lines, state)
+    elif first != '=':
+        # - * _ + or a digit
+        if THEMATIC_BREAK.match(line):
+            return HorizontalRule()
+        match = LIST_ITEM.match(line)
+        if match:
+            return _list(match, lines, state)
+    return _paragraph(line, lines, state)
+
+
+def _blocks(lines, state):
+    """Nodes of the blocks in lines, each yielded as soon as its last line has been read"""
+    while True:
+        line = lines.next()
+        if line is None:
+            return
+        stripped = line.lstrip(' ')
+        if not stripped:
+            continue
+        indent = len(line) - len(stripped)
+        if indent >= 4:
+            yield _indented_code(line, lines)
+            continue
+        node = _paragraph(line, lines, state) if stripped[0] not in BLOCK_START_CHARS \
+            else _block(line, lines, state)
+        if node is not None:
+            yield node
+
+
+def iter_markdown(markdown, state=None):
+    """
+    Compile Markdown block by block, yielding each top-level node as soon as it is complete
+    markdown: a string, an open text file or any iterable of lines (read once, lazily)
+    Footnote definitions are collected and yielded last, in number order, where Substack expects them
+    """
+    if isinstance(markdown, str):
+        markdown = markdown.splitlines()
+    state = state or ParseState()
+    state.data.setdefault('footnotes', {})
+    definitions = state.data.setdefault('footnote_definitions', [])
+    yield from _blocks(_Lines(markdown), state)
+    definitions.sort(key=lambda footnote: footnote.number)
+    yield from definitions
+
+
+@traced()
+def parse_markdown(markdown):
+    """
+    Parse Markdown into a content_nodes.Doc, the same document model parse_markup() builds
+    (# Heading is Title::/H1::, > quote is Quote::, - item is List::, $$ x $$ is LaTeX:: and so on)
+    """
+    return Doc(list(iter_markdown(markdown)))
@@ -0,0 +1,183 @@
+# metrics.py - Histograms and counters for the API server, rendered in Prometheus text format
+import os
+import re
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# METRICS=off disables all recording (no session hooks, timers return immediately)
+ENABLED = os.getenv("METRICS", "on").lower() not in ("off", "0", "false")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4"  # the response adds charset=utf-8
+
+# /pub/x/api/v1/drafts/123/publish -> /api/v1/drafts/{id}/publish
+_API_PATH = re.compile(r'/api/v1/.*')
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Cumulative histogram per label combination; observe() is one bisect and a few additions"""
+
+    def __init__(self, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+        for label_values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labels, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label combination"""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            series = dict(self.series)
+        for label_values, value in sorted(series.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("substack_api_request_seconds", "API server request duration by route and status",
+                            ("route", "method", "status"))
+PHASE_SECONDS = Histogram("substack_api_phase_seconds", "Duration of one phase of an operation",
+                          ("route", "phase", "account"))
+UPSTREAM_SECONDS = Histogram("substack_upstream_request_seconds",
+                             "Substack API request duration (until response headers) by endpoint",
+                             ("endpoint", "method", "account", "status"))
+CONNECTIONS_OPENED = Counter("substack_upstream_connections_opened_total",
+                             "New TCP/TLS connections opened to Substack", ("account",))
+CONNECTIONS_REUSED = Counter("substack_upstream_connections_reused_total",
+                             "Substack requests sent on an already open pooled connection", ("account",))
+RETRIES = Counter("substack_upstream_retries_total", "Retried Substack requests", ("account", "reason"))
+
+# urllib3 pool -> (num_connections, num_requests) at the last response seen from it
+_pool_counts = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+
+
+def endpoint_label(url):
+    """Low-cardinality endpoint name of an upstream URL"""
+    match = _API_PATH.search(url.split('?', 1)[0])
+    path = match.group() if match else '/'
+    return _ID_SEGMENT.sub('/{id}', path)
+
+
+def _count_connections(response, account):
+    pool = getattr(response.raw, '_pool', None)
+    if pool is None:
+        return
+    connections, requests_sent = pool.num_connections, pool.num_requests
+    with _pool_lock:
+        last_connections, last_requests = _pool_counts.get(pool, (0, 0))
+        _pool_counts[pool] = (connections, requests_sent)
+    opened = max(0, connections - last_connections)
+    sent = max(0, requests_sent - last_requests)
+    if opened:
+        CONNECTIONS_OPENED.inc(account, amount=opened)
+    if sent > opened:
+        CONNECTIONS_REUSED.inc(account, amount=sent - opened)
+
+
+def instrument_session(session, account):
+    """Time every request of a requests.Session (response hook, so it also sees cassette replays)"""
+    if not ENABLED:
+        return session
+    account = account or "default"
+
+    def record(response, *args, **kwargs):
+        request = response.request
+        UPSTREAM_SECONDS.observe(response.elapsed.total_seconds(), endpoint_label(request.url),
+                                 request.method, account, str(response.status_code))
+        _count_connections(response, account)
+
+    session.hooks['response'].append(record)
+    return session
+
+
+@contextmanager
+def timed(route, phase, account=None):
+    """Record the duration of the with-block as one phase of route"""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_SECONDS.observe(time.perf_counter() - started, route, phase, account or "default")
+
+
+def count_retry(account, reason):
+    if ENABLED:
+        RETRIES.inc(account or "default", reason)
+
+
+def register(collector):
+    """Add an object with a render() -> list of lines method to the /metrics output"""
+    _registry.append(collector)
+
+
+def render():
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
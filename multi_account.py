@@ -6,11 +6,19 @@ Handles loading/saving environment variables for different Substack accounts
 
 import os
 import glob
-from typing import Dict, Optional, List
+import threading
+import requests
+from typing import Dict, Optional, List, Tuple
 from dotenv import load_dotenv, set_key
+from substack_session import build_session, Account
+from tracing import span
 
 ENV_DIR = "env"
 
+# user_id -> (env_vars, Account) for get_account
+_accounts = {}
+_accounts_lock = threading.Lock()
+
 def get_all_account_files() -> List[str]:
     """Get list of all .account*.env files"""
     return glob.glob(os.path.join(ENV_DIR, ".account*.env"))
@@ -104,6 +112,37 @@ def set_active_account_env(user_id: str):
     for key, value in env_vars.items():
         os.environ[key] = value
 
+def create_account_session(user_id: str) -> Tuple[requests.Session, str]:
+    """
+    Create an authenticated session for the specified account without touching os.environ
+    Returns (session, publication_url)
+    """
+    env_vars = load_account_env(user_id)
+    return build_session(env_vars), env_vars.get('PUBLICATION_URL')
+
+def get_account(user_id: str) -> Account:
+    """
+    Get the Account (user_id, pub_url, session) for user_id, reusing its session across calls
+    The session is rebuilt when the account's env file changed (e.g. new cookies via the webhook)
+    Raises ValueError if no account has this user_id
+    """
+    with span("get_account", **{"substack.account": user_id}) as current:
+        env_vars = load_account_env(user_id)
+
+        with _accounts_lock:
+            cached = _accounts.get(user_id)
+            if cached and cached[0] == env_vars:
+                if current:
+                    current.set_attribute("cache_hit", True)
+                return cached[1]
+
+            account = Account(user_id, env_vars.get('PUBLICATION_URL'), build_session(env_vars))
+            # The replaced session is not closed: requests still running on it keep working and
+            # its connections are released when the last of them drops it
+            _accounts[user_id] = (env_vars, account)
+
+    return account
+
 def create_sample_account(account_num: int = 2) -> str:
     """
     Create a sample account env file for testing
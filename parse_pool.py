@@ -0,0 +1,119 @@
+# parse_pool.py - Large markup/Markdown documents compiled in worker processes, off the event loop
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from block_registry import registry as block_types
+from content_schema import validate_document
+from draft_create import parse_markup
+from markdown_parser import parse_markdown
+
+logger = logging.getLogger(__name__)
+
+# Documents of at least this many characters are compiled in a worker process (0 = never)
+PROCESS_THRESHOLD = int(os.getenv("PARSE_PROCESS_THRESHOLD", 256 * 1024))
+# Worker processes (default: CPU count)
+PROCESS_WORKERS = int(os.getenv("PARSE_PROCESS_WORKERS", 0)) or None
+# How workers are started: fork on Linux (workers inherit the block types as is), elsewhere the
+# platform default (macOS spawns, fork is unsafe there); None = platform default
+START_METHOD = os.getenv("PARSE_START_METHOD") or ("fork" if sys.platform == "linux" else None)
+
+PARSERS = {'markup': parse_markup, 'markdown': parse_markdown}
+
+
+def compile_text(text, syntax='markup'):
+    """Parse and validate text: (content_nodes.Doc, block count, validation errors)"""
+    document = PARSERS[syntax](text)
+    return document, len(document.content), validate_document(document)
+
+
+def _compile_in_worker(text, syntax):
+    # The document goes back as draft_body JSON text: one string is pickled, not the node tree
+    document, blocks, errors = compile_text(text, syntax)
+    return document.dumps(), blocks, errors
+
+
+def _install_handlers(handlers):
+    # spawn/forkserver workers import block_registry afresh and only know the built-in block types
+    block_types.handlers = handlers
+
+
+class ParsePool:
+    """
+    Process pool started on first use, with the block types registered at that point: forked
+    workers inherit them, other start methods get them pickled through the pool initializer.
+    Registering more (registry.handlers is replaced on every change) restarts the pool. Handlers
+    that cannot be pickled (lambdas, closures) keep non-fork pools from starting: documents are
+    then parsed in a thread
+    """
+
+    def __init__(self, threshold=PROCESS_THRESHOLD, workers=PROCESS_WORKERS, start_method=START_METHOD):
+        self.threshold = threshold
+        self.workers = workers
+        self.context = multiprocessing.get_context(start_method)
+        self.executor = None
+        self.handlers = None
+        self.lock = threading.Lock()
+
+    def _executor(self):
+        with self.lock:
+            if self.handlers is not block_types.handlers:
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                self.handlers = block_types.handlers
+                self.executor = self._start(self.handlers)
+            return self.executor
+
+    def _start(self, handlers):
+        method = self.context.get_start_method()
+        options = {}
+        if method != 'fork':
+            try:
+                pickle.dumps(handlers)
+            except Exception as e:
+                logger.warning("Block handlers cannot be sent to %s workers (%s); parsing in a thread", method, e)
+                return None
+            options = {'initializer': _install_handlers, 'initargs': (handlers,)}
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.context, **options)
+        logger.info("Started parse worker pool (%s workers, %s)", self.workers or os.cpu_count(), method)
+        return executor
+
+    def offloaded(self, text):
+        return 0 < self.threshold <= len(text)
+
+    async def compile(self, text, syntax='markup'):
+        """
+        compile_text() without blocking the event loop for large documents: small ones are parsed
+        inline (document is a content_nodes.Doc), large ones in a worker (document is JSON text).
+        Both kinds are accepted by create_draft(content_json=...)
+        """
+        if not self.offloaded(text):
+            return compile_text(text, syntax)
+        loop = asyncio.get_running_loop()
+        executor = self._executor()
+        if executor is None:
+            return await loop.run_in_executor(None, compile_text, text, syntax)
+        try:
+            return await loop.run_in_executor(executor, _compile_in_worker, text, syntax)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); the next call starts a new pool
+            with self.lock:
+                self.executor = None
+                self.handlers = None
+            raise
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+            self.handlers = None
+
+
+pool = ParsePool()
@@ -0,0 +1,122 @@
+# post_templates.py - Markup documents compiled once and filled in per draft ({{name}} slots)
+import logging
+import re
+import threading
+from json.encoder import encode_basestring_ascii as _encode_str
+
+from content_schema import check_document
+from draft_create import parse_markup, create_draft, find_reference_draft
+from draft_index import DuplicateDraft
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+SLOT = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+
+# Slots travel through parse_markup as private-use characters, which the JSON encoding escapes
+_MARKER = "\ue001{}\ue001"
+_ENCODED_MARKER = re.compile(r'\\ue001([A-Za-z_][A-Za-z0-9_]*)\\ue001')
+
+
+class PostTemplate:
+    """
+    A markup document with {{name}} slots in its text, links and button URLs, parsed once
+        template = PostTemplate("Title:: Weekly digest for {{segment}} | Text:: Hi {{name}}, ...",
+                                title="Digest: {{segment}}")
+        template.render({"segment": "Tech", "name": "Ana"})  # draft_body JSON
+    The parsed document is kept as its JSON cut at the slots, so a variant is one join of
+    pre-encoded pieces and escaped values: nothing is parsed again and values are taken
+    literally (markup such as ** or | in a value is not interpreted)
+    """
+    __slots__ = ('markup', 'title', 'subtitle', 'slots', 'blocks', 'steps', 'tail', 'whole')
+
+    def __init__(self, markup, title="", subtitle="", registry=None):
+        self.markup = markup
+        self.title = title
+        self.subtitle = subtitle or ""
+        document = parse_markup(SLOT.sub(lambda match: _MARKER.format(match.group(1)), markup), registry)
+        # Checked once here: a filled in variant only differs in the (non-empty) slot values
+        check_document(document)
+        self.blocks = len(document.content)
+
+        split = _ENCODED_MARKER.split(document.dumps())
+        self.steps = list(zip(split[0:-1:2], split[1::2]))
+        self.tail = split[-1]
+        lost = set(SLOT.findall(markup)) - set(split[1::2])
+        if lost:
+            raise ValueError(f"Slots outside text, links and button URLs: {', '.join(sorted(lost))}")
+
+        # Slots that make up a whole text node or URL must not be empty
+        pieces = split[0::2]
+        self.whole = frozenset(name for index, name in enumerate(split[1::2])
+                               if pieces[index].endswith('"') and pieces[index + 1].startswith('"'))
+        self.slots = frozenset(split[1::2]) | frozenset(SLOT.findall(self.title + self.subtitle))
+
+    def _check(self, values):
+        missing = self.slots - values.keys()
+        if missing:
+            raise ValueError(f"Missing template values: {', '.join(sorted(missing))}")
+        for name in self.whole:
+            if not str(values[name]):
+                raise ValueError(f"Template value '{name}' must not be empty")
+
+    def render(self, values):
+        """draft_body JSON with the slots filled in from values (a dict, values converted with str)"""
+        self._check(values)
+        parts = []
+        for piece, name in self.steps:
+            parts.append(piece)
+            parts.append(_encode_str(str(values[name]))[1:-1])
+        parts.append(self.tail)
+        return ''.join(parts)
+
+    def render_title(self, values):
+        """(title, subtitle) with the slots filled in"""
+        def fill(match):
+            return str(values[match.group(1)])
+        return SLOT.sub(fill, self.title), SLOT.sub(fill, self.subtitle)
+
+
+def render_drafts(template, variants, account=None):
+    """
+    Create one draft per dict of slot values in variants; returns the created drafts in order
+    (None where creation failed or, under the reject dedupe policy, the draft already exists).
+    Every variant is rendered before the first request, so bad values raise ValueError without
+    creating anything, and the reference draft is fetched once
+    """
+    user_id = account.user_id if account else None
+    with timed("render_drafts", "render", user_id):
+        rendered = [(template.render(values), template.render_title(values)) for values in variants]
+
+    reference_draft = find_reference_draft(account)
+    if reference_draft is None:
+        return [None] * len(rendered)
+
+    drafts = []
+    for body, (title, subtitle) in rendered:
+        try:
+            drafts.append(create_draft(title, subtitle, content_json=body, account=account, validate=False,
+                                       reference_draft=reference_draft))
+        except DuplicateDraft as e:
+            logger.warning("%s", e)
+            drafts.append(None)
+    logger.info("Created %d of %d template drafts", sum(1 for draft in drafts if draft), len(drafts))
+    return drafts
+
+
+# Templates registered by id (PUT /templates/{id}), kept in memory for the life of the process
+templates = {}
+_lock = threading.Lock()
+
+
+def put_template(template_id, markup, title, subtitle="", registry=None):
+    """Compile and store a template under template_id (replacing an existing one)"""
+    template = PostTemplate(markup, title, subtitle, registry)
+    with _lock:
+        templates[template_id] = template
+    return template
+
+
+def get_template(template_id):
+    """The template stored under template_id, or None"""
+    return templates.get(template_id)
@@ -0,0 +1,244 @@
+# profiling.py - Opt-in profiling of live API server requests (cProfile or a stack sampler)
+import cProfile
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+MODES = (CPROFILE, SAMPLING)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# X-Profile: sampling|cprofile profiles one request, but only with X-Profile-Token == PROFILE_TOKEN
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+
+MAX_REQUESTS = 100          # Upper bound for one arming
+MIN_INTERVAL = 0.001        # Fastest allowed sampling interval (seconds)
+DEFAULT_INTERVAL = 0.005
+MAX_BODY_PEEK = 64 * 1024   # Only bodies up to this size are searched for user_id
+RESULTS_KEPT = 50
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into folded (flamegraph) stacks"""
+
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        """Folded stack format ('root;child;leaf count'), readable by flamegraph.pl and speedscope"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileController:
+    """Decides which requests are profiled; armed via the admin endpoint or per request via header"""
+
+    def __init__(self, output_dir=PROFILE_DIR):
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.remaining = 0
+        self.user_id = None
+        self.mode = SAMPLING
+        self.interval = DEFAULT_INTERVAL
+        self.active = False
+        self.results = deque(maxlen=RESULTS_KEPT)
+
+    def arm(self, requests=1, user_id=None, mode=SAMPLING, interval=DEFAULT_INTERVAL):
+        """Profile the next `requests` requests (only those of user_id, if given)"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if not 1 <= requests <= MAX_REQUESTS:
+            raise ValueError(f"requests must be between 1 and {MAX_REQUESTS}")
+        with self.lock:
+            self.remaining = requests
+            self.user_id = user_id
+            self.mode = mode
+            self.interval = max(MIN_INTERVAL, interval)
+        return self.status()
+
+    def disarm(self):
+        with self.lock:
+            self.remaining = 0
+            self.user_id = None
+        return self.status()
+
+    def status(self):
+        with self.lock:
+            return {
+                'armed_requests': self.remaining,
+                'user_id': self.user_id,
+                'mode': self.mode,
+                'interval_ms': round(self.interval * 1000, 3),
+                'active': self.active,
+                'output_dir': os.path.abspath(self.output_dir),
+                'results': list(self.results)
+            }
+
+    def claim(self, user_id=None, header_mode=None):
+        """Mode to profile this request with, or None. Only one request is profiled at a time"""
+        with self.lock:
+            if self.active:
+                return None
+            if header_mode in MODES:
+                mode = header_mode
+            elif self.remaining > 0 and (self.user_id is None or self.user_id == user_id):
+                self.remaining -= 1
+                mode = self.mode
+            else:
+                return None
+            self.active = True
+            return mode
+
+    def release(self, result):
+        with self.lock:
+            self.active = False
+            if result:
+                self.results.append(result)
+
+    def output_path(self, method, path, extension):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        name = _UNSAFE.sub('_', f"{method}{path}").strip('_')[:80]
+        return os.path.join(self.output_dir, f"{stamp}-{time.time_ns() % 1_000_000:06d}-{name}.{extension}")
+
+
+controller = ProfileController()
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _query_user_id(scope):
+    values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('user_id')
+    return values[0] if values else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware running claimed requests under cProfile or the stack sampler
+    Idle cost is one attribute check per request; bodies are only read when a user_id is targeted
+    """
+
+    def __init__(self, app, profile_controller=None):
+        self.app = app
+        self.controller = profile_controller or controller
+
+    async def __call__(self, scope, receive, send):
+        ctl = self.controller
+        if scope['type'] != 'http' or (ctl.remaining == 0 and not PROFILE_TOKEN):
+            return await self.app(scope, receive, send)
+
+        header_mode = None
+        if PROFILE_TOKEN:
+            token = _header(scope, b'x-profile-token')
+            if token and hmac.compare_digest(token, PROFILE_TOKEN):
+                header_mode = _header(scope, b'x-profile')
+
+        user_id = None
+        if ctl.user_id is not None and header_mode is None:
+            user_id = _query_user_id(scope)
+            if user_id is None and scope['method'] in ('POST', 'PUT'):
+                user_id, receive = await self._peek_user_id(receive)
+
+        mode = ctl.claim(user_id, header_mode)
+        if mode is None:
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        result = {'mode': mode, 'method': scope['method'], 'path': scope['path'], 'user_id': user_id}
+        try:
+            if mode == CPROFILE:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    profiler.disable()
+                    result['file'] = ctl.output_path(scope['method'], scope['path'], 'prof')
+                    profiler.dump_stats(result['file'])
+            else:
+                sampler = StackSampler(threading.get_ident(), ctl.interval)
+                sampler.start()
+                try:
+                    await self.app(scope, receive, send)
+                finally:
+                    sampler.stop()
+                    result['file'] = ctl.output_path(scope['method'], scope['path'], 'folded')
+                    result['samples'] = sampler.samples
+                    sampler.write(result['file'])
+        except Exception:
+            result['error'] = True
+            raise
+        finally:
+            result['seconds'] = round(time.perf_counter() - started, 6)
+            ctl.release(result)
+            logger.info("Profiled %s %s (%s) -> %s", scope['method'], scope['path'], mode, result.get('file'))
+
+    async def _peek_user_id(self, receive):
+        """Read the request body to find "user_id", then hand the same messages to the app"""
+        messages = []
+        size = 0
+        while True:
+            message = await receive()
+            messages.append(message)
+            size += len(message.get('body', b''))
+            if not message.get('more_body') or size > MAX_BODY_PEEK:
+                break
+
+        user_id = None
+        if size <= MAX_BODY_PEEK:
+            try:
+                data = json.loads(b''.join(m.get('body', b'') for m in messages) or b'null')
+                if isinstance(data, dict) and data.get('user_id') is not None:
+                    user_id = str(data['user_id'])
+            except ValueError:
+                pass
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return user_id, replay
@@ -0,0 +1,60 @@
+# substack_session.py - Shared requests session setup for Substack accounts
+import os
+import requests
+from collections import namedtuple
+from metrics import instrument_session
+from tracing import trace_session
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Content-Type": "application/json"
+}
+
+# Substack cookie name -> environment variable holding its value
+COOKIE_ENV_KEYS = {
+    "sid": "SID",
+    "substack.lli": "SUBSTACK_LLI",
+    "substack.sid": "SUBSTACK_SID"
+}
+
+
+# One authenticated account: pass as `account=` to the draft/publish functions to target it
+# instead of the account configured in .env
+Account = namedtuple('Account', ['user_id', 'pub_url', 'session'])
+
+
+def cookie_map_from_env(env_vars=None):
+    """Get the Substack auth cookies from env_vars (defaults to os.environ)"""
+    if env_vars is None:
+        env_vars = os.environ
+    return {cookie: env_vars.get(key) for cookie, key in COOKIE_ENV_KEYS.items()}
+
+
+def build_session(env_vars=None):
+    """
+    Create an authenticated requests session for one Substack account
+    env_vars is a dict with PUBLICATION_URL and the cookie values (defaults to os.environ)
+    """
+    if env_vars is None:
+        env_vars = os.environ
+
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.headers["Referer"] = env_vars.get("PUBLICATION_URL")
+
+    for k, v in cookie_map_from_env(env_vars).items():
+        if v:
+            session.cookies.set(k, v, domain=".substack.com")
+
+    # Upstream timing/connection metrics for GET /metrics (off with METRICS=off)
+    instrument_session(session, env_vars.get("USER_ID"))
+    # One CLIENT span per request when tracing is on (TRACE_FILE / OTEL_EXPORTER_OTLP_ENDPOINT)
+    trace_session(session, env_vars.get("USER_ID"))
+
+    # SUBSTACK_CASSETTE=file records (or replays) every upstream exchange, see cassette.py
+    cassette_path = os.getenv("SUBSTACK_CASSETTE")
+    if cassette_path:
+        from cassette import use_cassette
+        use_cassette(session, cassette_path, os.getenv("SUBSTACK_CASSETTE_MODE", "replay"))
+
+    return session
@@ -0,0 +1,48 @@
+# document_schema.py - Check the built-in draft documents against docs/content_types_reference.json
+# Run from the repository root: python test/document_schema.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_schema import load_schema, validate_document
+from draft_create import comprehensive_test_document, rich_document, parse_markup
+from markdown_parser import parse_markdown
+
+SAMPLE_MARKUP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sampleinput", "2.txt")
+
+
+def link_document(attrs):
+    return {"type": "doc", "content": [{"type": "paragraph", "content": [
+        {"type": "text", "text": "a link", "marks": [{"type": "link", "attrs": attrs}]}]}]}
+
+
+def main():
+    schema = load_schema()
+    with open(SAMPLE_MARKUP, encoding='utf-8') as f:
+        sample = f.read()
+
+    documents = {
+        'create_rich_draft': rich_document(),
+        'create_comprehensive_test_draft': comprehensive_test_document(),
+        'sampleinput/2.txt': parse_markup(sample),
+        'markdown': parse_markdown("# Title\n\nSome **bold** text and [a link](https://substack.com).\n"),
+        'link with only href': link_document({"href": "https://substack.com"})
+    }
+    failed = False
+    for name, document in documents.items():
+        errors = validate_document(document, schema)
+        print(f"{name}: {'ok' if not errors else '; '.join(errors)}")
+        failed = failed or bool(errors)
+
+    # href is still required
+    errors = validate_document(link_document({"target": "_blank"}), schema)
+    print(f"link without href: {errors}")
+    assert errors == ["doc.content[0].content[0].marks[0]: link is missing attr 'href'"], errors
+
+    assert not failed
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
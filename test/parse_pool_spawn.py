@@ -0,0 +1,56 @@
+# parse_pool_spawn.py - Check that parse workers started with spawn know the registered block types
+# Run from the repository root: python test/parse_pool_spawn.py
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from block_registry import register_block
+from content_nodes import Paragraph, Text
+from parse_pool import ParsePool
+
+
+def shout_block(content, state):
+    """Paragraph in capitals"""
+    return Paragraph([Text(content.upper())])
+
+
+async def compile_with(pool, markup):
+    try:
+        document, blocks, errors = await pool.compile(markup)
+    finally:
+        pool.shutdown()
+    # Workers send back JSON text, a thread the node tree
+    in_worker = isinstance(document, str)
+    if not in_worker:
+        document = document.dumps()
+    return json.loads(document), blocks, errors, in_worker
+
+
+def main():
+    markup = "Title:: Spawned | Shout:: hello | Text:: done"
+
+    # A custom block registered before the pool starts has to reach the spawned workers
+    register_block("shout", shout_block)
+    pool = ParsePool(threshold=1, workers=1, start_method="spawn")
+    document, blocks, errors, in_worker = asyncio.run(compile_with(pool, markup))
+    print(f"spawn: {blocks} blocks, errors: {errors}")
+    assert pool.context.get_start_method() == "spawn" and in_worker
+    assert blocks == 3 and not errors
+    assert document['content'][1]['content'][0]['text'] == "HELLO", document
+
+    # Handlers that cannot be pickled are parsed in a thread instead of failing
+    register_block("whisper", lambda content, state: Paragraph([Text(content.lower())]))
+    pool = ParsePool(threshold=1, workers=1, start_method="spawn")
+    document, blocks, errors, in_worker = asyncio.run(compile_with(pool, "Whisper:: QUIET | Shout:: loud"))
+    print(f"spawn with a lambda handler: {blocks} blocks, errors: {errors}")
+    assert not in_worker
+    assert [block['content'][0]['text'] for block in document['content']] == ["quiet", "LOUD"], document
+
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
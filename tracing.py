@@ -0,0 +1,229 @@
+# tracing.py - Lightweight spans with OpenTelemetry (OTLP/JSON) export to a file or collector
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from metrics import endpoint_label
+
+logger = logging.getLogger(__name__)
+
+# Span kinds and status codes as defined by OTLP
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "substack-api")
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 1.0
+
+_current = contextvars.ContextVar("current_span", default=None)
+_exporter = None
+
+
+class Span:
+    """One timed operation; ended spans are handed to the exporter"""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "status_message")
+
+    def __init__(self, name, kind, parent, attributes):
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = STATUS_OK
+        self.status_message = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": self.status}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Exporter:
+    """
+    Batches ended spans on a background thread and writes them as OTLP/JSON
+    to a file (one ExportTraceServiceRequest per line) and/or POSTs them to <endpoint>/v1/traces
+    """
+
+    def __init__(self, file=None, endpoint=None):
+        self.file = file
+        self.endpoint = endpoint.rstrip('/') + "/v1/traces" if endpoint else None
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self.thread.start()
+
+    def submit(self, span):
+        self.queue.put(span)
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            stop = False
+            while len(batch) < BATCH_SIZE:
+                try:
+                    span = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                    break
+                batch.append(span)
+            if batch:
+                self._export(batch)
+            if stop:
+                return
+
+    def _export(self, batch):
+        payload = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "substack-api"}, "spans": [span.to_otlp() for span in batch]}]
+        }]}, separators=(',', ':'))
+
+        try:
+            if self.file:
+                with open(self.file, 'a', encoding='utf-8') as f:
+                    f.write(payload + '\n')
+            if self.endpoint:
+                request = urllib.request.Request(self.endpoint, data=payload.encode('utf-8'),
+                                                 headers={"Content-Type": "application/json"})
+                urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            logger.warning("Trace export failed: %s", e)
+
+    def shutdown(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+
+def configure(file=None, endpoint=None):
+    """Start exporting spans (replaces any previous exporter); with neither target tracing is off"""
+    global _exporter
+    shutdown()
+    if file or endpoint:
+        _exporter = Exporter(file, endpoint)
+
+
+def shutdown():
+    """Flush and stop the exporter"""
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+
+def enabled():
+    return _exporter is not None
+
+
+atexit.register(shutdown)
+
+# TRACE_FILE=traces.jsonl and/or OTEL_EXPORTER_OTLP_ENDPOINT=http://localhost:4318
+configure(os.getenv("TRACE_FILE"), os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"))
+
+
+@contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """
+    Time the with-block as a child of the current span (yields the Span, or None when tracing is off)
+        with span("parse_markup", blocks=12):
+    """
+    exporter = _exporter
+    if exporter is None:
+        yield None
+        return
+
+    current = Span(name, kind, _current.get(), attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        current.end_ns = time.time_ns()
+        exporter.submit(current)
+
+
+def traced(name=None):
+    """Decorator: run the function inside a span (named after the function by default)"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_session(session, account=None):
+    """Give every request sent through session its own CLIENT span"""
+    send = session.send
+
+    @functools.wraps(send)
+    def traced_send(request, **kwargs):
+        if _exporter is None:
+            return send(request, **kwargs)
+        url = urlsplit(request.url)
+        # Named by endpoint (ids replaced by {id}) so span names stay low-cardinality; url.full has the rest
+        with span(f"{request.method} {endpoint_label(request.url)}", CLIENT, **{
+            "http.request.method": request.method,
+            "url.full": request.url,
+            "server.address": url.hostname,
+            "substack.account": account
+        }) as current:
+            response = send(request, **kwargs)
+            current.set_attribute("http.response.status_code", response.status_code)
+            if response.status_code >= 400:
+                current.set_error(f"HTTP {response.status_code}")
+            return response
+
+    session.send = traced_send
+    return session